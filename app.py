@@ -1,18 +1,63 @@
-from flask import Flask, render_template, jsonify, send_file, Response, request
+from flask import (
+    Flask,
+    render_template,
+    jsonify,
+    send_file,
+    Response,
+    request,
+    make_response,
+)
 from flask_cors import CORS
+from werkzeug.security import safe_join
 import redis
 import os
 import jinja2
 import html
 import json
+import hashlib
+from functools import wraps
+from urllib.parse import quote
 from pathlib import Path
-from threading import Lock
-import cv2
-from PIL import Image
-import time
-from dateutil import parser
+from threading import local
 import logging
-from services.video_downloader import VideoDownloader
+from services.thumbnail_worker import THUMBNAIL_QUEUE, enqueue_thumbnail
+from services.thumbnails import video_path_for_thumbnail
+from services.dates import published_timestamp, stored_published_timestamp
+from services.redis_helpers import (
+    CATALOG_VERSION,
+    TAG_COUNTS,
+    TAGS_LEX,
+    USERNAMES_LEX,
+    add_to_date_index,
+    add_usernames,
+    complete_prefix,
+    decode_cursor,
+    filter_video_ids,
+    index_video_key,
+    metadata_key,
+    parse_metadata_key,
+    parse_tags,
+    rank_by_count,
+    rank_by_score,
+    record_metadata_change,
+    remove_from_date_index,
+    remove_username,
+    resolve_metadata_key,
+    set_video_deleted,
+    update_tag_index,
+    user_videos_key,
+)
+from services.search_index import index_video, search_video_ids
+from services.worker_loop import held_raw_jobs, pickup_stats
+from services.query_cache import cached_query, query_cache_stats
+from services.video_cards import (
+    cards_response_body,
+    fetch_cards,
+    is_visible,
+    render_cards,
+    store_card,
+)
+from services import sqlite_replica
 
 # Setup logging
 logging.basicConfig(
@@ -24,13 +69,85 @@ logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 CORS(app)
-thumbnail_lock = Lock()
+
+# Videos and thumbnails are served from here
+DOWNLOADS_DIR = Path("downloads")
+
+# How media bytes are sent: by Flask itself (default), by nginx via
+# X-Accel-Redirect ("x-accel") or by Apache/lighttpd via X-Sendfile
+# ("x-sendfile"). X_ACCEL_PREFIX is the internal nginx location aliased to
+# the downloads directory.
+SENDFILE_MODE = os.getenv("SENDFILE_MODE", "")
+X_ACCEL_PREFIX = os.getenv("X_ACCEL_PREFIX", "/protected/downloads/")
+app.config["USE_X_SENDFILE"] = SENDFILE_MODE == "x-sendfile"
+
+# Thumbnail URLs never change content, videos rarely do
+THUMBNAIL_CACHE_CONTROL = "public, max-age=31536000, immutable"
+VIDEO_CACHE_CONTROL = "public, max-age=86400"
+
+# Served with 202 while a missing thumbnail is being generated. Its 9x16
+# intrinsic size is one no real thumbnail has, which is how thumbnails.js tells
+# it apart from a finished image
+THUMBNAIL_PLACEHOLDER = (
+    '<svg xmlns="http://www.w3.org/2000/svg" width="9" height="16">'
+    '<rect width="100%" height="100%" fill="#222"/></svg>'
+)
 
 # Redis connection
 redis_client = redis.Redis(
     host=os.getenv("REDIS_HOST", "localhost"), port=6379, db=0, decode_responses=True
 )
 
+# Serve browse, search and tag queries from Redis (default) or from the SQLite
+# read replica kept up to date by services/sqlite_replica.py
+QUERY_BACKEND = os.getenv("QUERY_BACKEND", "redis")
+replica_connections = local()
+
+
+def get_replica():
+    """Return this thread's connection to the SQLite read replica."""
+    if not hasattr(replica_connections, "conn"):
+        replica_connections.conn = sqlite_replica.connect()
+    return replica_connections.conn
+
+
+def catalog_etag(replica_backed=False):
+    """Give a JSON GET view strong ETags derived from the catalog version.
+
+    The ETag combines the version with the request path and arguments, so a
+    matching If-None-Match is answered with 304 before the view runs. Views
+    that read the SQLite replica are versioned by the last change it applied
+    when that backend is active, since it can lag behind Redis.
+    """
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if replica_backed and QUERY_BACKEND == "sqlite":
+                last_change = sqlite_replica.get_state(get_replica(), "last_change_id")
+                version = f"replica-{last_change or 0}"
+            else:
+                version = redis_client.get(CATALOG_VERSION) or "0"
+
+            query = json.dumps([request.path, sorted(request.args.items(multi=True))])
+            etag = f"{version}-{hashlib.sha1(query.encode()).hexdigest()[:16]}"
+
+            if request.if_none_match.contains(etag):
+                response = Response(status=304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+
+            # Clients may keep the body but must revalidate before using it
+            response.set_etag(etag)
+            response.headers["Cache-Control"] = "no-cache"
+            return response
+
+        return wrapper
+
+    return decorator
+
 
 # Create a function to read JS files
 def read_js_file(filename):
@@ -49,109 +166,91 @@ app.jinja_env.globals["include_file"] = read_js_file
 app.jinja_env.filters["js_escape"] = lambda x: jinja2.Markup(x)
 
 
-def get_thumbnail_path(video_path):
-    """Get the thumbnail path for a video without generating it."""
-    return video_path.parent / f"{video_path.stem}_thumb.jpg"
+def send_media(relative_path, mimetype, cache_control):
+    """Send a file from the downloads directory with caching headers.
 
+    Flask answers Range requests with 206 and conditional requests with 304
+    from the file's mtime and size. In x-accel mode only the headers are
+    sent and nginx serves the bytes.
+    """
+    full_path = safe_join(str(DOWNLOADS_DIR), relative_path)
+    if full_path is None or not os.path.isfile(full_path):
+        return Response(status=404)
 
-def generate_thumbnail(video_path):
-    """Generate a thumbnail from a video file."""
-    thumbnail_path = get_thumbnail_path(video_path)
-
-    with thumbnail_lock:
-        # Check again with lock in case another request just generated it
-        if thumbnail_path.exists():
-            return True
+    if SENDFILE_MODE == "x-accel":
+        response = Response(mimetype=mimetype)
+        response.headers["X-Accel-Redirect"] = X_ACCEL_PREFIX + quote(relative_path)
+    else:
+        response = send_file(
+            os.path.abspath(full_path), mimetype=mimetype, conditional=True
+        )
 
-        try:
-            video = cv2.VideoCapture(str(video_path))
-            success, frame = video.read()
-            if success:
-                frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                pil_image = Image.fromarray(frame_rgb)
-
-                # Set fixed dimensions for TikTok aspect ratio
-                width = 320
-                height = 568
-
-                # Resize image maintaining aspect ratio and adding black bars
-                original_ratio = pil_image.size[0] / pil_image.size[1]
-                target_ratio = width / height
-
-                if original_ratio > target_ratio:
-                    new_width = width
-                    new_height = int(width / original_ratio)
-                    resize_size = (new_width, new_height)
-                    position = (0, (height - new_height) // 2)
-                else:
-                    new_height = height
-                    new_width = int(height * original_ratio)
-                    resize_size = (new_width, new_height)
-                    position = ((width - new_width) // 2, 0)
-
-                background = Image.new("RGB", (width, height), (0, 0, 0))
-                pil_image = pil_image.resize(resize_size, Image.Resampling.LANCZOS)
-                background.paste(pil_image, position)
-                background.save(thumbnail_path, "JPEG", quality=85)
-                return True
-        except Exception as e:
-            print(f"Error generating thumbnail for {video_path}: {str(e)}")
-            return False
-        finally:
-            if "video" in locals():
-                video.release()
+    response.headers["Cache-Control"] = cache_control
+    return response
 
 
 @app.route("/thumbnail/<path:thumbnail_path>")
 def serve_thumbnail(thumbnail_path):
-    """Serve thumbnail files, generating if needed."""
-    full_thumb_path = Path("downloads") / thumbnail_path
-    video_path = (
-        full_thumb_path.parent / f"{full_thumb_path.stem[:-6]}.mp4"
-    )  # Remove _thumb from stem
+    """Serve thumbnail files, queueing generation when one is missing."""
+    full_thumb_path = safe_join(str(DOWNLOADS_DIR), thumbnail_path)
+    if full_thumb_path is None:
+        return Response(status=404)
 
-    if not full_thumb_path.exists() and video_path.exists():
-        try:
-            # Create VideoDownloader instance to use its thumbnail generation
-            downloader = VideoDownloader()
-            relative_thumb_path = downloader.generate_thumbnail(video_path)
-
-            if relative_thumb_path:
-                # Get username and video_id from path
-                parts = thumbnail_path.split("/")
-                if len(parts) >= 2:
-                    username = parts[0].replace("_videos", "")
-                    video_id = parts[1].split("_thumb")[0]
-
-                    # Update paths in Redis
-                    downloader.update_video_paths(
-                        username,
-                        video_id,
-                        str(video_path.relative_to(downloader.downloads_dir)),
-                        relative_thumb_path,
-                    )
-                    logger.info(f"Generated missing thumbnail for {video_id}")
-                else:
-                    logger.error(f"Invalid path format: {thumbnail_path}")
-                    return Response(status=404)
-            else:
-                logger.error(f"Failed to generate thumbnail for {video_path}")
-                return Response(status=404)
+    full_thumb_path = Path(full_thumb_path)
+    if full_thumb_path.exists():
+        mimetype = "image/webp" if full_thumb_path.suffix == ".webp" else "image/jpeg"
+        return send_media(thumbnail_path, mimetype, THUMBNAIL_CACHE_CONTROL)
 
-        except Exception as e:
-            logger.error(f"Error generating thumbnail: {e}")
-            return Response(status=404)
+    video_path = video_path_for_thumbnail(full_thumb_path)
+    parts = thumbnail_path.split("/")
+    if video_path is None or not video_path.exists() or len(parts) < 2:
+        return Response(status=404)
 
-    if full_thumb_path.exists():
-        return send_file(full_thumb_path, mimetype="image/jpeg")
-    else:
+    # The thumbnail worker renders it; answer at once with a placeholder
+    username = parts[0].replace("_videos", "")
+    video_id = video_path.stem
+    if enqueue_thumbnail(
+        redis_client, username, video_id, str(video_path.relative_to(DOWNLOADS_DIR))
+    ):
+        logger.info(f"Queued missing thumbnail for {video_id}")
+
+    return Response(
+        THUMBNAIL_PLACEHOLDER,
+        status=202,
+        mimetype="image/svg+xml",
+        headers={"Cache-Control": "no-store", "Retry-After": "2"},
+    )
+
+
+@app.route("/preview/<path:preview_path>")
+def serve_preview(preview_path):
+    """Serve hover-scrub sprite sheets and animated preview loops."""
+    full_preview_path = safe_join(str(DOWNLOADS_DIR), preview_path)
+    if full_preview_path is None or not full_preview_path.endswith(
+        ("_sprite.webp", "_preview.webp")
+    ):
         return Response(status=404)
 
+    if not os.path.isfile(full_preview_path):
+        # Queue the video's images again if the file went missing
+        video_path = Path(full_preview_path.rsplit("_", 1)[0] + ".mp4")
+        parts = preview_path.split("/")
+        if video_path.exists() and len(parts) >= 2:
+            enqueue_thumbnail(
+                redis_client,
+                parts[0].replace("_videos", ""),
+                video_path.stem,
+                str(video_path.relative_to(DOWNLOADS_DIR)),
+            )
+        return Response(status=404)
+
+    return send_media(preview_path, "image/webp", THUMBNAIL_CACHE_CONTROL)
+
 
 @app.route("/video/<path:video_path>")
 def serve_video(video_path):
     """Serve video files from the downloads directory."""
-    return send_file(Path("downloads") / video_path, mimetype="video/mp4")
+    return send_media(video_path, "video/mp4", VIDEO_CACHE_CONTROL)
 
 
 @app.route("/check_thumbnail/<path:thumbnail_path>")
@@ -211,8 +310,8 @@ def queue():
             "redis_connected": redis_status,
             "services": {
                 "url_discovery": bool(redis_client.get("url_discovery_running")),
-                "metadata": len(redis_client.smembers("metadata_processing")),
-                "downloader": len(redis_client.smembers("download_processing")),
+                "metadata": len(held_raw_jobs(redis_client, "tiktok_video_queue")),
+                "downloader": len(held_raw_jobs(redis_client, "video_download_queue")),
             },
             "queues": {
                 "videos_to_process": redis_client.llen("tiktok_video_queue"),
@@ -281,6 +380,15 @@ def debug():
                 if redis_client.exists("all_usernames")
                 else 0
             ),
+            "query_cache": query_cache_stats(redis_client),
+            "queue_pickup": {
+                queue: pickup_stats(redis_client, queue)
+                for queue in (
+                    "tiktok_video_queue",
+                    "video_download_queue",
+                    THUMBNAIL_QUEUE,
+                )
+            },
         }
 
         # Try to get one sample video if it exists
@@ -297,7 +405,20 @@ def debug():
         return jsonify({"error": str(e)})
 
 
+@app.route("/api/cache/stats")
+def cache_stats():
+    """Hit/miss counters of the /api/videos query cache"""
+    return jsonify(query_cache_stats(redis_client))
+
+
+def request_cursor():
+    """Decode the optional cursor argument; raises ValueError if malformed."""
+    cursor = request.args.get("cursor")
+    return decode_cursor(cursor) if cursor else None
+
+
 @app.route("/api/videos")
+@catalog_etag(replica_backed=True)
 def get_videos():
     try:
         page = int(request.args.get("page", 0))
@@ -310,171 +431,74 @@ def get_videos():
             f"Getting videos - page: {page}, filters: {filters}, type: {filter_type}"
         )
 
-        # Fast path for no filters - use sorted set
-        if not filters:
-            start_idx = page * per_page
-            end_idx = start_idx + per_page
-
-            # Get total count first
-            total_videos = redis_client.zcard("videos_by_date")
-
-            # Get video IDs for this page
-            if sort_order == "desc":
-                video_ids = redis_client.zrevrange(
-                    "videos_by_date", start_idx, end_idx - 1
-                )
-            else:
-                video_ids = redis_client.zrange(
-                    "videos_by_date", start_idx, end_idx - 1
-                )
-
-            # Fetch video data for the page
-            videos = []
-            for video_id in video_ids:
-                try:
-                    # Find the metadata key for this video_id
-                    matching_keys = redis_client.keys(f"metadata:*:{video_id}")
-                    if not matching_keys:
-                        continue
-
-                    video_key = matching_keys[0]  # Use the first matching key
-                    video_data = redis_client.hgetall(video_key)
-
-                    if (
-                        video_data
-                        and video_data.get("deleted") != "True"
-                        and video_data.get("file_missing") != "True"
-                    ):
-
-                        try:
-                            tags = json.loads(video_data.get("tags", "[]"))
-                        except json.JSONDecodeError:
-                            tags = []
-
-                        username = video_data.get("username", "")
-                        video = {
-                            "video_id": video_data["video_id"],
-                            "video_path": f"{username}_videos/{video_data['video_id']}.mp4",
-                            "thumbnail_path": f"{username}_videos/{video_data['video_id']}_thumb.jpg",
-                            "description": video_data.get("description", ""),
-                            "username": username,
-                            "tags": tags,
-                            "has_thumbnail": True,
-                            "author": video_data.get("author", ""),
-                            "music": video_data.get("music", ""),
-                            "date": (
-                                video_data.get("date", "").split("·")[1]
-                                if "·" in video_data.get("date", "")
-                                else video_data.get("date", "")
-                            ),
-                            "url": video_data.get("url", ""),
-                        }
-                        videos.append(video)
-                except Exception as e:
-                    logger.error(f"Error processing video {video_id}: {e}")
-                    continue
-
-            return jsonify(
-                {
-                    "videos": videos,
-                    "total": total_videos,
-                    "has_more": (end_idx) < total_videos,
-                }
-            )
+        # Keyset pagination: a cursor from next_cursor takes precedence over page
+        try:
+            cursor = request_cursor()
+        except ValueError:
+            return jsonify({"error": "Invalid cursor"}), 400
 
-        # Filter logic
         # Extract username filter if present
         username_filter = next((f[1:] for f in filters if f.startswith("@")), None)
         tag_filters = [f for f in filters if not f.startswith("@")]
-
-        # Get video keys based on username if present
-        if username_filter:
-            video_keys = redis_client.keys(f"metadata:{username_filter}:*")
-        else:
-            # If no username filter, get all video keys
-            video_keys = redis_client.keys("metadata:*:*")
-
-        # Get all matching videos with their dates
-        video_data_with_dates = []
-        for key in video_keys:
-            video_data = redis_client.hgetall(key)
-            if (
-                video_data
-                and video_data.get("deleted") != "True"
-                and video_data.get("file_missing") != "True"
-            ):
-                try:
-                    # Check if video matches tag filters
-                    video_tags = set(json.loads(video_data.get("tags", "[]")))
-                    tag_filters_set = set(tag_filters)
-
-                    # Apply tag filters based on filter type
-                    if tag_filters:
-                        if filter_type == "and":
-                            if not tag_filters_set.issubset(video_tags):
-                                continue
-                        elif filter_type == "or":
-                            if not tag_filters_set.intersection(video_tags):
-                                continue
-                        elif filter_type == "not":
-                            if tag_filters_set.intersection(video_tags):
-                                continue
-
-                    # If video passes filters, add it to results
-                    if video_data.get("date"):
-                        timestamp = parse_date_string(video_data["date"])
-                    else:
-                        timestamp = time.time()
-                    video_data_with_dates.append((key, timestamp, video_data))
-                except Exception as e:
-                    logger.error(f"Error processing date for {key}: {e}")
-                    continue
-
-        # Sort all videos by date
-        video_data_with_dates.sort(key=lambda x: x[1], reverse=(sort_order == "desc"))
-
-        # Get total count of valid videos
-        total_videos = len(video_data_with_dates)
-
-        # Then paginate the sorted results
         start_idx = page * per_page
-        end_idx = start_idx + per_page
-        page_data = video_data_with_dates[start_idx:end_idx]
 
-        # Format videos for response
-        videos = []
-        for _, _, video_data in page_data:
-            try:
-                tags = json.loads(video_data.get("tags", "[]"))
-            except json.JSONDecodeError:
-                tags = []
-
-            username = video_data.get("username", "")
-            video = {
-                "video_id": video_data["video_id"],
-                "video_path": f"{username}_videos/{video_data['video_id']}.mp4",
-                "thumbnail_path": f"{username}_videos/{video_data['video_id']}_thumb.jpg",
-                "description": video_data.get("description", ""),
-                "username": username,
-                "tags": tags,
-                "has_thumbnail": True,
-                "author": video_data.get("author", ""),
-                "music": video_data.get("music", ""),
-                "date": (
-                    video_data.get("date", "").split("·")[1]
-                    if "·" in video_data.get("date", "")
-                    else video_data.get("date", "")
-                ),
-                "url": video_data.get("url", ""),
-            }
-            videos.append(video)
+        if QUERY_BACKEND == "sqlite":
+            total_videos, page_data, next_cursor = sqlite_replica.query_videos(
+                get_replica(),
+                tag_filters,
+                filter_type=filter_type,
+                username=username_filter,
+                start=start_idx,
+                limit=per_page,
+                descending=(sort_order == "desc"),
+                cursor=cursor,
+            )
+            cards = render_cards(page_data)
+        else:
+            # Combine the tag sets, the user's videos and videos_by_date in
+            # Redis; without filters the date-sorted set is paged directly.
+            # The resulting ID page is cached until the catalog next changes.
+            def compute():
+                total, ids, next_page = filter_video_ids(
+                    redis_client,
+                    tag_filters,
+                    filter_type=filter_type,
+                    username=username_filter,
+                    start=start_idx,
+                    count=per_page,
+                    descending=(sort_order == "desc"),
+                    cursor=cursor,
+                )
+                return {"total": total, "ids": ids, "next_cursor": next_page}
 
-        return jsonify(
-            {
-                "videos": videos,
-                "total": total_videos,
-                "has_more": end_idx < total_videos,
-            }
+            result = cached_query(
+                redis_client,
+                {
+                    "tags": sorted(set(tag_filters)),
+                    "username": username_filter,
+                    "filter_type": filter_type if tag_filters else None,
+                    "descending": sort_order == "desc",
+                    "cursor": request.args.get("cursor") if cursor else None,
+                    "start": None if cursor else start_idx,
+                    "per_page": per_page,
+                },
+                compute,
+            )
+            total_videos = result["total"]
+            video_ids = result["ids"]
+            next_cursor = result["next_cursor"]
+
+            # Read the page's pre-rendered cards in one round trip
+            cards = fetch_cards(redis_client, video_ids)
+
+        return Response(
+            cards_response_body(
+                cards,
+                total=total_videos,
+                has_more=next_cursor is not None,
+                next_cursor=next_cursor,
+            ),
+            mimetype="application/json",
         )
 
     except Exception as e:
@@ -483,44 +507,33 @@ def get_videos():
 
 
 @app.route("/api/tags/search")
+@catalog_etag()
 def search_tags():
     try:
         query = request.args.get("q", "").lower()
         logger.info(f"Tag search query: {query}")
 
-        # Get all tags and usernames
-        all_tags = list(redis_client.smembers("all_tags"))
-        all_usernames = list(redis_client.smembers("all_usernames"))
-
-        logger.info(f"Found {len(all_usernames)} usernames: {all_usernames}")
-        logger.info(
-            f"Found {len(all_tags)} tags: {all_tags[:5]}..."
-        )  # Just show first 5 tags
-
         # Handle username search (with or without @ symbol)
         clean_query = query.lstrip("@")  # Remove @ if present
-        logger.info(f"Clean query: {clean_query}")
 
-        # Filter and format usernames (add @ symbol)
+        # Complete usernames (add @ symbol) when searching with @ or empty query,
+        # ranked by how many videos each user has
         matching_usernames = []
-        if (
-            query.startswith("@") or not query
-        ):  # Show usernames if searching with @ or empty query
+        if query.startswith("@") or not query:
+            usernames = complete_prefix(redis_client, USERNAMES_LEX, clean_query)
             matching_usernames = [
                 f"@{username}"
-                for username in all_usernames
-                if clean_query in username.lower()
+                for username in rank_by_count(redis_client, usernames, user_videos_key)
             ]
-        logger.info(f"Matching usernames: {matching_usernames}")
 
-        # Filter tags (only if query doesn't start with @)
+        # Complete tags (only if query doesn't start with @), most used first
         matching_tags = []
         if not query.startswith("@"):
-            matching_tags = [tag for tag in all_tags if query in tag.lower()]
-        logger.info(f"Matching tags: {len(matching_tags)} tags")
+            tags = complete_prefix(redis_client, TAGS_LEX, query)
+            matching_tags = rank_by_score(redis_client, tags, TAG_COUNTS)
 
-        # Combine and sort results (usernames first, then tags)
-        results = sorted(matching_usernames) + sorted(matching_tags)
+        # Usernames first, then tags
+        results = matching_usernames + matching_tags
 
         return jsonify({"tags": results[:50]})  # Return top 50 matching items
     except Exception as e:
@@ -528,38 +541,6 @@ def search_tags():
         return jsonify({"error": str(e)}), 500
 
 
-def parse_date_string(date_str: str) -> float:
-    """Extract timestamp from date string like 'The Cheese Knees·2022-12-13' or 'username·2d ago'"""
-    try:
-        # Split by '·' and take the last part which should be the date/time
-        date_part = date_str.split("·")[-1].strip()
-
-        # Handle relative time formats
-        if "ago" in date_part:
-            # Extract number and unit
-            parts = date_part.split()
-            if len(parts) >= 2:
-                number = int("".join(filter(str.isdigit, parts[0])))
-                unit = parts[0][-1]  # Get last character of first part (d, h, m)
-
-                # Calculate seconds based on unit
-                seconds = {
-                    "d": 86400,  # days to seconds
-                    "h": 3600,  # hours to seconds
-                    "m": 60,  # minutes to seconds
-                }
-
-                if unit in seconds:
-                    return time.time() - (number * seconds[unit])
-
-        # Try parsing as absolute date
-        return parser.parse(date_part).timestamp()
-
-    except Exception as e:
-        logger.error(f"Error parsing date string '{date_str}': {e}")
-        return time.time()  # Return current time as fallback
-
-
 def store_video_metadata(video_data):
     """Store video metadata in Redis."""
     try:
@@ -568,22 +549,42 @@ def store_video_metadata(video_data):
 
         if username and video_id:
             # Store the metadata
-            redis_key = f"metadata:{username}:{video_id}"
-            redis_client.hmset(redis_key, video_data)
+            redis_key = metadata_key(username, video_id)
+            old_tags = parse_tags(redis_client.hget(redis_key, "tags"))
 
-            # Add to videos_by_date sorted set
+            # Store the publish time once so reads never re-parse the date
             if video_data.get("date"):
-                timestamp = parse_date_string(video_data["date"])
-                redis_client.zadd("videos_by_date", {video_id: timestamp})
+                video_data["published_ts"] = published_timestamp(video_data)
+
+            redis_client.hmset(redis_key, video_data)
+            index_video_key(redis_client, username, video_id)
+            redis_client.sadd(user_videos_key(username), video_id)
 
             # Store username in all_usernames set
-            redis_client.sadd("all_usernames", username)
+            add_usernames(redis_client, [username])
+
+            # Store tags in the tag sets and all_tags
+            if "tags" in video_data:
+                update_tag_index(
+                    redis_client, video_id, old_tags, parse_tags(video_data["tags"])
+                )
 
-            # Store tags in all_tags set
-            if video_data.get("tags"):
-                tags = json.loads(video_data["tags"])
-                if tags:
-                    redis_client.sadd("all_tags", *tags)
+            # Index the searchable text, tell the replica about the change and
+            # render the video's card
+            video_data = redis_client.hgetall(redis_key)
+            index_video(redis_client, video_id, video_data)
+            record_metadata_change(redis_client, video_id)
+            store_card(redis_client, video_data)
+
+            # Add to the global and per-user date-sorted sets, unless the
+            # stored record is deleted or missing its file
+            if video_data.get("date") and is_visible(video_data):
+                add_to_date_index(
+                    redis_client,
+                    username,
+                    video_id,
+                    stored_published_timestamp(video_data),
+                )
 
             return True
     except Exception as e:
@@ -599,24 +600,62 @@ def update_metadata(video_id):
             return jsonify({"error": "No data provided"}), 400
 
         # Find the metadata key for this video_id
-        matching_keys = redis_client.keys(f"metadata:*:{video_id}")
-        if not matching_keys:
+        video_key = resolve_metadata_key(redis_client, video_id)
+        if not video_key:
             return jsonify({"error": "Video not found"}), 404
 
-        metadata_key = matching_keys[0]
+        old_tags = parse_tags(redis_client.hget(video_key, "tags"))
+
+        # Recompute the stored publish time when the date changes. The scraped
+        # create_time would win over the edited date, here and whenever
+        # published_ts is recomputed, so an edit without one drops it
+        if "date" in data:
+            video_data = redis_client.hgetall(video_key)
+            video_data.update(data)
+            if "create_time" not in data:
+                video_data.pop("create_time", None)
+                redis_client.hdel(video_key, "create_time")
+            data["published_ts"] = published_timestamp(video_data)
 
         # Update metadata
-        redis_client.hmset(metadata_key, data)
+        redis_client.hmset(video_key, data)
+        video_data = redis_client.hgetall(video_key)
+        username, _ = parse_metadata_key(video_key)
 
         # Add username to all_usernames set if present
         if "username" in data:
-            redis_client.sadd("all_usernames", data["username"])
+            add_usernames(redis_client, [data["username"]])
 
-        # Update tags in all_tags set if present
+        # Update the tag sets, tag counts and all_tags if present
         if "tags" in data:
-            tags = json.loads(data["tags"])
-            if tags:
-                redis_client.sadd("all_tags", *tags)
+            update_tag_index(redis_client, video_id, old_tags, parse_tags(data["tags"]))
+
+        # Deleting or restoring a video takes its tags out of or back into
+        # tag_counts
+        if "deleted" in data:
+            set_video_deleted(
+                redis_client,
+                video_id,
+                parse_tags(video_data.get("tags")),
+                deleted=video_data.get("deleted") == "True",
+            )
+
+        # Keep the date-sorted sets in line with the new date and flags
+        if {"published_ts", "deleted", "file_missing"} & data.keys():
+            if is_visible(video_data):
+                add_to_date_index(
+                    redis_client,
+                    username,
+                    video_id,
+                    stored_published_timestamp(video_data),
+                )
+            else:
+                remove_from_date_index(redis_client, username, video_id)
+
+        # Reindex the searchable text and re-render the card from the updated hash
+        index_video(redis_client, video_id, video_data)
+        record_metadata_change(redis_client, video_id)
+        store_card(redis_client, video_data)
 
         return jsonify({"success": True})
     except Exception as e:
@@ -658,8 +697,8 @@ def batch_delete_videos():
         for video_id in videos_to_delete:
             try:
                 # Find the metadata key for this video_id
-                matching_keys = redis_client.keys(f"metadata:*:{video_id}")
-                if not matching_keys:
+                video_key = resolve_metadata_key(redis_client, video_id)
+                if not video_key:
                     results.append(
                         {
                             "video_id": video_id,
@@ -669,13 +708,18 @@ def batch_delete_videos():
                     )
                     continue
 
-                metadata_key = matching_keys[0]
-
-                # Mark as deleted in Redis
-                redis_client.hset(metadata_key, "deleted", "True")
+                # Mark as deleted in Redis and drop its tags from tag_counts
+                redis_client.hset(video_key, "deleted", "True")
+                set_video_deleted(
+                    redis_client,
+                    video_id,
+                    parse_tags(redis_client.hget(video_key, "tags")),
+                )
+                record_metadata_change(redis_client, video_id)
 
-                # Remove from videos_by_date sorted set
-                redis_client.zrem("videos_by_date", video_id)
+                # Remove from the global and per-user date-sorted sets
+                username, _ = parse_metadata_key(video_key)
+                remove_from_date_index(redis_client, username, video_id)
 
                 success_count += 1
                 results.append({"video_id": video_id, "success": True})
@@ -714,8 +758,8 @@ def add_tag_to_videos():
         for video_id in video_ids:
             try:
                 # Find the metadata key for this video_id
-                matching_keys = redis_client.keys(f"metadata:*:{video_id}")
-                if not matching_keys:
+                video_key = resolve_metadata_key(redis_client, video_id)
+                if not video_key:
                     results.append(
                         {
                             "video_id": video_id,
@@ -725,23 +769,21 @@ def add_tag_to_videos():
                     )
                     continue
 
-                metadata_key = matching_keys[0]
-
                 # Get current tags
-                current_tags_str = redis_client.hget(metadata_key, "tags") or "[]"
-                try:
-                    current_tags = set(json.loads(current_tags_str))
-                except json.JSONDecodeError:
-                    current_tags = set()
+                old_tags = set(parse_tags(redis_client.hget(video_key, "tags")))
 
                 # Add new tag
-                current_tags.add(new_tag)
+                current_tags = old_tags | {new_tag}
 
                 # Update tags in Redis
-                redis_client.hset(metadata_key, "tags", json.dumps(list(current_tags)))
+                redis_client.hset(video_key, "tags", json.dumps(list(current_tags)))
 
-                # Add to global tags set
-                redis_client.sadd("all_tags", new_tag)
+                # Add to the tag's video set, tag_counts and the global tags set
+                update_tag_index(redis_client, video_id, old_tags, current_tags)
+                video_data = redis_client.hgetall(video_key)
+                index_video(redis_client, video_id, video_data)
+                record_metadata_change(redis_client, video_id)
+                store_card(redis_client, video_data)
 
                 success_count += 1
                 results.append({"video_id": video_id, "success": True})
@@ -780,6 +822,7 @@ def usernames():
 
 
 @app.route("/api/usernames", methods=["GET"])
+@catalog_etag()
 def get_usernames():
     """Get all usernames"""
     try:
@@ -835,7 +878,7 @@ def add_username():
             )
 
         # Add only new usernames to Redis
-        redis_client.sadd("all_usernames", *new_usernames)
+        add_usernames(redis_client, new_usernames)
 
         return jsonify(
             {
@@ -861,7 +904,7 @@ def delete_username():
         if not username:
             return jsonify({"success": False, "error": "Username is required"}), 400
 
-        redis_client.srem("all_usernames", username)
+        remove_username(redis_client, username)
         return jsonify({"success": True})
     except Exception as e:
         logger.error(f"Error deleting username: {e}")
@@ -872,22 +915,15 @@ def delete_username():
 def tags():
     """Tags dashboard route"""
     try:
-        # Get all tags and their counts
-        tag_counts = {}
-        all_videos = redis_client.keys("metadata:*:*")
-
-        for video_key in all_videos:
-            try:
-                video_data = redis_client.hgetall(video_key)
-                if video_data and video_data.get("deleted") != "True":
-                    tags = json.loads(video_data.get("tags", "[]"))
-                    for tag in tags:
-                        tag_counts[tag] = tag_counts.get(tag, 0) + 1
-            except json.JSONDecodeError:
-                continue
+        if QUERY_BACKEND == "sqlite":
+            sorted_tags = sqlite_replica.tag_counts(get_replica())
+            return render_template("tags.html", tags=sorted_tags)
 
-        # Sort tags by count descending
-        sorted_tags = sorted(tag_counts.items(), key=lambda x: x[1], reverse=True)
+        # Tag counts are maintained on write, most used first
+        sorted_tags = [
+            (tag, int(count))
+            for tag, count in redis_client.zrevrange(TAG_COUNTS, 0, -1, withscores=True)
+        ]
 
         return render_template("tags.html", tags=sorted_tags)
     except Exception as e:
@@ -896,108 +932,41 @@ def tags():
 
 
 @app.route("/api/videos/search")
+@catalog_etag(replica_backed=True)
 def search_videos():
     """Search videos with support for @username and !@username operators"""
     try:
-        search_query = request.args.get("q", "").lower()
+        search_query = request.args.get("q", "")
         page = int(request.args.get("page", 0))
         per_page = int(request.args.get("per_page", 20))
 
-        # Split and categorize search terms
-        include_terms = []
-        exclude_terms = []
-        include_usernames = []
-        exclude_usernames = []
-
-        for term in search_query.split():
-            if term.startswith('!@'):
-                exclude_usernames.append(term[2:])  # Remove the !@ prefix
-            elif term.startswith('!'):
-                exclude_terms.append(term[1:])  # Remove the ! prefix
-            elif term.startswith('@'):
-                include_usernames.append(term[1:])  # Remove the @ prefix
-            else:
-                include_terms.append(term)
-
-        # Get all video metadata keys
-        all_videos = redis_client.keys("metadata:*:*")
-        matching_videos = []
-
-        for video_key in all_videos:
-            try:
-                video_data = redis_client.hgetall(video_key)
-                if not video_data or video_data.get("deleted") == "True":
-                    continue
-
-                # Prepare searchable text
-                author = video_data.get("author", "").lower()
-                description = video_data.get("description", "").lower()
-                tags = [tag.lower() for tag in json.loads(video_data.get("tags", "[]"))]
-                username = video_data.get("username", "").lower()
-                music = video_data.get("music", "").lower()
-
-                # Check username matches first
-                if include_usernames and not any(u in username for u in include_usernames):
-                    continue
-                if any(u in username for u in exclude_usernames):
-                    continue
-
-                # Check if ALL include terms match
-                matches = True
-                for term in include_terms:
-                    term_matches = (
-                        term in author or
-                        term in description or
-                        term in username or
-                        term in music or
-                        any(term in tag for tag in tags) or
-                        term in tags
-                    )
-                    if not term_matches:
-                        matches = False
-                        break
-
-                # Check if ANY exclude terms match
-                for term in exclude_terms:
-                    term_matches = (
-                        term in author or
-                        term in description or
-                        term in username or
-                        term in music or
-                        any(term in tag for tag in tags) or
-                        term in tags
-                    )
-                    if term_matches:
-                        matches = False
-                        break
-
-                if matches:
-                    username = video_data.get("username", "")
-                    matching_videos.append({
-                        "video_id": video_data["video_id"],
-                        "video_path": f"{username}_videos/{video_data['video_id']}.mp4",
-                        "thumbnail_path": f"{username}_videos/{video_data['video_id']}_thumb.jpg",
-                        "description": video_data.get("description", ""),
-                        "username": username,
-                        "tags": json.loads(video_data.get("tags", "[]")),
-                        "has_thumbnail": True,
-                        "author": video_data.get("author", ""),
-                        "music": video_data.get("music", ""),
-                        "date": video_data.get("date", ""),
-                        "url": video_data.get("url", ""),
-                    })
-
-            except json.JSONDecodeError:
-                continue
-
-        # Sort by date (newest first)
-        matching_videos.sort(key=lambda x: parse_date_string(x["date"]), reverse=True)
+        try:
+            cursor = request_cursor()
+        except ValueError:
+            return jsonify({"error": "Invalid cursor"}), 400
 
-        return jsonify({
-            "videos": matching_videos[page * per_page:(page + 1) * per_page],
-            "total": len(matching_videos),
-            "has_more": (page + 1) * per_page < len(matching_videos)
-        })
+        # Match against the token index; results come back in date order
+        start_idx = page * per_page
+        if QUERY_BACKEND == "sqlite":
+            total, videos, next_cursor = sqlite_replica.search_videos(
+                get_replica(), search_query, start_idx, per_page, cursor=cursor
+            )
+            cards = render_cards(videos)
+        else:
+            total, video_ids, next_cursor = search_video_ids(
+                redis_client, search_query, start_idx, per_page, cursor=cursor
+            )
+            cards = fetch_cards(redis_client, video_ids)
+
+        return Response(
+            cards_response_body(
+                cards,
+                total=total,
+                has_more=next_cursor is not None,
+                next_cursor=next_cursor,
+            ),
+            mimetype="application/json",
+        )
 
     except Exception as e:
         logger.error(f"Error in search: {e}")
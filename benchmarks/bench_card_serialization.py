@@ -0,0 +1,128 @@
+"""Serialization benchmark for /api/videos response bodies.
+
+Seeds a scratch Redis database with synthetic videos and compares building a
+page by hydrating the hashes and encoding a card dict per video (what the
+API did before card:{video_id} blobs) with reading the pre-rendered cards
+and concatenating them, reporting p50/p99 per page size. Timings are split
+into fetch and serialize so the encoding cost is visible on its own.
+
+Usage:
+    python benchmarks/bench_card_serialization.py --videos 100000
+
+The benchmark FLUSHES the database given by --db (default 15), so never point
+it at the database the app uses.
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+import redis
+
+# Make the repo root importable when run as `python benchmarks/...`
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from bench_page_hydration import percentile, seed
+from services.redis_helpers import fetch_videos
+from services.video_cards import (
+    cards_response_body,
+    fetch_cards,
+    format_video,
+    is_visible,
+)
+
+PAGE_SIZES = [20, 100, 500]
+
+
+def dict_page(redis_client, video_ids):
+    """Hydrate the hashes, build a card dict per video and encode the page."""
+    started = time.perf_counter()
+    videos = fetch_videos(redis_client, video_ids)
+    fetched = time.perf_counter()
+    body = json.dumps(
+        {
+            "videos": [format_video(video) for video in videos if is_visible(video)],
+            "total": len(video_ids),
+            "has_more": True,
+            "next_cursor": None,
+        }
+    )
+    return fetched - started, time.perf_counter() - fetched, body
+
+
+def card_page(redis_client, video_ids):
+    """Read the cached card blobs and concatenate them into the page."""
+    started = time.perf_counter()
+    cards = fetch_cards(redis_client, video_ids)
+    fetched = time.perf_counter()
+    body = cards_response_body(
+        cards, total=len(video_ids), has_more=True, next_cursor=None
+    )
+    return fetched - started, time.perf_counter() - fetched, body
+
+
+def measure(redis_client, build, per_page: int, iterations: int):
+    """Time ``build`` over random pages; returns (fetch ms, serialize ms)."""
+    total = redis_client.zcard("videos_by_date")
+    fetch_times, serialize_times = [], []
+
+    for _ in range(iterations):
+        start_idx = random.randrange(0, max(total - per_page, 1))
+        video_ids = redis_client.zrevrange(
+            "videos_by_date", start_idx, start_idx + per_page - 1
+        )
+        fetch_time, serialize_time, _ = build(redis_client, video_ids)
+        fetch_times.append(fetch_time * 1000)
+        serialize_times.append(serialize_time * 1000)
+
+    return fetch_times, serialize_times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--videos", type=int, default=100000)
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--db", type=int, default=15)
+    parser.add_argument("--skip-seed", action="store_true")
+    args = parser.parse_args()
+
+    redis_client = redis.Redis(
+        host=os.getenv("REDIS_HOST", "localhost"),
+        port=6379,
+        db=args.db,
+        decode_responses=True,
+    )
+
+    if not args.skip_seed:
+        print(f"Seeding {args.videos} videos into db {args.db}...")
+        seed(redis_client, args.videos)
+
+    # Render every card up front so the card runs measure warm reads
+    video_ids = redis_client.zrange("videos_by_date", 0, -1)
+    for start in range(0, len(video_ids), 1000):
+        fetch_cards(redis_client, video_ids[start : start + 1000])
+
+    print(
+        f"{'method':<8} {'per_page':>8} {'fetch p50':>10} {'fetch p99':>10} "
+        f"{'encode p50':>10} {'encode p99':>10}"
+    )
+    for per_page in PAGE_SIZES:
+        for name, build in (("dicts", dict_page), ("cards", card_page)):
+            fetch_times, serialize_times = measure(
+                redis_client, build, per_page, args.iterations
+            )
+            print(
+                f"{name:<8} {per_page:>8} "
+                f"{percentile(fetch_times, 50):>10.2f} "
+                f"{percentile(fetch_times, 99):>10.2f} "
+                f"{percentile(serialize_times, 50):>10.2f} "
+                f"{percentile(serialize_times, 99):>10.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
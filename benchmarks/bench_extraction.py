@@ -0,0 +1,117 @@
+"""Extraction benchmark for saved TikTok video pages.
+
+Runs the embedded-JSON extractor and the BeautifulSoup DOM walker over every
+*.html file in a fixtures directory and reports parse time per page
+(p50/p99) and, for each metadata field, how many pages it was found on.
+Save fixtures from a browser session (driver.page_source) to compare the
+two on real pages; without --fixtures, synthetic pages carrying both the
+hydration JSON and the markup are generated instead.
+
+Usage:
+    python benchmarks/bench_extraction.py --fixtures fixtures/pages
+    python benchmarks/bench_extraction.py --synthetic 200
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+# Make the repo root importable when run as `python benchmarks/...`
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from bench_page_hydration import percentile
+from services.page_metadata import (
+    METADATA_FIELDS,
+    extract_dom_metadata,
+    extract_embedded_metadata,
+)
+
+# Rough size of the markup around the data on a real video page
+SYNTHETIC_PADDING = 300_000
+
+
+def synthetic_page(index: int) -> str:
+    """Build a video page with the hydration JSON and the matching markup."""
+    description = f"Synthetic video {index} #tag{index % 50} #fyp"
+    item = {
+        "id": str(7000000000000000000 + index),
+        "desc": description,
+        "createTime": str(1700000000 + index * 3600),
+        "author": {"uniqueId": f"user{index % 200}", "nickname": f"User {index}"},
+        "music": {"title": "original sound", "authorName": f"User {index}"},
+        "textExtra": [{"hashtagName": f"tag{index % 50}"}, {"hashtagName": "fyp"}],
+        "challenges": [{"title": f"tag{index % 50}"}, {"title": "fyp"}],
+    }
+    state = {
+        "__DEFAULT_SCOPE__": {"webapp.video-detail": {"itemInfo": {"itemStruct": item}}}
+    }
+    filler = '<div class="css-1x2y3z-DivFiller"><span>filler</span></div>' * (
+        SYNTHETIC_PADDING // 60
+    )
+    return (
+        "<html><head>"
+        '<script id="__UNIVERSAL_DATA_FOR_REHYDRATION__" type="application/json">'
+        f"{json.dumps(state)}</script></head><body>{filler}"
+        '<span data-e2e="browser-nickname">'
+        f'<span class="css-1xccqfx-SpanNickName">User {index}</span>'
+        "<span>·</span><span>2023-11-14</span></span>"
+        '<h1 data-e2e="browse-video-desc">'
+        f'<span data-e2e="new-desc-span">{description}</span>'
+        f'<a data-e2e="search-common-link">#tag{index % 50}</a></h1>'
+        f'<h4 data-e2e="browse-music">original sound - User {index}</h4>'
+        f'<div data-e2e="v2t-title">Title {index}</div>'
+        f'<div data-e2e="v2t-desc">Summary of video {index}</div>'
+        "</body></html>"
+    )
+
+
+def load_pages(args):
+    """Read the fixture pages, or build synthetic ones."""
+    if args.fixtures:
+        paths = sorted(Path(args.fixtures).glob("*.html"))
+        return [path.read_text(encoding="utf-8", errors="replace") for path in paths]
+    return [synthetic_page(index) for index in range(args.synthetic)]
+
+
+def measure(extract, pages):
+    """Time ``extract`` on every page; returns (ms per page, results)."""
+    times, results = [], []
+    for page in pages:
+        started = time.perf_counter()
+        results.append(extract(page))
+        times.append((time.perf_counter() - started) * 1000)
+    return times, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--fixtures", help="Directory of saved video page HTML")
+    parser.add_argument("--synthetic", type=int, default=100)
+    args = parser.parse_args()
+
+    pages = load_pages(args)
+    if not pages:
+        parser.error(f"No *.html files in {args.fixtures}")
+    print(f"{len(pages)} pages, {sum(map(len, pages)) / len(pages) / 1024:.0f} KiB avg")
+
+    print(f"{'method':<9} {'p50 ms':>8} {'p99 ms':>8} {'pages':>6}  fields found")
+    for name, extract in (
+        ("embedded", extract_embedded_metadata),
+        ("dom", extract_dom_metadata),
+    ):
+        times, results = measure(extract, pages)
+        found = [result for result in results if result is not None]
+        coverage = " ".join(
+            f"{field}={sum(1 for result in found if result.get(field))}"
+            for field in METADATA_FIELDS
+        )
+        print(
+            f"{name:<9} {percentile(times, 50):>8.2f} {percentile(times, 99):>8.2f} "
+            f"{len(found):>6}  {coverage}"
+        )
+
+
+if __name__ == "__main__":
+    main()
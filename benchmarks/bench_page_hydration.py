@@ -0,0 +1,138 @@
+"""Latency benchmark for /api/videos page hydration.
+
+Seeds a scratch Redis database with synthetic videos and compares the legacy
+per-video lookup (KEYS + HGETALL for every card) with the pipelined
+fetch_videos() used by the API, reporting p50/p99 per page size.
+
+Usage:
+    python benchmarks/bench_page_hydration.py --videos 100000
+
+The benchmark FLUSHES the database given by --db (default 15), so never point
+it at the database the app uses.
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import redis
+
+# Make the repo root importable when run as `python benchmarks/...`
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from services.redis_helpers import VIDEO_KEY_INDEX, fetch_videos, metadata_key
+
+PAGE_SIZES = [20, 100, 500]
+
+
+def seed(redis_client, video_count: int, user_count: int = 200):
+    """Populate the scratch database with synthetic videos."""
+    redis_client.flushdb()
+    pipe = redis_client.pipeline(transaction=False)
+    now = time.time()
+
+    for i in range(video_count):
+        username = f"user{i % user_count}"
+        video_id = str(7000000000000000000 + i)
+        pipe.hset(
+            metadata_key(username, video_id),
+            mapping={
+                "video_id": video_id,
+                "username": username,
+                "author": f"Author {i % user_count}",
+                "description": f"Synthetic video {i} #tag{i % 50} #fyp",
+                "tags": json.dumps([f"tag{i % 50}", "fyp"]),
+                "music": "original sound",
+                "date": f"Author·{time.strftime('%Y-%m-%d', time.gmtime(now - i * 60))}",
+                "url": f"https://www.tiktok.com/@{username}/video/{video_id}",
+            },
+        )
+        pipe.hset(VIDEO_KEY_INDEX, video_id, username)
+        pipe.zadd("videos_by_date", {video_id: now - i * 60})
+
+        if i % 5000 == 0:
+            pipe.execute()
+
+    pipe.execute()
+
+
+def legacy_fetch(redis_client, video_ids):
+    """The original hydration loop: one KEYS and one HGETALL per video."""
+    videos = []
+    for video_id in video_ids:
+        matching_keys = redis_client.keys(f"metadata:*:{video_id}")
+        if matching_keys:
+            videos.append(redis_client.hgetall(matching_keys[0]))
+    return videos
+
+
+def measure(redis_client, fetch, per_page: int, iterations: int):
+    """Time ``fetch`` over random pages and return the latencies in ms."""
+    total = redis_client.zcard("videos_by_date")
+    latencies = []
+
+    for _ in range(iterations):
+        start_idx = random.randrange(0, max(total - per_page, 1))
+        video_ids = redis_client.zrevrange(
+            "videos_by_date", start_idx, start_idx + per_page - 1
+        )
+        started = time.perf_counter()
+        fetch(redis_client, video_ids)
+        latencies.append((time.perf_counter() - started) * 1000)
+
+    return latencies
+
+
+def percentile(latencies, pct: int) -> float:
+    """Return the given percentile of a list of latencies."""
+    if len(latencies) < 2:
+        return latencies[0]
+    return statistics.quantiles(latencies, n=100, method="inclusive")[pct - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--videos", type=int, default=100000)
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument(
+        "--legacy-iterations",
+        type=int,
+        default=3,
+        help="Iterations for the KEYS-based loop (0 to skip, it is very slow)",
+    )
+    parser.add_argument("--db", type=int, default=15)
+    parser.add_argument("--skip-seed", action="store_true")
+    args = parser.parse_args()
+
+    redis_client = redis.Redis(
+        host=os.getenv("REDIS_HOST", "localhost"),
+        port=6379,
+        db=args.db,
+        decode_responses=True,
+    )
+
+    if not args.skip_seed:
+        print(f"Seeding {args.videos} videos into db {args.db}...")
+        seed(redis_client, args.videos)
+
+    print(f"{'method':<10} {'per_page':>8} {'p50 ms':>10} {'p99 ms':>10}")
+    for per_page in PAGE_SIZES:
+        runs = [("pipeline", fetch_videos, args.iterations)]
+        if args.legacy_iterations:
+            runs.append(("legacy", legacy_fetch, args.legacy_iterations))
+
+        for name, fetch, iterations in runs:
+            latencies = measure(redis_client, fetch, per_page, iterations)
+            print(
+                f"{name:<10} {per_page:>8} "
+                f"{percentile(latencies, 50):>10.2f} {percentile(latencies, 99):>10.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -2,8 +2,14 @@ import redis
 import json
 from pathlib import Path
 import os
-import time
 import logging
+from services.dates import stored_published_timestamp
+from services.redis_helpers import (
+    VIDEOS_BY_DATE,
+    add_to_date_index,
+    record_metadata_change,
+    remove_from_date_index,
+)
 
 # Setup logging
 logging.basicConfig(
@@ -19,38 +25,6 @@ redis_client = redis.Redis(
 )
 
 
-def parse_date_string(date_str: str) -> float:
-    """Extract timestamp from date string like 'The Cheese Knees·2022-12-13' or 'username·2d ago'"""
-    try:
-        # Split by '·' and take the last part which should be the date/time
-        date_part = date_str.split("·")[-1].strip()
-
-        # Handle relative time formats
-        if "ago" in date_part:
-            # Extract number and unit
-            parts = date_part.split()
-            if len(parts) >= 2:
-                value = parts[0]
-                unit = value[-1]  # 'd' for days, 'h' for hours
-                number = int(value[:-1])  # number before the unit
-
-                current_time = time.time()
-                if unit == "d":
-                    return current_time - (number * 86400)  # days to seconds
-                elif unit == "h":
-                    return current_time - (number * 3600)  # hours to seconds
-                else:
-                    return current_time
-
-        # Try standard date format
-        return time.mktime(time.strptime(date_part, "%Y-%m-%d"))
-
-    except Exception as e:
-        logger.error(f"Error parsing date '{date_str}', using current time: {e}")
-        # Return current timestamp for any parsing errors
-        return time.time()
-
-
 def check_missing_files():
     """Check for videos marked as not deleted but missing files, and requeue them."""
     # First, let's see what keys exist
@@ -98,10 +72,13 @@ def check_missing_files():
 
                     if not video_path.exists():
                         # Mark the video as missing in metadata
-                        redis_client.hset(video_key, "file_missing", "True")
+                        if video_data.get("file_missing") != "True":
+                            redis_client.hset(video_key, "file_missing", "True")
+                            record_metadata_change(redis_client, video_id)
 
-                        # Remove from sorted set if file is missing
-                        redis_client.zrem("videos_by_date", video_id)
+                        # Remove from the sorted sets if file is missing
+                        if redis_client.zscore(VIDEOS_BY_DATE, video_id) is not None:
+                            remove_from_date_index(redis_client, username, video_id)
 
                         url = video_data.get("url")
                         if url and url not in queue_contents:
@@ -117,16 +94,23 @@ def check_missing_files():
                             )
                     else:
                         # Ensure file_missing is set to False if file exists
-                        redis_client.hset(video_key, "file_missing", "False")
+                        if video_data.get("file_missing") != "False":
+                            redis_client.hset(video_key, "file_missing", "False")
+                            record_metadata_change(redis_client, video_id)
 
                         # Ensure video is in sorted set with correct date
-                        if video_data.get("date"):
-                            timestamp = parse_date_string(video_data["date"])
+                        if video_data.get("published_ts") or video_data.get("date"):
+                            timestamp = stored_published_timestamp(video_data)
                         else:
                             # Use file modification time if no date available
                             timestamp = video_path.stat().st_mtime
 
-                        redis_client.zadd("videos_by_date", {video_id: timestamp})
+                        # Unchanged entries are left alone so cached listings
+                        # stay valid
+                        if redis_client.zscore(VIDEOS_BY_DATE, video_id) != timestamp:
+                            add_to_date_index(
+                                redis_client, username, video_id, timestamp
+                            )
 
             processed += 1
             if processed % 1000 == 0:
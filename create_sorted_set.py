@@ -1,24 +1,20 @@
 import redis
 import os
 import json
-from datetime import datetime
-import time
 from tqdm import tqdm
+from services.dates import stored_published_timestamp
+from services.redis_helpers import (
+    VIDEOS_BY_DATE,
+    bump_catalog_version,
+    parse_metadata_key,
+    user_date_key,
+)
 
 redis_client = redis.Redis(
     host=os.getenv("REDIS_HOST", "localhost"), port=6379, db=0, decode_responses=True
 )
 
 
-def parse_date(date_str):
-    try:
-        if "·" in date_str:
-            date_str = date_str.split("·")[1].strip()
-        return datetime.strptime(date_str, "%Y-%m-%d").timestamp()
-    except:
-        return time.time()
-
-
 def fix_paths_and_create_sorted_set():
     # Step 1: Create all_videos from metadata
     print("Creating all_videos set from metadata...")
@@ -53,9 +49,12 @@ def fix_paths_and_create_sorted_set():
     if fixed_paths:
         pipe.sadd("all_videos", *fixed_paths)
 
-    # Step 2: Create sorted set of videos by date
+    # Step 2: Create sorted sets of videos by date, globally and per user
     print("\nCreating sorted set of videos by date...")
-    pipe.delete("videos_by_date")  # Clear existing sorted set
+    pipe.delete(VIDEOS_BY_DATE)  # Clear existing sorted set
+    user_date_keys = list(redis_client.scan_iter(f"{VIDEOS_BY_DATE}:*"))
+    if user_date_keys:
+        pipe.delete(*user_date_keys)
 
     for key in tqdm(metadata_keys, desc="Processing videos"):
         video_data = redis_client.hgetall(key)
@@ -72,29 +71,17 @@ def fix_paths_and_create_sorted_set():
         if not video_id:
             continue
 
-        # Use date field as primary source
-        timestamp = None
-        if "date" in video_data:
-            timestamp = parse_date(video_data["date"])
-
-        if not timestamp and "author" in video_data:
-            timestamp = parse_date(video_data["author"])
-
-        # Fallback to scrape_time only if date is missing
-        if not timestamp and "scrape_time" in video_data:
-            try:
-                timestamp = datetime.strptime(
-                    video_data["scrape_time"], "%Y-%m-%d %H:%M:%S"
-                ).timestamp()
-            except:
-                pass
-
-        # Last resort: current time
-        if not timestamp:
-            timestamp = time.time()
-
-        # Add to sorted set
-        pipe.zadd("videos_by_date", {video_id: timestamp})
+        # Use the stored publish time, parsing the date for older records
+        timestamp = stored_published_timestamp(video_data)
+
+        # Add to sorted sets
+        pipe.zadd(VIDEOS_BY_DATE, {video_id: timestamp})
+        parsed = parse_metadata_key(key)
+        if parsed:
+            pipe.zadd(user_date_key(parsed[0]), {video_id: timestamp})
+
+    # Cached query results were computed from the old sets
+    bump_catalog_version(pipe)
 
     # Execute all commands
     pipe.execute()
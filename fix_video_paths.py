@@ -1,6 +1,7 @@
 import redis
 import os
 from tqdm import tqdm
+from services.redis_helpers import VIDEO_KEY_INDEX
 
 # Redis connection
 redis_client = redis.Redis(
@@ -22,19 +23,17 @@ def fix_video_paths():
 
         fixed_paths = set()
 
-        # For each video ID, find its metadata and construct proper path
-        for video_id in tqdm(video_ids, desc="Fixing video paths"):
-            # Search for metadata keys containing this video ID
-            metadata_keys = redis_client.keys(f"metadata:*:{video_id}")
-
-            for metadata_key in metadata_keys:
-                # Extract username from metadata key (format: metadata:username:video_id)
-                parts = metadata_key.split(":")
-                if len(parts) == 3:
-                    username = parts[1]
-                    # Construct proper path
-                    proper_path = f"{username}/{video_id}.mp4"
-                    fixed_paths.add(proper_path)
+        # Look up the owner of every video in one round trip
+        video_ids = list(video_ids)
+        usernames = redis_client.hmget(VIDEO_KEY_INDEX, video_ids) if video_ids else []
+
+        # For each video ID, construct the proper path from its owner
+        for video_id, username in tqdm(
+            zip(video_ids, usernames), total=len(video_ids), desc="Fixing video paths"
+        ):
+            if username:
+                proper_path = f"{username}/{video_id}.mp4"
+                fixed_paths.add(proper_path)
 
         # Add all fixed paths back to Redis
         if fixed_paths:
@@ -1,5 +1,6 @@
 import redis
 import os
+from services.redis_helpers import add_usernames
 
 # Redis connection
 redis_client = redis.Redis(
@@ -25,7 +26,7 @@ def populate_usernames():
         # Add usernames to Redis set
         if usernames:
             print(f"Adding {len(usernames)} usernames to Redis")
-            redis_client.sadd("all_usernames", *usernames)
+            add_usernames(redis_client, usernames)
             print("Usernames added successfully")
             print("\nSample usernames:")
             for username in list(usernames)[:5]:
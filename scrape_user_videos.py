@@ -12,8 +12,15 @@ from tqdm import tqdm
 
 from bs4 import BeautifulSoup
 
+from services.page_metadata import extract_embedded_metadata
+
 
 def extract_metadata_with_v2t(html_content):
+    # The page's embedded JSON is faster to read and doesn't rely on class names
+    metadata = extract_embedded_metadata(html_content)
+    if metadata is not None:
+        return metadata
+
     soup = BeautifulSoup(html_content, "html.parser")
     metadata = {}
 
@@ -1,6 +1,17 @@
 import redis
 import logging
 import os
+import sys
+from pathlib import Path
+
+# Make the repo root importable when run as `python scripts/cleanup_deleted_videos.py`
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from services.redis_helpers import (
+    parse_metadata_key,
+    remove_from_date_index,
+    resolve_metadata_key,
+)
 
 # Setup logging
 logging.basicConfig(
@@ -29,21 +40,21 @@ def cleanup_deleted_videos():
 
         for video_id in all_video_ids:
             # Find the metadata key for this video_id
-            matching_keys = redis_client.keys(f"metadata:*:{video_id}")
+            metadata_key = resolve_metadata_key(redis_client, video_id)
+            username = parse_metadata_key(metadata_key)[0] if metadata_key else None
 
-            if not matching_keys:
-                # If no metadata exists, remove from sorted set
-                redis_client.zrem("videos_by_date", video_id)
+            if not metadata_key or not redis_client.exists(metadata_key):
+                # If no metadata exists, remove from sorted sets
+                remove_from_date_index(redis_client, username, video_id)
                 removed_count += 1
                 logger.info(f"Removed {video_id} - no metadata found")
                 continue
 
-            metadata_key = matching_keys[0]
             is_deleted = redis_client.hget(metadata_key, "deleted") == "True"
 
             if is_deleted:
-                # Remove from sorted set if marked as deleted
-                redis_client.zrem("videos_by_date", video_id)
+                # Remove from sorted sets if marked as deleted
+                remove_from_date_index(redis_client, username, video_id)
                 removed_count += 1
                 logger.info(f"Removed {video_id} - marked as deleted")
 
@@ -0,0 +1,131 @@
+import argparse
+import logging
+import os
+import sys
+from pathlib import Path
+
+import redis
+
+# Make the repo root importable when run as `python scripts/rebuild_indexes.py`
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from services.redis_helpers import (
+    backfill_published_ts,
+    bump_catalog_version,
+    rebuild_completion_index,
+    rebuild_tag_counts,
+    rebuild_tag_sets,
+    rebuild_user_date_index,
+    rebuild_video_key_index,
+)
+from services.search_index import rebuild_search_index
+from services.video_cards import drop_cards
+
+# Setup logging
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+)
+logger = logging.getLogger("rebuild_indexes")
+
+
+def rebuild_video_keys(redis_client):
+    """Build the video_id -> username index for existing deployments."""
+    logger.info("Rebuilding video key index...")
+    indexed = rebuild_video_key_index(redis_client)
+    logger.info(f"Indexed {indexed} videos")
+
+
+def rebuild_tags(redis_client):
+    """Rebuild the tag:{tag} and user_videos:{username} sets used for filtering."""
+    logger.info("Rebuilding tag and user video sets...")
+    tag_count = rebuild_tag_sets(redis_client)
+    logger.info(f"Rebuilt {tag_count} tag sets")
+
+
+def reconcile_tag_counts(redis_client):
+    """Recount tag_counts from the tag:{tag} sets and deleted_videos."""
+    logger.info("Reconciling tag counts...")
+    tag_count = rebuild_tag_counts(redis_client)
+    logger.info(f"Counted {tag_count} tags")
+
+
+def rebuild_user_dates(redis_client):
+    """Rebuild the videos_by_date:{username} sets from videos_by_date."""
+    logger.info("Rebuilding per-user date-sorted sets...")
+    user_count = rebuild_user_date_index(redis_client)
+    logger.info(f"Rebuilt date-sorted sets for {user_count} users")
+
+
+def backfill_publish_times(redis_client):
+    """Store published_ts on every video and rescore the date-sorted sets."""
+    logger.info("Backfilling published_ts...")
+    updated = backfill_published_ts(redis_client)
+    logger.info(f"Updated {updated} videos")
+
+
+def rebuild_completions(redis_client):
+    """Rebuild the tags_lex and usernames_lex completion indexes."""
+    logger.info("Rebuilding tag and username completion indexes...")
+    indexed = rebuild_completion_index(redis_client)
+    logger.info(f"Indexed {indexed} tags and usernames")
+
+
+def rebuild_search(redis_client):
+    """Rebuild the search token index used by /api/videos/search."""
+    logger.info("Rebuilding search token index...")
+    token_count = rebuild_search_index(redis_client)
+    logger.info(f"Indexed {token_count} search tokens")
+
+
+def reset_cards(redis_client):
+    """Drop the pre-rendered card:{video_id} JSON so it is rendered afresh."""
+    logger.info("Dropping cached video cards...")
+    dropped = drop_cards(redis_client)
+    logger.info(f"Dropped {dropped} cards")
+
+
+REBUILDERS = {
+    "video-keys": rebuild_video_keys,
+    "tag-sets": rebuild_tags,
+    "tag-counts": reconcile_tag_counts,
+    "user-dates": rebuild_user_dates,
+    "published-ts": backfill_publish_times,
+    "search": rebuild_search,
+    "completions": rebuild_completions,
+    "cards": reset_cards,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Rebuild derived Redis indexes from the metadata hashes."
+    )
+    parser.add_argument(
+        "indexes",
+        nargs="*",
+        metavar="INDEX",
+        help=f"Indexes to rebuild: {', '.join(REBUILDERS)} (default: all)",
+    )
+    args = parser.parse_args()
+
+    names = args.indexes or list(REBUILDERS)
+    unknown = sorted(set(names) - set(REBUILDERS))
+    if unknown:
+        parser.error(f"unknown index: {', '.join(unknown)}")
+
+    redis_client = redis.Redis(
+        host=os.getenv("REDIS_HOST", "localhost"),
+        port=6379,
+        db=0,
+        decode_responses=True,
+    )
+
+    for name in names:
+        REBUILDERS[name](redis_client)
+
+    # Drop query results cached from the old indexes
+    bump_catalog_version(redis_client)
+
+
+if __name__ == "__main__":
+    main()
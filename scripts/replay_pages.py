@@ -0,0 +1,78 @@
+"""Serve saved video pages so the HTTP fetcher can be tested offline.
+
+Any request path ending in a video ID (e.g. ``/@user/video/7301234567890``)
+is answered with ``{video_id}.html`` from the fixtures directory, gzipped
+when the client accepts it; other paths get a 404. Point the metadata
+service at it with:
+
+    METADATA_FETCHER=http METADATA_HTTP_BASE=http://localhost:8700 \\
+        python services/metadata_service.py
+
+Usage:
+    python scripts/replay_pages.py fixtures/pages --port 8700
+"""
+
+from functools import partial
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+import argparse
+import gzip
+import logging
+
+# Setup logging
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+)
+logger = logging.getLogger("replay_pages")
+
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Keep-alive responses would otherwise wait on delayed ACKs
+    disable_nagle_algorithm = True
+
+    def __init__(self, *args, fixtures: Path, **kwargs):
+        self.fixtures = fixtures
+        super().__init__(*args, **kwargs)
+
+    def do_GET(self):
+        video_id = self.path.split("?")[0].rstrip("/").rsplit("/", 1)[-1]
+        page = self.fixtures / f"{video_id}.html"
+        if not video_id or not page.is_file():
+            self.send_error(404)
+            return
+
+        body = page.read_bytes()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        if "gzip" in self.headers.get("Accept-Encoding", ""):
+            body = gzip.compress(body)
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.info(format % args)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("fixtures", help="Directory of {video_id}.html pages")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8700)
+    args = parser.parse_args()
+
+    handler = partial(ReplayHandler, fixtures=Path(args.fixtures))
+    server = ThreadingHTTPServer((args.host, args.port), handler)
+    logger.info(f"Replaying {args.fixtures} on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
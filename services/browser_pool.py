@@ -0,0 +1,198 @@
+"""Long-lived headless browser sessions shared by the scraping services.
+
+Starting Chromium costs far more than loading one TikTok page, so sessions
+are kept open and handed from one video to the next. A session is checked
+with a cheap script call before it is handed out, and is quit and replaced
+after BROWSER_MAX_PAGES pages or as soon as WebDriver reports an error.
+
+Per-video timings are added up in the ``metadata_timings`` hash so the
+startup cost can be compared with the time spent on pages.
+"""
+
+from contextlib import contextmanager
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Callable, Dict
+
+from selenium.common.exceptions import WebDriverException
+
+logger = logging.getLogger("browser_pool")
+
+# Browsers kept open at once (0: let the service decide, e.g. one per worker),
+# and pages loaded by one before it is replaced
+BROWSER_POOL_SIZE = int(os.getenv("BROWSER_POOL_SIZE", "0"))
+BROWSER_MAX_PAGES = int(os.getenv("BROWSER_MAX_PAGES", "100"))
+
+METADATA_TIMINGS = "metadata_timings"
+# Stages of handling a video; the hash holds a total in ms for each
+TIMING_FIELDS = ("startup", "wait", "page", "extract", "total")
+
+
+class BrowserSession:
+    def __init__(self, driver, startup_seconds: float):
+        self.driver = driver
+        self.startup_seconds = startup_seconds
+        self.pages = 0
+
+    def take_startup(self) -> float:
+        """Return the launch time on the session's first page, 0 after that."""
+        return self.startup_seconds if self.pages == 0 else 0.0
+
+
+class BrowserPool:
+    def __init__(
+        self,
+        launch: Callable,
+        size: int = None,
+        max_pages: int = None,
+    ):
+        """``launch`` starts a new WebDriver and returns it."""
+        self.launch = launch
+        self.size = size or BROWSER_POOL_SIZE or 1
+        self.max_pages = max_pages or BROWSER_MAX_PAGES
+        self.idle = queue.LifoQueue()
+        self.lock = threading.Lock()
+        self.open_sessions = 0
+        self.closed = False
+
+    def start_session(self) -> BrowserSession:
+        """Launch a browser for a slot already reserved in open_sessions."""
+        started = time.perf_counter()
+        try:
+            driver = self.launch()
+        except Exception:
+            with self.lock:
+                self.open_sessions -= 1
+            raise
+        startup = time.perf_counter() - started
+        logger.info(f"Started browser session in {startup * 1000:.0f} ms")
+        return BrowserSession(driver, startup)
+
+    def healthy(self, session: BrowserSession) -> bool:
+        """Check that a session's browser still answers."""
+        try:
+            session.driver.execute_script("return document.readyState")
+            return True
+        except WebDriverException:
+            return False
+
+    def discard(self, session: BrowserSession):
+        """Quit a session's browser and free its slot."""
+        with self.lock:
+            self.open_sessions -= 1
+        try:
+            session.driver.quit()
+        except Exception as e:
+            logger.warning(f"Error quitting browser session: {e}")
+
+    def checkout(self) -> BrowserSession:
+        """Take a healthy idle session, starting one if the pool has room."""
+        while True:
+            try:
+                session = self.idle.get_nowait()
+            except queue.Empty:
+                with self.lock:
+                    has_room = self.open_sessions < self.size
+                    if has_room:
+                        self.open_sessions += 1
+                if has_room:
+                    return self.start_session()
+
+                # Recheck for room now and then; a discarded session frees a slot
+                try:
+                    session = self.idle.get(timeout=1)
+                except queue.Empty:
+                    continue
+
+            if self.healthy(session):
+                return session
+            logger.warning("Replacing unresponsive browser session")
+            self.discard(session)
+
+    def checkin(self, session: BrowserSession, crashed: bool = False):
+        """Return a session after a page, recycling it if it is spent."""
+        session.pages += 1
+        if crashed or self.closed or session.pages >= self.max_pages:
+            self.discard(session)
+        else:
+            self.idle.put(session)
+
+    @contextmanager
+    def session(self):
+        """Borrow a session for one page.
+
+        A WebDriverException raised inside the block retires the session
+        before it is re-raised.
+        """
+        session = self.checkout()
+        crashed = False
+        try:
+            yield session
+        except WebDriverException:
+            crashed = True
+            raise
+        finally:
+            self.checkin(session, crashed)
+
+    def close(self):
+        """Quit every idle session; sessions in use are quit on return."""
+        self.closed = True
+        while True:
+            try:
+                self.discard(self.idle.get_nowait())
+            except queue.Empty:
+                break
+
+
+def record_timings(
+    redis_client,
+    timings: Dict[str, float],
+    browser_started: bool,
+    backend: str = "browser",
+):
+    """Add one video's timings, in seconds, to the metadata_timings totals.
+
+    ``backend`` is what fetched the page: "browser" or "http".
+    """
+    pipe = redis_client.pipeline()
+    pipe.hincrby(METADATA_TIMINGS, "videos", 1)
+    pipe.hincrby(METADATA_TIMINGS, f"{backend}_pages", 1)
+    if browser_started:
+        pipe.hincrby(METADATA_TIMINGS, "browser_starts", 1)
+    for field in TIMING_FIELDS:
+        pipe.hincrby(
+            METADATA_TIMINGS, f"{field}_ms", round(timings.get(field, 0) * 1000)
+        )
+    pipe.execute()
+
+
+def timing_stats(redis_client) -> Dict:
+    """Average per-video timings, with browser startup amortized over all videos."""
+    totals = {
+        field: int(value)
+        for field, value in redis_client.hgetall(METADATA_TIMINGS).items()
+    }
+    videos = totals.get("videos", 0)
+    browser_starts = totals.get("browser_starts", 0)
+    stats = {
+        "videos": videos,
+        "browser_starts": browser_starts,
+        "browser_pages": totals.get("browser_pages", 0),
+        "http_pages": totals.get("http_pages", 0),
+        "pages_per_browser": (
+            round(totals.get("browser_pages", 0) / browser_starts, 1)
+            if browser_starts
+            else 0
+        ),
+        "startup_ms_per_launch": (
+            round(totals.get("startup_ms", 0) / browser_starts) if browser_starts else 0
+        ),
+    }
+    for field in TIMING_FIELDS:
+        stats[f"avg_{field}_ms"] = (
+            round(totals.get(f"{field}_ms", 0) / videos) if videos else 0
+        )
+    return stats
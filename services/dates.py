@@ -0,0 +1,120 @@
+import re
+import time
+from datetime import datetime
+from typing import Dict, Optional
+
+from dateutil import parser
+
+# Format used for scrape_time, metadata_collection_time and download_time
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# Fields recording when a page was looked at, in order of preference. Relative
+# dates like "2d ago" are relative to these, not to when they are parsed.
+REFERENCE_FIELDS = ("metadata_collection_time", "scrape_time", "download_time")
+
+RELATIVE_UNITS = {
+    "s": 1,
+    "m": 60,
+    "h": 3600,
+    "d": 86400,
+    "w": 604800,
+}
+
+RELATIVE_PATTERN = re.compile(
+    r"^(\d+)\s*(s|secs?|seconds?|m|mins?|minutes?|h|hrs?|hours?|d|days?|w|weeks?)"
+    r"\s+ago$"
+)
+MONTH_DAY_PATTERN = re.compile(r"^(\d{1,2})-(\d{1,2})$")
+
+
+def parse_timestamp(value: str) -> Optional[float]:
+    """Parse a 'YYYY-MM-DD HH:MM:SS' timestamp, or None if it isn't one."""
+    try:
+        return datetime.strptime(value, TIMESTAMP_FORMAT).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_date_string(date_str: str, reference: float = None) -> Optional[float]:
+    """Extract a timestamp from TikTok date strings.
+
+    Handles 'The Cheese Knees·2022-12-13', 'username·2d ago', '2024-11-7' and
+    the current-year '11-7' form. Relative dates are resolved against
+    ``reference`` (defaults to now). Returns None when nothing parses, so
+    callers can fall back to another field.
+    """
+    if not date_str:
+        return None
+
+    if reference is None:
+        reference = time.time()
+
+    # Split by '·' and take the last part which should be the date/time
+    date_part = str(date_str).split("·")[-1].strip().lower()
+    if not date_part or not any(char.isdigit() for char in date_part):
+        return reference if date_part == "just now" else None
+
+    # Relative time formats: "2d ago", "3h ago", "1w ago"
+    relative = RELATIVE_PATTERN.match(date_part)
+    if relative:
+        number, unit = relative.groups()
+        return reference - int(number) * RELATIVE_UNITS[unit[0]]
+
+    # Current-year dates are shown without the year: "11-7"
+    month_day = MONTH_DAY_PATTERN.match(date_part)
+    if month_day:
+        month, day = (int(part) for part in month_day.groups())
+        year = datetime.fromtimestamp(reference).year
+        try:
+            return datetime(year, month, day).timestamp()
+        except ValueError:
+            return None
+
+    try:
+        return datetime.strptime(date_part, "%Y-%m-%d").timestamp()
+    except ValueError:
+        pass
+
+    try:
+        return parser.parse(date_part).timestamp()
+    except (ValueError, OverflowError):
+        return None
+
+
+def reference_time(video_data: Dict) -> Optional[float]:
+    """Return when a video's page was collected, if recorded."""
+    for field in REFERENCE_FIELDS:
+        timestamp = parse_timestamp(video_data.get(field))
+        if timestamp:
+            return timestamp
+    return None
+
+
+def published_timestamp(video_data: Dict) -> float:
+    """Work out a video's publish time from its metadata.
+
+    Uses the exact create_time from the page's embedded data when present,
+    then the date field, then the old 'author·date' format, then the scrape
+    time, and finally the current time.
+    """
+    try:
+        return float(video_data["create_time"])
+    except (KeyError, TypeError, ValueError):
+        pass
+
+    reference = reference_time(video_data)
+
+    for field in ("date", "author"):
+        timestamp = parse_date_string(video_data.get(field), reference)
+        if timestamp:
+            return timestamp
+
+    return reference or time.time()
+
+
+def stored_published_timestamp(video_data: Dict) -> float:
+    """Return the persisted published_ts, computing it if it is missing."""
+    try:
+        return float(video_data["published_ts"])
+    except (KeyError, TypeError, ValueError):
+        return published_timestamp(video_data)
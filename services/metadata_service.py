@@ -1,15 +1,54 @@
 from pathlib import Path
 import json
-from datetime import datetime
 import time
 import redis
+import httpx
 import logging
+import signal
+import threading
 from typing import Dict, List
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.chrome.options import Options
-from bs4 import BeautifulSoup
+from selenium.webdriver.support import expected_conditions
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.common.exceptions import TimeoutException
 import os
+import sys
+
+# Make the repo root importable when run as `python services/metadata_service.py`
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from services.browser_pool import (
+    BROWSER_POOL_SIZE,
+    TIMING_FIELDS,
+    BrowserPool,
+    record_timings,
+    timing_stats,
+)
+from services.dates import published_timestamp
+from services.page_fetch import METADATA_FETCHER, HttpFetcher
+from services.page_metadata import (
+    extract_embedded_metadata,
+    extract_metadata,
+    hashtags_in,
+)
+from services.rate_limit import TokenBucket
+from services.snapshots import SNAPSHOT_PAGES, store_snapshot
+from services.search_index import index_video
+from services.video_cards import is_visible, store_card
+from services.worker_loop import QueueWorker, enqueue, held_jobs
+from services.redis_helpers import (
+    add_to_date_index,
+    add_usernames,
+    index_video_key,
+    metadata_key,
+    parse_tags,
+    record_metadata_change,
+    resolve_metadata_key,
+    update_tag_index,
+    user_videos_key,
+)
 
 # Setup logging
 logging.basicConfig(
@@ -19,14 +58,32 @@ logging.basicConfig(
 )
 logger = logging.getLogger("metadata_service")
 
-# Redis connection
-redis_client = redis.Redis(host=os.getenv("REDIS_HOST", "localhost"), port=6379, db=0)
 QUEUE_KEY = "tiktok_video_queue"
 DOWNLOAD_QUEUE_KEY = "video_download_queue"
 
+# A page counts as rendered once the description is in the DOM; wait at most
+# this long for it before reading whatever has loaded
+PAGE_RENDER_TIMEOUT = float(os.getenv("PAGE_RENDER_TIMEOUT", "2"))
+PAGE_LOAD_TIMEOUT = int(os.getenv("PAGE_LOAD_TIMEOUT", "30"))
+RENDERED_SELECTOR = '[data-e2e="browse-video-desc"]'
+
+# Log the running timing averages every this many videos
+TIMING_LOG_INTERVAL = 50
+
+# Videos scraped at once by this process, and the page loads per second they
+# share (0: unlimited). Run more containers to scale out; they all drain the
+# same queue.
+METADATA_WORKERS = int(os.getenv("METADATA_WORKERS", "1"))
+METADATA_RATE = float(os.getenv("METADATA_RATE", "1"))
+METADATA_BURST = int(os.getenv("METADATA_BURST", METADATA_WORKERS))
+
+# A video still scraping after this long is taken as hung: its lease stops
+# being renewed and the video is requeued
+METADATA_JOB_TIMEOUT = int(os.getenv("METADATA_JOB_TIMEOUT", "300"))
+
 
 class MetadataService:
-    def __init__(self):
+    def __init__(self, workers: int = None):
         self.redis_client = redis.Redis(
             host=os.getenv("REDIS_HOST", "localhost"),
             port=6379,
@@ -36,25 +93,50 @@ class MetadataService:
         self.max_retries = 3
         self.FAILED_QUEUE = "metadata_failed_queue"
         self.PROCESSING_SET = "metadata_processing"
+        self.workers = workers or METADATA_WORKERS
+        self.browsers = BrowserPool(
+            self.launch_browser, size=BROWSER_POOL_SIZE or self.workers
+        )
+        self.rate_limit = TokenBucket(METADATA_RATE, METADATA_BURST)
+        self.http = HttpFetcher(self.workers) if METADATA_FETCHER == "http" else None
+
+        # Set on SIGTERM/SIGINT; workers finish their current video and exit
+        self.stopping = threading.Event()
+        self.in_flight = {}
+        self.processed = 0
+        self.lock = threading.Lock()
 
-        # Clean up and reprocess orphaned items at startup
+        # Requeue videos left in the old processing set by earlier versions
         self.handle_orphaned_processing()
 
     def handle_orphaned_processing(self):
-        """Handle videos that were left in processing state from previous runs"""
+        """Handle videos left in the processing set by earlier versions.
+
+        Claims are now leased in worker_loop and requeued by its reaper, so
+        nothing adds to the set any more; this only drains what is left.
+        """
         try:
             # Get all videos currently marked as processing
             orphaned_videos = self.redis_client.smembers(self.PROCESSING_SET)
 
+            # Jobs still in a worker's processing list are requeued by that worker
+            held = {
+                job.get("video_id") for job in held_jobs(self.redis_client, QUEUE_KEY)
+            }
+
             if orphaned_videos:
                 logger.info(
                     f"Found {len(orphaned_videos)} orphaned videos in processing state"
                 )
 
                 for video_id in orphaned_videos:
+                    if video_id in held:
+                        self.redis_client.srem(self.PROCESSING_SET, video_id)
+                        continue
+
                     # Find the metadata key for this video_id
-                    matching_keys = self.redis_client.keys(f"metadata:*:{video_id}")
-                    if not matching_keys:
+                    video_key = resolve_metadata_key(self.redis_client, video_id)
+                    if not video_key:
                         logger.warning(
                             f"No metadata found for orphaned video {video_id}"
                         )
@@ -63,8 +145,7 @@ class MetadataService:
 
                     try:
                         # Get the video data
-                        metadata_key = matching_keys[0]
-                        video_data = self.redis_client.hgetall(metadata_key)
+                        video_data = self.redis_client.hgetall(video_key)
 
                         # Remove from processing set
                         self.redis_client.srem(self.PROCESSING_SET, video_id)
@@ -84,7 +165,7 @@ class MetadataService:
                             logger.info(
                                 f"Requeueing orphaned video {video_id} for processing"
                             )
-                            self.redis_client.rpush(QUEUE_KEY, json.dumps(video_data))
+                            enqueue(self.redis_client, QUEUE_KEY, video_data)
 
                     except Exception as e:
                         logger.error(f"Error handling orphaned video {video_id}: {e}")
@@ -109,96 +190,48 @@ class MetadataService:
         chrome_options.add_experimental_option("useAutomationExtension", False)
         return chrome_options
 
-    def extract_metadata(self, html_content: str) -> Dict:
-        """Extract metadata from TikTok video page HTML."""
-        soup = BeautifulSoup(html_content, "html.parser")
-        metadata = {}
-
-        # Extract the author and date
-        browser_nickname = soup.find("span", {"data-e2e": "browser-nickname"})
-        if browser_nickname:
-            # Get author from first child with class css-1xccqfx-SpanNickName
-            author_span = browser_nickname.find(
-                "span", class_="css-1xccqfx-SpanNickName"
-            )
-            if author_span:
-                metadata["author"] = author_span.get_text(strip=True)
-
-            # Get date from the third span child (no class)
-            date_spans = browser_nickname.find_all("span")
-            if len(date_spans) >= 3:
-                date_span = date_spans[2]  # Third span contains the date
-                metadata["date"] = date_span.get_text(strip=True)
-
-        # Extract video description and tags
-        desc_container = soup.find("h1", {"data-e2e": "browse-video-desc"})
-        if desc_container:
-            # Get description from spans with data-e2e="new-desc-span"
-            desc_spans = desc_container.find_all("span", {"data-e2e": "new-desc-span"})
-            description_text = " ".join(
-                span.get_text(strip=True) for span in desc_spans
-            )
-            metadata["description"] = description_text.strip()
-
-            # Get tags from links with data-e2e="search-common-link"
-            tag_links = desc_container.find_all("a", {"data-e2e": "search-common-link"})
-            metadata["tags"] = [
-                tag.get_text(strip=True).lower().strip("#") for tag in tag_links
-            ]
+    def launch_browser(self):
+        """Start a headless Chromium for the browser pool."""
+        service = webdriver.ChromeService(executable_path="/usr/bin/chromedriver")
+        driver = webdriver.Chrome(options=self.setup_chrome_options(), service=service)
+        driver.set_page_load_timeout(PAGE_LOAD_TIMEOUT)
+        return driver
 
-            # Add any additional tags from description
-            metadata["tags"].extend(
-                self.extract_tags_from_description(metadata.get("description", ""))
+    def load_page(self, driver, url: str) -> str:
+        """Open a video page and return its HTML once it has rendered."""
+        driver.get(url)
+        try:
+            WebDriverWait(driver, PAGE_RENDER_TIMEOUT).until(
+                expected_conditions.presence_of_element_located(
+                    (By.CSS_SELECTOR, RENDERED_SELECTOR)
+                )
             )
-            metadata["tags"] = sorted(
-                list(set(metadata["tags"]))
-            )  # Deduplicate and sort
+        except TimeoutException:
+            logger.warning(f"Page did not render in {PAGE_RENDER_TIMEOUT}s: {url}")
+        return driver.page_source
+
+    def render_page(self, url: str, timings: Dict[str, float]):
+        """Load a page in a pooled browser, adding to the video's timings.
+
+        Returns:
+            tuple: (page HTML, number of pages the browser has now loaded)
+        """
+        waited = time.perf_counter()
+        with self.browsers.session() as browser:
+            checked_out = time.perf_counter()
+            timings["startup"] = browser.take_startup()
+            timings["wait"] += checked_out - waited - timings["startup"]
+            html_content = self.load_page(browser.driver, url)
+        timings["page"] += time.perf_counter() - checked_out
+        return html_content, browser.pages
 
-        # Extract music info
-        music_info = soup.find("h4", {"data-e2e": "browse-music"})
-        if music_info:
-            metadata["music"] = music_info.get_text(strip=True)
-
-        # Extract AI-generated title (v2t-title)
-        v2t_title = soup.find("div", {"data-e2e": "v2t-title"})
-        if v2t_title:
-            metadata["v2t_title"] = v2t_title.get_text(strip=True)
-
-        # Extract AI-generated description (v2t-desc)
-        v2t_desc = soup.find("div", {"data-e2e": "v2t-desc"})
-        if v2t_desc:
-            metadata["v2t_desc"] = v2t_desc.get_text(strip=True)
-
-        return metadata
+    def extract_metadata(self, html_content: str) -> Dict:
+        """Extract metadata from TikTok video page HTML."""
+        return extract_metadata(html_content)
 
     def extract_tags_from_description(self, description: str) -> List[str]:
         """Extract hashtags from description text."""
-        if not description:
-            return []
-
-        tags = []
-        parts = description.split()
-
-        for part in parts:
-            if part.startswith("#"):
-                hashtags = [tag.lower() for tag in part.split("#") if tag]
-                tags.extend(hashtags)
-            elif "#" in part:
-                hashtags = [tag.lower() for tag in part.split("#")[1:] if tag]
-                tags.extend(hashtags)
-
-        return list(set(tags))
-
-    def parse_date_string(self, date_str: str) -> float:
-        """Extract timestamp from date string like 'The Cheese Knees·2022-12-13'"""
-        try:
-            if "·" in date_str:
-                date_str = date_str.split("·")[1].strip()
-            return datetime.strptime(date_str, "%Y-%m-%d").timestamp()
-        except Exception as e:
-            logger.error(f"Error parsing date '{date_str}', using current time: {e}")
-            # Return current timestamp instead of 0
-            return time.time()
+        return hashtags_in(description)
 
     def update_metadata(self, video_data: Dict):
         """Store video metadata in Redis."""
@@ -209,57 +242,47 @@ class MetadataService:
             # Create a copy of video_data to modify
             redis_data = video_data.copy()
 
+            # Store the publish time once so reads never re-parse the date
+            redis_data["published_ts"] = published_timestamp(video_data)
+
             # Convert lists and dicts to JSON strings
             for key, value in redis_data.items():
                 if isinstance(value, (list, dict)):
                     redis_data[key] = json.dumps(value)
 
             # Store video metadata using hash
-            redis_key = f"metadata:{username}:{video_id}"
+            redis_key = metadata_key(username, video_id)
+            old_tags = parse_tags(self.redis_client.hget(redis_key, "tags"))
             self.redis_client.hset(redis_key, mapping=redis_data)
+            index_video_key(self.redis_client, username, video_id)
 
             # Add to user's video list
-            user_videos_key = f"user_videos:{username}"
-            self.redis_client.sadd(user_videos_key, video_id)
+            self.redis_client.sadd(user_videos_key(username), video_id)
 
             # Add username to all_usernames set
-            self.redis_client.sadd("all_usernames", username)
+            add_usernames(self.redis_client, [username])
 
             # Add to global video list
             self.redis_client.sadd("all_videos", video_id)
 
-            # Add to sorted set by date
-            # if "date" in video_data:
-            #     timestamp = self.parse_date_string(video_data["date"])
-            #     self.redis_client.zadd("videos_by_date", {video_id: timestamp})
-            # Use date field as primary source
-            timestamp = None
-            if "date" in video_data:
-                timestamp = self.parse_date_string(video_data["date"])
-
-            if not timestamp and "author" in video_data:
-                timestamp = self.parse_date_string(video_data["author"])
-
-            # Fallback to scrape_time only if date is missing
-            if not timestamp and "scrape_time" in video_data:
-                try:
-                    timestamp = datetime.strptime(
-                        video_data["scrape_time"], "%Y-%m-%d %H:%M:%S"
-                    ).timestamp()
-                except:
-                    pass
-
-            # Last resort: current time
-            if not timestamp:
-                timestamp = time.time()
-
-            self.redis_client.zadd("videos_by_date", {video_id: timestamp})
-
             # Update tags index
             if "tags" in video_data:
-                for tag in video_data["tags"]:
-                    self.redis_client.sadd(f"tag:{tag}", video_id)
-                    self.redis_client.sadd("all_tags", tag)
+                update_tag_index(
+                    self.redis_client, video_id, old_tags, video_data["tags"]
+                )
+
+            # Update the search token index and the card from the stored hash
+            stored = self.redis_client.hgetall(redis_key)
+            index_video(self.redis_client, video_id, stored)
+            record_metadata_change(self.redis_client, video_id)
+            store_card(self.redis_client, stored)
+
+            # Add to sorted set by date, unless the video was deleted or its
+            # file is missing
+            if is_visible(stored):
+                add_to_date_index(
+                    self.redis_client, username, video_id, redis_data["published_ts"]
+                )
 
             logger.info(f"Successfully updated metadata for video {video_id}")
 
@@ -272,36 +295,46 @@ class MetadataService:
         video_id = video_data.get("video_id", "unknown")
 
         try:
-            # Mark as processing
-            self.redis_client.sadd(self.PROCESSING_SET, video_id)
-
-            # Original processing code here...
-            chrome_options = self.setup_chrome_options()
-            service = webdriver.ChromeService(executable_path="/usr/bin/chromedriver")
-            driver = webdriver.Chrome(options=chrome_options, service=service)
-
-            try:
-                url = video_data["url"]
-                driver.get(url)
-                time.sleep(2)
-
-                html_content = driver.page_source
+            started = time.perf_counter()
+            timings = dict.fromkeys(TIMING_FIELDS, 0.0)
+            self.rate_limit.acquire()
+            timings["wait"] = time.perf_counter() - started
+
+            metadata, pages = None, None
+            if self.http:
+                fetched = time.perf_counter()
+                try:
+                    html_content = self.http.fetch(video_data["url"])
+                except httpx.HTTPError as e:
+                    # Blocked or failed fetches may still render in a browser
+                    logger.warning(f"Fetching {video_id} failed, using a browser: {e}")
+                    timings["page"] += time.perf_counter() - fetched
+                else:
+                    parsed = time.perf_counter()
+                    metadata = extract_embedded_metadata(html_content)
+                    timings["page"] += parsed - fetched
+                    timings["extract"] += time.perf_counter() - parsed
+                    if metadata is None:
+                        logger.info(f"No embedded data for {video_id}, using a browser")
+
+            if metadata is None:
+                html_content, pages = self.render_page(video_data["url"], timings)
+                parsed = time.perf_counter()
                 metadata = self.extract_metadata(html_content)
-                video_data.update(metadata)
-                video_data["metadata_collection_time"] = time.strftime(
-                    "%Y-%m-%d %H:%M:%S"
-                )
+                timings["extract"] += time.perf_counter() - parsed
 
-                # Update metadata and queue for download
-                self.update_metadata(video_data)
-                self.redis_client.rpush(DOWNLOAD_QUEUE_KEY, json.dumps(video_data))
-                logger.info(f"Successfully processed video {video_id}")
+            if SNAPSHOT_PAGES:
+                self.snapshot(video_data, html_content)
 
-                # Remove from processing set on success
-                self.redis_client.srem(self.PROCESSING_SET, video_id)
+            video_data.update(metadata)
+            video_data["metadata_collection_time"] = time.strftime("%Y-%m-%d %H:%M:%S")
 
-            finally:
-                driver.quit()
+            # Update metadata and queue for download
+            self.update_metadata(video_data)
+            enqueue(self.redis_client, DOWNLOAD_QUEUE_KEY, video_data)
+            logger.info(f"Successfully processed video {video_id}")
+            timings["total"] = time.perf_counter() - started
+            self.record_timings(video_id, pages, timings)
 
         except Exception as e:
             logger.error(f"Error processing video {video_id}: {e}")
@@ -314,7 +347,7 @@ class MetadataService:
                 logger.info(
                     f"Requeueing video {video_id} for retry {retry_count}/{self.max_retries}"
                 )
-                self.redis_client.rpush(QUEUE_KEY, json.dumps(video_data))
+                enqueue(self.redis_client, QUEUE_KEY, video_data)
             else:
                 # Move to failed queue
                 logger.error(
@@ -322,8 +355,44 @@ class MetadataService:
                 )
                 self.redis_client.rpush(self.FAILED_QUEUE, json.dumps(video_data))
 
-            # Remove from processing set
-            self.redis_client.srem(self.PROCESSING_SET, video_id)
+    def snapshot(self, video_data: Dict, html_content: str):
+        """Keep the page HTML for reextract; failures only log a warning."""
+        try:
+            store_snapshot(
+                self.redis_client,
+                video_data["username"],
+                video_data["video_id"],
+                html_content,
+            )
+        except Exception as e:
+            logger.warning(
+                f"Error saving snapshot for {video_data.get('video_id')}: {e}"
+            )
+
+    def record_timings(self, video_id: str, pages: int, timings: Dict[str, float]):
+        """Log a video's timings and add them to the metadata_timings totals.
+
+        ``pages`` is the browser's page count, or None if no browser was used.
+        """
+        via = f"browser page {pages}" if pages else "http"
+        logger.info(
+            f"Timings for {video_id} via {via}: "
+            + ", ".join(
+                f"{name} {seconds * 1000:.0f} ms" for name, seconds in timings.items()
+            )
+        )
+        try:
+            record_timings(
+                self.redis_client,
+                timings,
+                timings["startup"] > 0,
+                "browser" if pages else "http",
+            )
+            stats = timing_stats(self.redis_client)
+            if stats["videos"] % TIMING_LOG_INTERVAL == 0:
+                logger.info(f"Metadata timings so far: {stats}")
+        except Exception as e:
+            logger.warning(f"Error recording timings for {video_id}: {e}")
 
     def retry_failed_videos(self):
         """Retry videos from the failed queue."""
@@ -335,27 +404,74 @@ class MetadataService:
             video_data = json.loads(failed_video)
             video_data["retry_count"] = 0  # Reset retry count
             logger.info(f"Retrying failed video {video_data.get('video_id')}")
-            self.redis_client.rpush(QUEUE_KEY, json.dumps(video_data))
+            enqueue(self.redis_client, QUEUE_KEY, video_data)
 
     def run(self):
-        """Main service loop."""
-        logger.info("Metadata Service started")
+        """Main service loop; returns once a stop signal has been handled."""
+        logger.info(
+            f"Metadata Service started with {self.workers} workers fetching "
+            f"pages via {METADATA_FETCHER}, "
+            f"up to {self.browsers.size} browsers (each replaced after "
+            f"{self.browsers.max_pages} pages) and {METADATA_RATE or 'unlimited'} "
+            f"pages/s"
+        )
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
 
-        while True:
-            try:
-                # Get next video from queue
-                video_data = redis_client.lpop(QUEUE_KEY)
-                if video_data:
-                    video_data = json.loads(video_data)
-                    logger.info(f"Processing video: {video_data.get('video_id')}")
-                    self.process_video(video_data)
-                else:
-                    # No videos in queue, wait before checking again
-                    time.sleep(5)
+        threads = [
+            threading.Thread(
+                target=self.work, args=(index,), name=f"metadata-worker-{index}"
+            )
+            for index in range(self.workers)
+        ]
+        for thread in threads:
+            thread.start()
 
-            except Exception as e:
-                logger.error(f"Error in main loop: {e}")
-                time.sleep(5)
+        try:
+            # Join with a timeout so the main thread keeps handling signals
+            while any(thread.is_alive() for thread in threads):
+                for thread in threads:
+                    thread.join(timeout=1)
+        finally:
+            self.browsers.close()
+            if self.http:
+                self.http.close()
+            logger.info(f"Metadata Service stopped after {self.processed} videos")
+
+    def stop(self, signum=None, frame=None):
+        """Ask the workers to exit once their current video is done."""
+        if self.stopping.is_set():
+            return
+        self.stopping.set()
+        with self.lock:
+            in_flight = sorted(self.in_flight)
+        logger.info(
+            f"Stopping; waiting for {len(in_flight)} videos in flight: {in_flight}"
+        )
+
+    def work(self, index: int):
+        """Worker loop: hand queued videos to the pooled browsers until stopped."""
+        QueueWorker(
+            self.redis_client,
+            QUEUE_KEY,
+            f"metadata-{index}",
+            self.handle_job,
+            self.stopping,
+            max_job_seconds=METADATA_JOB_TIMEOUT,
+        ).run()
+
+    def handle_job(self, video_data: Dict):
+        """Process one queued video, tracking it as in flight."""
+        video_id = video_data.get("video_id")
+        logger.info(f"Processing video: {video_id}")
+        with self.lock:
+            self.in_flight[video_id] = time.time()
+        try:
+            self.process_video(video_data)
+        finally:
+            with self.lock:
+                self.in_flight.pop(video_id, None)
+                self.processed += 1
 
     def get_metadata(self, username: str, video_id: str) -> Dict:
         """Retrieve video metadata from Redis."""
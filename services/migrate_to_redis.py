@@ -4,8 +4,20 @@ import redis
 import logging
 from typing import Dict, Set
 import os
+import sys
 from tqdm import tqdm
 
+# Make the repo root importable when run as `python services/migrate_to_redis.py`
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from services.dates import published_timestamp
+from services.redis_helpers import (
+    index_video_key,
+    metadata_key,
+    record_metadata_change,
+    update_tag_index,
+)
+
 # Setup logging
 logging.basicConfig(
     level=logging.INFO,
@@ -81,12 +93,15 @@ class MetadataMigration:
                                 value
                             )  # Convert all values to strings
 
-                    # Add username to the data
+                    # Add username and the parsed publish time to the data
                     processed_data["username"] = username
+                    processed_data["published_ts"] = published_timestamp(processed_data)
 
                     # Store in Redis
-                    redis_key = f"metadata:{username}:{video_id}"
+                    redis_key = metadata_key(username, video_id)
                     self.redis_client.hset(redis_key, mapping=processed_data)
+                    index_video_key(self.redis_client, username, video_id)
+                    record_metadata_change(self.redis_client, video_id)
 
                     # Add to sets
                     self.redis_client.sadd("all_videos", video_id)
@@ -105,13 +120,16 @@ class MetadataMigration:
                         tags = video_data["hashtags"]
 
                     if tags:
+                        tag_names = []
                         for tag in tags:
                             if isinstance(tag, dict) and "name" in tag:
                                 tag = tag["name"]
                             tag = str(tag).lower().strip()  # Normalize tags
                             if tag:  # Only add non-empty tags
-                                self.redis_client.sadd(f"tag:{tag}", video_id)
-                                self.redis_client.sadd("all_tags", tag)
+                                tag_names.append(tag)
+
+                        # Tag sets, tag_counts and all_tags
+                        update_tag_index(self.redis_client, video_id, [], tag_names)
 
                     success_count += 1
 
@@ -0,0 +1,69 @@
+"""Fetch video pages over plain HTTP instead of rendering them in Chromium.
+
+The page's embedded JSON carries everything the metadata service needs, and
+it is served in the initial HTML, so a pooled keep-alive HTTP/2 client can
+replace the browser for most videos. The metadata service falls back to the
+browser for pages that fail to fetch or lack the embedded data.
+"""
+
+import logging
+import os
+from urllib.parse import urlsplit, urlunsplit
+
+import httpx
+
+logger = logging.getLogger("page_fetch")
+
+# "browser" renders every page in Chromium; "http" fetches pages directly and
+# only uses the browser when a fetch fails or a page lacks its embedded data
+METADATA_FETCHER = os.getenv("METADATA_FETCHER", "browser")
+
+# Send requests here instead of to the URL's host, e.g. the fixture server in
+# scripts/replay_pages.py
+METADATA_HTTP_BASE = os.getenv("METADATA_HTTP_BASE", "")
+
+HTTP_TIMEOUT = float(os.getenv("METADATA_HTTP_TIMEOUT", "15"))
+
+HEADERS = {
+    "User-Agent": (
+        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+        "(KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+    ),
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+    "Accept-Language": "en-US,en;q=0.9",
+}
+
+
+class HttpFetcher:
+    def __init__(self, connections: int = 1, base_url: str = None):
+        """Pool up to ``connections`` keep-alive connections per host."""
+        self.base_url = METADATA_HTTP_BASE if base_url is None else base_url
+        # httpx negotiates gzip/deflate (and br/zstd when their packages are
+        # installed) and decompresses transparently
+        self.client = httpx.Client(
+            http2=True,
+            headers=HEADERS,
+            timeout=HTTP_TIMEOUT,
+            follow_redirects=True,
+            limits=httpx.Limits(
+                max_connections=connections,
+                max_keepalive_connections=connections,
+            ),
+        )
+
+    def resolve(self, url: str) -> str:
+        """Point a URL at base_url, keeping its path and query."""
+        if not self.base_url:
+            return url
+        base = urlsplit(self.base_url)
+        parts = urlsplit(url)
+        return urlunsplit((base.scheme, base.netloc, parts.path, parts.query, ""))
+
+    def fetch(self, url: str) -> str:
+        """Return a page's HTML; raises httpx.HTTPError on failure."""
+        response = self.client.get(self.resolve(url))
+        response.raise_for_status()
+        return response.text
+
+    def close(self):
+        self.client.close()
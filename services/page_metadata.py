@@ -0,0 +1,229 @@
+"""Extract video metadata from a TikTok video page's HTML.
+
+Pages carry their data as JSON in a hydration <script> tag. That blob is
+found with plain string searches and only it is decoded, which is much
+faster than parsing the whole document and doesn't depend on generated CSS
+class names. Pages without it (older layouts, error pages) fall back to
+walking the DOM with BeautifulSoup.
+"""
+
+import html
+import json
+import re
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from bs4 import BeautifulSoup
+
+# Script tags holding the page state, newest layout first
+EMBEDDED_SCRIPT_IDS = ("__UNIVERSAL_DATA_FOR_REHYDRATION__", "SIGI_STATE")
+
+# Fields extract_metadata() can fill in, for coverage reports
+METADATA_FIELDS = (
+    "author",
+    "date",
+    "description",
+    "tags",
+    "music",
+    "v2t_title",
+    "v2t_desc",
+)
+
+TAG_PATTERN = re.compile(r"<[^>]+>")
+
+
+def hashtags_in(description: str) -> List[str]:
+    """Extract hashtags from description text."""
+    if not description:
+        return []
+
+    tags = []
+    parts = description.split()
+
+    for part in parts:
+        if part.startswith("#"):
+            hashtags = [tag.lower() for tag in part.split("#") if tag]
+            tags.extend(hashtags)
+        elif "#" in part:
+            hashtags = [tag.lower() for tag in part.split("#")[1:] if tag]
+            tags.extend(hashtags)
+
+    return list(set(tags))
+
+
+def find_embedded_state(html_content) -> Optional[Dict]:
+    """Decode the page's hydration JSON, or None if there is none.
+
+    Accepts str or bytes; the script tag is located with find() so the rest
+    of the document is never parsed.
+    """
+    is_bytes = isinstance(html_content, bytes)
+    for script_id in EMBEDDED_SCRIPT_IDS:
+        marker = f'id="{script_id}"'
+        close = "</script>"
+        if is_bytes:
+            marker, close = marker.encode(), close.encode()
+
+        position = html_content.find(marker)
+        if position == -1:
+            continue
+        start = html_content.find(b">" if is_bytes else ">", position) + 1
+        end = html_content.find(close, start)
+        if start == 0 or end == -1:
+            continue
+
+        try:
+            return json.loads(html_content[start:end])
+        except ValueError:
+            continue
+    return None
+
+
+def item_from_state(state: Dict) -> Optional[Dict]:
+    """Return the video's item from either page state layout."""
+    try:
+        detail = state["__DEFAULT_SCOPE__"]["webapp.video-detail"]
+        return detail["itemInfo"]["itemStruct"]
+    except (KeyError, TypeError):
+        pass
+
+    items = state.get("ItemModule") if isinstance(state, dict) else None
+    if isinstance(items, dict) and items:
+        return next(iter(items.values()))
+    return None
+
+
+def element_text(html_content: str, data_e2e: str) -> Optional[str]:
+    """Text of the first <div data-e2e=...>, found without parsing the page."""
+    position = html_content.find(f'data-e2e="{data_e2e}"')
+    if position == -1:
+        return None
+    start = html_content.find(">", position) + 1
+    end = html_content.find("</div>", start)
+    if start == 0 or end == -1:
+        return None
+    text = html.unescape(TAG_PATTERN.sub("", html_content[start:end])).strip()
+    return text or None
+
+
+def extract_embedded_metadata(html_content) -> Optional[Dict]:
+    """Map the page's embedded item to the metadata fields.
+
+    Returns None when the page has no usable embedded data, so the caller
+    can fall back to the DOM. ``create_time`` is the exact publish time in
+    seconds; ``date`` is derived from it in the format the pages show.
+    """
+    state = find_embedded_state(html_content)
+    item = item_from_state(state) if state else None
+    if not item or not item.get("id"):
+        return None
+
+    metadata = {}
+
+    author = item.get("author")
+    if isinstance(author, dict):
+        metadata["author"] = author.get("nickname") or author.get("uniqueId", "")
+    else:
+        metadata["author"] = item.get("nickname") or author or ""
+
+    try:
+        create_time = int(item["createTime"])
+        metadata["create_time"] = create_time
+        metadata["date"] = datetime.fromtimestamp(create_time).strftime("%Y-%m-%d")
+    except (KeyError, TypeError, ValueError):
+        pass
+
+    description = (item.get("desc") or "").strip()
+    metadata["description"] = description
+
+    tags = [
+        extra["hashtagName"].lower()
+        for extra in item.get("textExtra") or []
+        if extra.get("hashtagName")
+    ]
+    tags.extend(
+        challenge["title"].lower()
+        for challenge in item.get("challenges") or []
+        if challenge.get("title")
+    )
+    tags.extend(hashtags_in(description))
+    metadata["tags"] = sorted(set(tags))
+
+    music = item.get("music") or {}
+    if music.get("title"):
+        metadata["music"] = " - ".join(
+            part for part in (music["title"], music.get("authorName")) if part
+        )
+
+    # The AI-generated summary isn't part of the item; read it from its div
+    if isinstance(html_content, bytes):
+        html_content = html_content.decode("utf-8", "replace")
+    for field, data_e2e in (("v2t_title", "v2t-title"), ("v2t_desc", "v2t-desc")):
+        text = element_text(html_content, data_e2e)
+        if text:
+            metadata[field] = text
+
+    return metadata
+
+
+def extract_dom_metadata(html_content: str) -> Dict:
+    """Extract metadata by walking the rendered DOM."""
+    soup = BeautifulSoup(html_content, "html.parser")
+    metadata = {}
+
+    # Extract the author and date
+    browser_nickname = soup.find("span", {"data-e2e": "browser-nickname"})
+    if browser_nickname:
+        # Get author from first child with class css-1xccqfx-SpanNickName
+        author_span = browser_nickname.find("span", class_="css-1xccqfx-SpanNickName")
+        if author_span:
+            metadata["author"] = author_span.get_text(strip=True)
+
+        # Get date from the third span child (no class)
+        date_spans = browser_nickname.find_all("span")
+        if len(date_spans) >= 3:
+            date_span = date_spans[2]  # Third span contains the date
+            metadata["date"] = date_span.get_text(strip=True)
+
+    # Extract video description and tags
+    desc_container = soup.find("h1", {"data-e2e": "browse-video-desc"})
+    if desc_container:
+        # Get description from spans with data-e2e="new-desc-span"
+        desc_spans = desc_container.find_all("span", {"data-e2e": "new-desc-span"})
+        description_text = " ".join(span.get_text(strip=True) for span in desc_spans)
+        metadata["description"] = description_text.strip()
+
+        # Get tags from links with data-e2e="search-common-link"
+        tag_links = desc_container.find_all("a", {"data-e2e": "search-common-link"})
+        metadata["tags"] = [
+            tag.get_text(strip=True).lower().strip("#") for tag in tag_links
+        ]
+
+        # Add any additional tags from description
+        metadata["tags"].extend(hashtags_in(metadata.get("description", "")))
+        metadata["tags"] = sorted(list(set(metadata["tags"])))  # Deduplicate and sort
+
+    # Extract music info
+    music_info = soup.find("h4", {"data-e2e": "browse-music"})
+    if music_info:
+        metadata["music"] = music_info.get_text(strip=True)
+
+    # Extract AI-generated title (v2t-title)
+    v2t_title = soup.find("div", {"data-e2e": "v2t-title"})
+    if v2t_title:
+        metadata["v2t_title"] = v2t_title.get_text(strip=True)
+
+    # Extract AI-generated description (v2t-desc)
+    v2t_desc = soup.find("div", {"data-e2e": "v2t-desc"})
+    if v2t_desc:
+        metadata["v2t_desc"] = v2t_desc.get_text(strip=True)
+
+    return metadata
+
+
+def extract_metadata(html_content: str) -> Dict:
+    """Extract metadata from the embedded JSON, falling back to the DOM."""
+    metadata = extract_embedded_metadata(html_content)
+    if metadata is None:
+        metadata = extract_dom_metadata(html_content)
+    return metadata
@@ -0,0 +1,93 @@
+import os
+from pathlib import Path
+from typing import Dict, Optional
+
+import cv2
+from PIL import Image
+
+from services.thumbnails import (
+    height_for,
+    letterbox,
+    read_frame_at,
+    save_atomic,
+    to_image,
+    video_duration_ms,
+)
+
+# Frames in a hover-scrub sprite sheet, laid out in a single row
+SPRITE_FRAMES = 10
+SPRITE_FRAME_WIDTH = 120
+SPRITE_QUALITY = 60
+
+# The animated preview loop reuses the sprite frames at this size and pace.
+# Set PREVIEW_LOOP=0 to skip it.
+PREVIEW_LOOP = os.getenv("PREVIEW_LOOP", "1") != "0"
+LOOP_FRAME_WIDTH = 240
+LOOP_FRAME_MS = 400
+LOOP_QUALITY = 50
+
+
+def sprite_path_for(video_path: Path) -> Path:
+    """Return where a video's hover-scrub sprite sheet is stored."""
+    return video_path.parent / f"{video_path.stem}_sprite.webp"
+
+
+def loop_path_for(video_path: Path) -> Path:
+    """Return where a video's animated preview loop is stored."""
+    return video_path.parent / f"{video_path.stem}_preview.webp"
+
+
+def render_previews(video_path: Path) -> Optional[Dict]:
+    """Write a video's sprite sheet and, optionally, its preview loop.
+
+    SPRITE_FRAMES evenly spaced frames are decoded by seeking, once each,
+    and both images are built from them. Returns None if the video can't
+    be seeked or decoded.
+
+    Returns:
+        dict: {"frames": frames in the sprite, "loop": whether a loop was made}
+    """
+    video_path = Path(video_path)
+    video = cv2.VideoCapture(str(video_path))
+    try:
+        duration = video_duration_ms(video)
+        if not duration:
+            return None
+
+        frames = []
+        for index in range(SPRITE_FRAMES):
+            frame = read_frame_at(video, duration * (index + 0.5) / SPRITE_FRAMES)
+            if frame is not None:
+                frames.append(to_image(frame))
+    finally:
+        video.release()
+
+    if not frames:
+        return None
+
+    frame_height = height_for(SPRITE_FRAME_WIDTH)
+    sheet = Image.new("RGB", (SPRITE_FRAME_WIDTH * len(frames), frame_height))
+    for index, frame in enumerate(frames):
+        sheet.paste(
+            letterbox(frame, SPRITE_FRAME_WIDTH, frame_height),
+            (index * SPRITE_FRAME_WIDTH, 0),
+        )
+    save_atomic(sheet, sprite_path_for(video_path), "WEBP", quality=SPRITE_QUALITY)
+
+    if PREVIEW_LOOP:
+        loop_frames = [
+            letterbox(frame, LOOP_FRAME_WIDTH, height_for(LOOP_FRAME_WIDTH))
+            for frame in frames
+        ]
+        save_atomic(
+            loop_frames[0],
+            loop_path_for(video_path),
+            "WEBP",
+            save_all=True,
+            append_images=loop_frames[1:],
+            duration=LOOP_FRAME_MS,
+            loop=0,
+            quality=LOOP_QUALITY,
+        )
+
+    return {"frames": len(frames), "loop": PREVIEW_LOOP}
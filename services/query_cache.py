@@ -0,0 +1,67 @@
+import hashlib
+import json
+import os
+from typing import Callable, Dict
+
+from services.redis_helpers import CATALOG_VERSION
+
+# Seconds a cached result lives; entries for older catalog versions are never
+# read again, so this only bounds how long they take up memory
+QUERY_CACHE_TTL = int(os.getenv("QUERY_CACHE_TTL", "300"))
+
+# Hash of hits/misses shared by every worker
+QUERY_CACHE_STATS = "query_cache_stats"
+
+
+def query_cache_key(version: str, query: Dict) -> str:
+    """Build the cache key for a normalized query at a catalog version."""
+    digest = hashlib.sha1(
+        json.dumps(query, sort_keys=True, separators=(",", ":")).encode()
+    ).hexdigest()
+    return f"query_cache:{version}:{digest}"
+
+
+def cached_query(redis_client, query: Dict, compute: Callable):
+    """Return compute()'s JSON-serializable result, cached per catalog version.
+
+    ``query`` must hold every argument that affects the result. Any write
+    that can change a listing bumps catalog_version, which changes the key,
+    so a stale result is never served.
+    """
+    version = redis_client.get(CATALOG_VERSION) or "0"
+    key = query_cache_key(version, query)
+
+    cached = redis_client.get(key)
+    if cached is not None:
+        redis_client.hincrby(QUERY_CACHE_STATS, "hits", 1)
+        return json.loads(cached)
+
+    result = compute()
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.set(key, json.dumps(result), ex=QUERY_CACHE_TTL)
+    pipe.hincrby(QUERY_CACHE_STATS, "misses", 1)
+    pipe.execute()
+    return result
+
+
+def query_cache_stats(redis_client) -> Dict:
+    """Return the hit/miss counters and the current catalog version."""
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.hgetall(QUERY_CACHE_STATS)
+    pipe.get(CATALOG_VERSION)
+    stats, version = pipe.execute()
+
+    hits = int(stats.get("hits", 0))
+    misses = int(stats.get("misses", 0))
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+        "catalog_version": int(version or 0),
+        "ttl": QUERY_CACHE_TTL,
+    }
+
+
+def reset_query_cache_stats(redis_client):
+    """Zero the hit/miss counters."""
+    redis_client.delete(QUERY_CACHE_STATS)
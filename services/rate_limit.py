@@ -0,0 +1,42 @@
+import threading
+import time
+
+
+class TokenBucket:
+    """Thread-safe token bucket allowing ``rate`` calls per second on average.
+
+    Up to ``burst`` unused tokens are saved, so that many calls can go
+    through at once after an idle spell. A rate of 0 disables the limit.
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.capacity = max(burst, 1)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """Take a token, sleeping until it is due.
+
+        Tokens are reserved in call order, so waiting callers are served
+        first come, first served.
+
+        Returns:
+            float: Seconds spent waiting
+        """
+        if self.rate <= 0:
+            return 0.0
+
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(
+                self.capacity, self.tokens + (now - self.updated) * self.rate
+            )
+            self.updated = now
+            self.tokens -= 1
+            delay = max(-self.tokens / self.rate, 0.0)
+
+        if delay:
+            time.sleep(delay)
+        return delay
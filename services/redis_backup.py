@@ -7,6 +7,22 @@ import os
 from tqdm import tqdm
 import gzip
 import shutil
+import sys
+
+# Make the repo root importable when run as `python services/redis_backup.py`
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from services.redis_helpers import (
+    bump_catalog_version,
+    rebuild_completion_index,
+    rebuild_tag_counts,
+    rebuild_tag_sets,
+    rebuild_user_date_index,
+    rebuild_video_key_index,
+)
+from services.search_index import rebuild_search_index
+from services.video_cards import drop_cards
+from services.worker_loop import held_raw_jobs
 
 # Setup logging
 logging.basicConfig(
@@ -62,13 +78,10 @@ class RedisBackupManager:
                     self.redis_client.lrange("download_failed_queue", 0, -1)
                 ),
             },
-            "processing": {
-                "metadata_processing": list(
-                    self.redis_client.smembers("metadata_processing")
-                ),
-                "download_processing": list(
-                    self.redis_client.smembers("download_processing")
-                ),
+            # Jobs workers had claimed, by the queue they were taken from
+            "held_jobs": {
+                queue: held_raw_jobs(self.redis_client, queue)
+                for queue in ("tiktok_video_queue", "video_download_queue")
             },
             "user_videos": {},
             "tag_videos": {},
@@ -120,7 +133,7 @@ class RedisBackupManager:
             backup_file: Path to backup file
             clear_existing: Whether to clear existing Redis data
             restore_failed: Whether to restore failed queues
-            restore_processing: Whether to restore processing sets
+            restore_processing: Whether to requeue jobs workers had claimed
         """
         backup_file = Path(backup_file)
         if not backup_file.exists():
@@ -152,6 +165,10 @@ class RedisBackupManager:
                 if data:  # Only restore if there's data
                     self.redis_client.hset(key, mapping=data)
 
+            # Rebuild the video key index from the restored metadata
+            indexed = rebuild_video_key_index(self.redis_client)
+            logger.info(f"Indexed {indexed} restored videos")
+
             # Restore sets
             for key, members in tqdm(
                 backup_data["sets"].items(), desc="Restoring sets"
@@ -176,6 +193,10 @@ class RedisBackupManager:
                             f"Restored sorted set {set_name} with {len(items)} items"
                         )
 
+                # Per-user date sets are derived from videos_by_date
+                users = rebuild_user_date_index(self.redis_client)
+                logger.info(f"Rebuilt date-sorted sets for {users} users")
+
             # Restore queues
             if "queues" in backup_data:
                 for queue_name, items in tqdm(
@@ -192,7 +213,19 @@ class RedisBackupManager:
                             f"Restored queue {queue_name} with {len(items)} items"
                         )
 
-            # Restore processing sets
+            # Claimed jobs go back on their queue; the claims were per worker
+            if restore_processing and "held_jobs" in backup_data:
+                for queue_name, items in backup_data["held_jobs"].items():
+                    if items:
+                        self.redis_client.rpush(queue_name, *items)
+                        logger.info(
+                            f"Requeued {len(items)} claimed jobs on {queue_name}"
+                        )
+            elif "held_jobs" in backup_data:
+                logger.info("Skipping claimed jobs as requested")
+
+            # Backups from before leased claims have processing sets instead;
+            # the services requeue their entries at startup
             if restore_processing and "processing" in backup_data:
                 for set_name, items in tqdm(
                     backup_data["processing"].items(), desc="Restoring processing sets"
@@ -219,12 +252,34 @@ class RedisBackupManager:
                 if members:
                     self.redis_client.sadd(key, *members)
 
+            self.rebuild_derived_indexes()
+
+            # Drop query results cached before the restore
+            bump_catalog_version(self.redis_client)
+
             logger.info("Restore completed successfully")
 
         except Exception as e:
             logger.error(f"Error during restore: {e}")
             raise
 
+    def rebuild_derived_indexes(self):
+        """Rebuild the indexes derived from the restored metadata hashes.
+
+        These are the same indexes scripts/rebuild_indexes.py rebuilds; the
+        backup doesn't carry them, or carries copies that may be stale.
+        """
+        tag_count = rebuild_tag_sets(self.redis_client)
+        logger.info(f"Rebuilt {tag_count} tag sets and deleted_videos")
+        tag_count = rebuild_tag_counts(self.redis_client)
+        logger.info(f"Counted {tag_count} tags")
+        token_count = rebuild_search_index(self.redis_client)
+        logger.info(f"Indexed {token_count} search tokens")
+        indexed = rebuild_completion_index(self.redis_client)
+        logger.info(f"Indexed {indexed} tags and usernames for completion")
+        dropped = drop_cards(self.redis_client)
+        logger.info(f"Dropped {dropped} cached video cards")
+
     def list_backups(self):
         """List all available backups."""
         backups = []
@@ -285,7 +340,8 @@ def main():
                         input("Restore failed queues? (y/n): ").lower() == "y"
                     )
                     restore_processing = (
-                        input("Restore processing sets? (y/n): ").lower() == "y"
+                        input("Requeue jobs that were in progress? (y/n): ").lower()
+                        == "y"
                     )
 
                     backup_manager.restore_backup(
@@ -1,33 +1,735 @@
+import base64
 import json
-from typing import List, Dict
+import uuid
+from typing import Dict, Iterable, List, Optional, Tuple
 import redis
 from pathlib import Path
 
+from services.dates import published_timestamp
+
+# Hash of video_id -> username, used to find a video's metadata key without
+# scanning the keyspace.
+VIDEO_KEY_INDEX = "video_key_index"
+
+# Sorted set of every visible video scored by publish time
+VIDEOS_BY_DATE = "videos_by_date"
+
+# Sorted sets (all scored 0) of "name\x00Name" entries keyed by the lowercased
+# name, used to complete tag and username prefixes with ZRANGEBYLEX
+TAGS_LEX = "tags_lex"
+USERNAMES_LEX = "usernames_lex"
+
+# Number of prefix matches ranked for each completion request
+MAX_COMPLETION_CANDIDATES = 500
+
+# Sorted set of tag -> number of non-deleted videos carrying it, and the set
+# of deleted video IDs it is kept consistent with
+TAG_COUNTS = "tag_counts"
+DELETED_VIDEOS = "deleted_videos"
+
+# Adds a video to the tag sets in KEYS[3..2+n] and removes it from the rest,
+# adjusting tag_counts only for memberships that actually changed and only
+# while the video isn't deleted. ARGV: video_id, n, then the tag names.
+TAG_UPDATE_SCRIPT = """
+local video_id = ARGV[1]
+local added = tonumber(ARGV[2])
+local counted = redis.call("SISMEMBER", KEYS[2], video_id) == 0
+for i = 3, #KEYS do
+    local tag = ARGV[i]
+    if i - 2 <= added then
+        if redis.call("SADD", KEYS[i], video_id) == 1 and counted then
+            redis.call("ZINCRBY", KEYS[1], 1, tag)
+        end
+    elseif redis.call("SREM", KEYS[i], video_id) == 1 and counted then
+        if tonumber(redis.call("ZINCRBY", KEYS[1], -1, tag)) <= 0 then
+            redis.call("ZREM", KEYS[1], tag)
+        end
+    end
+end
+"""
+
+# Moves a video into (ARGV[2] == "1") or out of deleted_videos and adjusts
+# tag_counts for every tag set in KEYS[3..] it belongs to.
+# ARGV: video_id, deleted flag, then the tag names.
+TAG_VISIBILITY_SCRIPT = """
+local video_id = ARGV[1]
+local changed
+if ARGV[2] == "1" then
+    changed = redis.call("SADD", KEYS[2], video_id)
+else
+    changed = redis.call("SREM", KEYS[2], video_id)
+end
+if changed == 0 then
+    return 0
+end
+local delta = ARGV[2] == "1" and -1 or 1
+for i = 3, #KEYS do
+    if redis.call("SISMEMBER", KEYS[i], video_id) == 1 then
+        if tonumber(redis.call("ZINCRBY", KEYS[1], delta, ARGV[i])) <= 0 then
+            redis.call("ZREM", KEYS[1], ARGV[i])
+        end
+    end
+end
+return 1
+"""
+
+# Counter bumped on every write that can change a listing, used to version
+# cached query results
+CATALOG_VERSION = "catalog_version"
+
+# Metadata fields that can change a listing, a filter or a search result
+LISTING_FIELDS = frozenset(
+    (
+        "tags",
+        "date",
+        "create_time",
+        "published_ts",
+        "deleted",
+        "file_missing",
+        "description",
+        "author",
+        "music",
+        "username",
+        "v2t_title",
+        "v2t_desc",
+    )
+)
+
+# Counter bumped on every metadata change, so a card rendered on read can tell
+# whether its hash changed meanwhile
+CARD_VERSION = "card_version"
+
+# Stream of video IDs whose metadata hash changed, followed by the SQLite
+# read replica. Trimmed approximately to the last METADATA_CHANGES_MAXLEN.
+METADATA_CHANGES = "metadata_changes"
+METADATA_CHANGES_MAXLEN = 100000
+
+
+def metadata_key(username: str, video_id: str) -> str:
+    """Build the Redis key holding a video's metadata hash."""
+    return f"metadata:{username}:{video_id}"
+
+
+def parse_metadata_key(key: str):
+    """Split a metadata key into (username, video_id), or None if malformed."""
+    parts = key.split(":", 2)
+    if len(parts) != 3 or parts[0] != "metadata":
+        return None
+    return parts[1], parts[2]
+
+
+def card_key(video_id: str) -> str:
+    """Build the key of a video's pre-rendered card JSON."""
+    return f"card:{video_id}"
+
+
+def user_date_key(username: str) -> str:
+    """Build the key of a user's date-sorted video set."""
+    return f"{VIDEOS_BY_DATE}:{username}"
+
+
+def tag_key(tag: str) -> str:
+    """Build the key of the set holding every video ID with a tag."""
+    return f"tag:{tag}"
+
+
+def user_videos_key(username: str) -> str:
+    """Build the key of the set holding every video ID of a user."""
+    return f"user_videos:{username}"
+
+
+def parse_tags(value) -> List[str]:
+    """Decode the JSON tag list stored in a metadata hash."""
+    if not value:
+        return []
+    if isinstance(value, list):
+        return value
+    try:
+        tags = json.loads(value)
+    except (json.JSONDecodeError, TypeError):
+        return []
+    return tags if isinstance(tags, list) else []
+
+
+def lex_member(name: str) -> str:
+    """Build the completion index entry for a tag or username."""
+    return f"{name.lower()}\x00{name}"
+
+
+def add_tags(redis_client, tags: Iterable[str]):
+    """Add tags to all_tags and the completion index. Works on pipelines too."""
+    tags = list(tags)
+    if tags:
+        redis_client.sadd("all_tags", *tags)
+        redis_client.zadd(TAGS_LEX, {lex_member(tag): 0 for tag in tags})
+
+
+def add_usernames(redis_client, usernames: Iterable[str]):
+    """Add usernames to all_usernames and the completion index."""
+    usernames = list(usernames)
+    if usernames and redis_client.sadd("all_usernames", *usernames):
+        redis_client.zadd(
+            USERNAMES_LEX, {lex_member(username): 0 for username in usernames}
+        )
+        bump_catalog_version(redis_client)
+
+
+def remove_username(redis_client, username: str):
+    """Remove a username from all_usernames and the completion index."""
+    redis_client.srem("all_usernames", username)
+    redis_client.zrem(USERNAMES_LEX, lex_member(username))
+    bump_catalog_version(redis_client)
+
+
+def complete_prefix(
+    redis_client, lex_key: str, prefix: str, limit: int = MAX_COMPLETION_CANDIDATES
+) -> List[str]:
+    """Return up to ``limit`` names in a completion index starting with prefix."""
+    prefix = prefix.lower().encode()
+    members = redis_client.zrangebylex(
+        lex_key, b"[" + prefix, b"[" + prefix + b"\xff", start=0, num=limit
+    )
+    return [member.split("\x00", 1)[-1] for member in members]
+
+
+def rank_by_count(redis_client, names: List[str], build_key) -> List[str]:
+    """Order names by the size of their build_key(name) set, largest first."""
+    pipe = redis_client.pipeline(transaction=False)
+    for name in names:
+        pipe.scard(build_key(name))
+    counts = pipe.execute()
+    ranked = sorted(zip(names, counts), key=lambda item: (-item[1], item[0]))
+    return [name for name, _ in ranked]
+
+
+def rank_by_score(redis_client, names: List[str], zset_key: str) -> List[str]:
+    """Order names by their score in a sorted set, highest first."""
+    if not names:
+        return []
+    scores = redis_client.zmscore(zset_key, names)
+    ranked = sorted(zip(names, scores), key=lambda item: (-(item[1] or 0), item[0]))
+    return [name for name, _ in ranked]
+
+
+def rebuild_completion_index(redis_client, batch_size: int = 1000) -> int:
+    """Rebuild the tag and username completion indexes from their sets.
+
+    Returns:
+        int: Number of tags and usernames indexed
+    """
+    indexed = 0
+    for source, lex_key in (("all_tags", TAGS_LEX), ("all_usernames", USERNAMES_LEX)):
+        names = list(redis_client.sscan_iter(source, count=batch_size))
+        pipe = redis_client.pipeline()
+        pipe.delete(lex_key)
+        for start in range(0, len(names), batch_size):
+            batch = names[start : start + batch_size]
+            pipe.zadd(lex_key, {lex_member(name): 0 for name in batch})
+        pipe.execute()
+        indexed += len(names)
+    return indexed
+
+
+def index_video_key(redis_client, username: str, video_id: str):
+    """Record which user a video belongs to in the video key index."""
+    redis_client.hset(VIDEO_KEY_INDEX, video_id, username)
+
+
+def bump_catalog_version(redis_client):
+    """Invalidate every cached query result. Works on pipelines too."""
+    redis_client.incr(CATALOG_VERSION)
+
+
+def record_metadata_change(redis_client, video_id: str, fields=None):
+    """Record that a video's metadata changed. Works on pipelines too.
+
+    Appends the video to the change feed, drops the video's cached card and
+    bumps card_version. catalog_version is bumped too unless ``fields``, the
+    names of the fields written, has none of LISTING_FIELDS: thumbnail and
+    preview updates only change the card.
+    """
+    if fields is None or LISTING_FIELDS.intersection(fields):
+        bump_catalog_version(redis_client)
+    redis_client.incr(CARD_VERSION)
+    redis_client.delete(card_key(video_id))
+    redis_client.xadd(
+        METADATA_CHANGES,
+        {"video_id": video_id},
+        maxlen=METADATA_CHANGES_MAXLEN,
+        approximate=True,
+    )
+
+
+def resolve_metadata_key(redis_client, video_id: str):
+    """Return the metadata key for a video ID, or None if it isn't indexed."""
+    username = redis_client.hget(VIDEO_KEY_INDEX, video_id)
+    if not username:
+        return None
+    return metadata_key(username, video_id)
+
+
+def rebuild_video_key_index(redis_client, batch_size: int = 1000) -> int:
+    """Rebuild the video key index from the metadata hashes using SCAN.
+
+    Returns:
+        int: Number of videos indexed
+    """
+    indexed = 0
+    pipe = redis_client.pipeline(transaction=False)
+
+    for key in redis_client.scan_iter("metadata:*", count=batch_size):
+        parsed = parse_metadata_key(key)
+        if not parsed:
+            continue
+
+        username, video_id = parsed
+        pipe.hset(VIDEO_KEY_INDEX, video_id, username)
+        indexed += 1
+
+        if indexed % batch_size == 0:
+            pipe.execute()
+
+    pipe.execute()
+    return indexed
+
+
+def fetch_video_hashes(redis_client, keys: List[str], batch_size: int = 1000):
+    """Fetch metadata hashes for a list of keys using pipelined HGETALLs.
+
+    Returns a list of dicts in the same order as ``keys``; keys that no
+    longer exist come back as empty dicts.
+    """
+    results = []
+    for start in range(0, len(keys), batch_size):
+        pipe = redis_client.pipeline(transaction=False)
+        for key in keys[start : start + batch_size]:
+            pipe.hgetall(key)
+        results.extend(pipe.execute())
+    return results
+
+
+def fetch_videos(redis_client, video_ids: List[str]) -> List[Dict]:
+    """Fetch the metadata hashes for a page of video IDs, preserving order.
+
+    Keys are resolved with a single HMGET against the video key index and the
+    hashes are then read in one pipeline, so a page costs two round trips
+    regardless of its size. Videos without metadata are skipped.
+    """
+    if not video_ids:
+        return []
+
+    usernames = redis_client.hmget(VIDEO_KEY_INDEX, video_ids)
+    keys = [
+        metadata_key(username, video_id)
+        for video_id, username in zip(video_ids, usernames)
+        if username
+    ]
+    return [data for data in fetch_video_hashes(redis_client, keys) if data]
+
+
+def add_to_date_index(redis_client, username: str, video_id: str, timestamp: float):
+    """Add a video to videos_by_date and its user's date-sorted set."""
+    pipe = redis_client.pipeline()
+    pipe.zadd(VIDEOS_BY_DATE, {video_id: timestamp})
+    pipe.zadd(user_date_key(username), {video_id: timestamp})
+    bump_catalog_version(pipe)
+    pipe.execute()
+
+
+def remove_from_date_index(redis_client, username: str, video_id: str):
+    """Remove a video from videos_by_date and its user's date-sorted set."""
+    pipe = redis_client.pipeline()
+    pipe.zrem(VIDEOS_BY_DATE, video_id)
+    if username:
+        pipe.zrem(user_date_key(username), video_id)
+    bump_catalog_version(pipe)
+    pipe.execute()
+
+
+def rebuild_user_date_index(redis_client, batch_size: int = 1000) -> int:
+    """Rebuild every videos_by_date:{username} set from videos_by_date.
+
+    Returns:
+        int: Number of users indexed
+    """
+    members_by_user: Dict[str, dict] = {}
+
+    entries = list(redis_client.zscan_iter(VIDEOS_BY_DATE, count=batch_size))
+    for start in range(0, len(entries), batch_size):
+        batch = entries[start : start + batch_size]
+        usernames = redis_client.hmget(
+            VIDEO_KEY_INDEX, [video_id for video_id, _ in batch]
+        )
+        for (video_id, score), username in zip(batch, usernames):
+            if username:
+                members_by_user.setdefault(username, {})[video_id] = score
+
+    stale_keys = [
+        key
+        for key in redis_client.scan_iter(f"{VIDEOS_BY_DATE}:*", count=batch_size)
+        if key[len(VIDEOS_BY_DATE) + 1 :] not in members_by_user
+    ]
+
+    pipe = redis_client.pipeline()
+    if stale_keys:
+        pipe.delete(*stale_keys)
+    for queued, (username, members) in enumerate(members_by_user.items(), 1):
+        pipe.delete(user_date_key(username))
+        pipe.zadd(user_date_key(username), members)
+        if queued % batch_size == 0:
+            pipe.execute()
+    pipe.execute()
+
+    return len(members_by_user)
+
+
+def backfill_published_ts(redis_client, batch_size: int = 1000) -> int:
+    """Recompute published_ts for every video and rescore the date indexes.
+
+    Videos are only rescored in sets they are already in (ZADD XX), so
+    deleted and missing videos stay out of the listings.
+
+    Returns:
+        int: Number of videos updated
+    """
+    updated = 0
+    keys = []
+
+    def flush():
+        pipe = redis_client.pipeline(transaction=False)
+        for key, video_data in zip(keys, fetch_video_hashes(redis_client, keys)):
+            if not video_data:
+                continue
+            username, video_id = parse_metadata_key(key)
+            timestamp = published_timestamp(video_data)
+            pipe.hset(key, "published_ts", timestamp)
+            pipe.zadd(VIDEOS_BY_DATE, {video_id: timestamp}, xx=True)
+            pipe.zadd(user_date_key(username), {video_id: timestamp}, xx=True)
+            record_metadata_change(pipe, video_id)
+        pipe.execute()
+        keys.clear()
+
+    for key in redis_client.scan_iter("metadata:*", count=batch_size):
+        if not parse_metadata_key(key):
+            continue
+        keys.append(key)
+        updated += 1
+        if len(keys) >= batch_size:
+            flush()
+    flush()
+
+    return updated
+
+
+def update_tag_index(
+    redis_client, video_id: str, old_tags: Iterable[str], new_tags: Iterable[str]
+):
+    """Move a video between tag:{tag} sets so they match its new tag list.
+
+    tag_counts is adjusted in the same Lua script, so it only changes for
+    memberships that were really added or removed.
+    """
+    old_tags, new_tags = set(old_tags), set(new_tags)
+    tags = list(new_tags) + list(old_tags - new_tags)
+    if tags:
+        redis_client.register_script(TAG_UPDATE_SCRIPT)(
+            keys=[TAG_COUNTS, DELETED_VIDEOS] + [tag_key(tag) for tag in tags],
+            args=[video_id, len(new_tags)] + tags,
+        )
+    add_tags(redis_client, new_tags)
+
+
+def set_video_deleted(redis_client, video_id: str, tags: Iterable[str], deleted=True):
+    """Record a video as deleted or restored and update tag_counts to match.
+
+    Returns:
+        bool: Whether the deleted state changed
+    """
+    tags = list(set(tags))
+    return bool(
+        redis_client.register_script(TAG_VISIBILITY_SCRIPT)(
+            keys=[TAG_COUNTS, DELETED_VIDEOS] + [tag_key(tag) for tag in tags],
+            args=[video_id, "1" if deleted else "0"] + tags,
+        )
+    )
+
+
+def rebuild_tag_counts(redis_client, batch_size: int = 1000) -> int:
+    """Reconcile tag_counts with the tag:{tag} sets and deleted_videos.
+
+    The counts are written to a temporary key and renamed over tag_counts,
+    so readers never see a partial leaderboard.
+
+    Returns:
+        int: Number of tags counted
+    """
+    tags = [
+        key[len("tag:") :] for key in redis_client.scan_iter("tag:*", count=batch_size)
+    ]
+    scratch_key = f"tmp:tag_counts:{uuid.uuid4().hex}"
+    counts = {}
+
+    for start in range(0, len(tags), batch_size):
+        batch = tags[start : start + batch_size]
+        pipe = redis_client.pipeline()
+        for tag in batch:
+            pipe.sdiffstore(scratch_key, [tag_key(tag), DELETED_VIDEOS])
+        pipe.delete(scratch_key)
+        counts.update(
+            (tag, count) for tag, count in zip(batch, pipe.execute()) if count
+        )
+
+    pipe = redis_client.pipeline()
+    pipe.delete(scratch_key)
+    items = list(counts.items())
+    for start in range(0, len(items), batch_size):
+        pipe.zadd(scratch_key, dict(items[start : start + batch_size]))
+    if counts:
+        pipe.rename(scratch_key, TAG_COUNTS)
+    else:
+        pipe.delete(TAG_COUNTS)
+    pipe.execute()
+
+    return len(counts)
+
+
+def encode_cursor(score: float, video_id: str) -> str:
+    """Build the opaque keyset cursor pointing just after a video."""
+    return base64.urlsafe_b64encode(f"{score!r}:{video_id}".encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[float, str]:
+    """Split a cursor from encode_cursor into (score, video_id).
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    try:
+        decoded = base64.urlsafe_b64decode(cursor.encode()).decode()
+        score, video_id = decoded.split(":", 1)
+        return float(score), video_id
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def queue_page(
+    pipe,
+    key: str,
+    start: int,
+    count: int,
+    descending: bool = True,
+    cursor: Optional[Tuple[float, str]] = None,
+) -> int:
+    """Queue the reads for one page of a date-sorted set on a pipeline.
+
+    Without a cursor the page is read by offset. With one, the members tied
+    on the cursor's score and the next ``count + 1`` members past it are
+    read with Z(REV)RANGEBYSCORE ... LIMIT, so the cost doesn't grow with
+    depth and earlier deletes don't shift the page. One extra member is
+    read to tell whether there is a next page.
+
+    Returns:
+        int: Number of commands queued; pass their results to read_page
+    """
+    if cursor is None:
+        if descending:
+            pipe.zrevrange(key, start, start + count, withscores=True)
+        else:
+            pipe.zrange(key, start, start + count, withscores=True)
+        return 1
+
+    score = repr(cursor[0])
+    if descending:
+        pipe.zrevrangebyscore(key, score, score, withscores=True)
+        pipe.zrevrangebyscore(
+            key, f"({score}", "-inf", start=0, num=count + 1, withscores=True
+        )
+    else:
+        pipe.zrangebyscore(key, score, score, withscores=True)
+        pipe.zrangebyscore(
+            key, f"({score}", "+inf", start=0, num=count + 1, withscores=True
+        )
+    return 2
+
+
+def read_page(
+    results: list,
+    count: int,
+    descending: bool = True,
+    cursor: Optional[Tuple[float, str]] = None,
+):
+    """Turn the results of queue_page into (video_ids, next_cursor).
+
+    next_cursor is None when there are no more videos after the page.
+    """
+    if cursor is None:
+        entries = results[0]
+    else:
+        # Members with equal scores are ordered by their bytes
+        ties, rest = results
+        last = cursor[1].encode()
+        entries = [
+            (member, score)
+            for member, score in ties
+            if (member.encode() < last if descending else member.encode() > last)
+        ] + rest
+
+    page = entries[:count]
+    next_cursor = None
+    if len(entries) > count and page:
+        video_id, score = page[-1]
+        next_cursor = encode_cursor(score, video_id)
+    return [video_id for video_id, _ in page], next_cursor
+
+
+def filter_video_ids(
+    redis_client,
+    tags: List[str],
+    filter_type: str = "and",
+    username: str = None,
+    start: int = 0,
+    count: int = 20,
+    descending: bool = True,
+    cursor: Optional[Tuple[float, str]] = None,
+):
+    """Run a tag/username filter entirely in Redis.
+
+    The tag sets are combined with SINTER (and) or SUNION (or/not), then
+    intersected with videos_by_date, or the user's own date-sorted set,
+    (weights 1/0) so the result keeps the publish-date scores. "not"
+    subtracts the tag union with ZDIFFSTORE. The temporary keys are created
+    and deleted inside one MULTI/EXEC. Pages are read by offset, or after
+    ``cursor`` (see queue_page).
+
+    Returns:
+        tuple[int, list, str]: (total matching videos, video IDs for the
+        page, cursor for the next page or None)
+    """
+    date_key = user_date_key(username) if username else VIDEOS_BY_DATE
+
+    # Without tags the date-sorted set can be paged directly
+    if not tags:
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.zcard(date_key)
+        queue_page(pipe, date_key, start, count, descending, cursor)
+        results = pipe.execute()
+        return (results[0], *read_page(results[1:], count, descending, cursor))
+
+    token = uuid.uuid4().hex
+    tags_key = f"tmp:filter:{token}:tags"
+    result_key = f"tmp:filter:{token}:result"
+
+    pipe = redis_client.pipeline()
+    tag_keys = [tag_key(tag) for tag in tags]
+    if filter_type == "and":
+        pipe.sinterstore(tags_key, tag_keys)
+    else:
+        pipe.sunionstore(tags_key, tag_keys)
+
+    if filter_type == "not":
+        pipe.zdiffstore(result_key, [date_key, tags_key])
+    else:
+        pipe.zinterstore(result_key, {date_key: 1, tags_key: 0})
+
+    pipe.zcard(result_key)
+    queued = queue_page(pipe, result_key, start, count, descending, cursor)
+    pipe.delete(tags_key, result_key)
+
+    results = pipe.execute()
+    page_results = results[-(queued + 1) : -1]
+    return (results[-(queued + 2)], *read_page(page_results, count, descending, cursor))
+
+
+def rebuild_tag_sets(redis_client, batch_size: int = 1000) -> int:
+    """Rebuild the tag:{tag}, user_videos:{username} and deleted_videos sets.
+
+    Run rebuild_tag_counts afterwards to bring tag_counts back in line.
+
+    Returns:
+        int: Number of tag sets written
+    """
+    tag_members: Dict[str, set] = {}
+    user_members: Dict[str, set] = {}
+    deleted = set()
+    misspelled = []
+
+    keys = list(redis_client.scan_iter("metadata:*", count=batch_size))
+    for key, video_data in zip(keys, fetch_video_hashes(redis_client, keys)):
+        parsed = parse_metadata_key(key)
+        if not parsed:
+            continue
+
+        username, video_id = parsed
+        user_members.setdefault(username, set()).add(video_id)
+        if str(video_data.get("deleted")).lower() == "true":
+            deleted.add(video_id)
+            # Older versions wrote "true", which the readers don't treat as
+            # deleted
+            if video_data["deleted"] != "True":
+                misspelled.append((key, video_id))
+        for tag in parse_tags(video_data.get("tags")):
+            tag_members.setdefault(tag, set()).add(video_id)
+
+    # Drop sets for tags that no video carries any more
+    stale_keys = [
+        key
+        for key in redis_client.scan_iter("tag:*", count=batch_size)
+        if key[len("tag:") :] not in tag_members
+    ]
+
+    # Each batch is replaced inside MULTI/EXEC so readers never see a set
+    # half-way through being rebuilt
+    pipe = redis_client.pipeline()
+    if stale_keys:
+        pipe.delete(*stale_keys)
+    add_tags(pipe, tag_members)
+    pipe.delete(DELETED_VIDEOS)
+    if deleted:
+        pipe.sadd(DELETED_VIDEOS, *deleted)
+    for key, video_id in misspelled:
+        pipe.hset(key, "deleted", "True")
+        record_metadata_change(pipe, video_id)
+
+    queued = 0
+    for members_by_name, build_key in (
+        (tag_members, tag_key),
+        (user_members, user_videos_key),
+    ):
+        for name, members in members_by_name.items():
+            pipe.delete(build_key(name))
+            pipe.sadd(build_key(name), *members)
+            queued += 1
+            if queued % batch_size == 0:
+                pipe.execute()
+    pipe.execute()
+
+    return len(tag_members)
+
 
 def get_all_videos(redis_client, username=None):
     """Get all videos for a user or all users."""
     if username:
-        video_ids = redis_client.smembers(f"user_videos:{username}")
+        video_ids = redis_client.smembers(user_videos_key(username))
     else:
         video_ids = redis_client.smembers("all_videos")
 
     videos = []
     for video_id in video_ids:
-        for key in redis_client.scan_iter(f"metadata:*:{video_id}"):
-            video_data = redis_client.hgetall(key)
-            videos.append(video_data)
+        key = resolve_metadata_key(redis_client, video_id)
+        if key:
+            videos.append(redis_client.hgetall(key))
 
     return videos
 
 
 def get_videos_by_tag(redis_client, tag):
     """Get all videos with a specific tag."""
-    video_ids = redis_client.smembers(f"tag:{tag}")
+    video_ids = redis_client.smembers(tag_key(tag))
     videos = []
     for video_id in video_ids:
-        for key in redis_client.scan_iter(f"metadata:*:{video_id}"):
-            video_data = redis_client.hgetall(key)
-            videos.append(video_data)
+        key = resolve_metadata_key(redis_client, video_id)
+        if key:
+            videos.append(redis_client.hgetall(key))
     return videos
 
 
@@ -79,22 +781,19 @@ def delete_videos(redis_client, videos_to_delete: List[Dict]) -> List[Dict]:
             continue
 
         try:
-            # Mark as deleted in Redis
-            redis_key = f"metadata:{username}:{video_id}"
+            # Mark as deleted in Redis the same way as the web app: the video
+            # stays in its tag sets, so it can be restored, but leaves
+            # tag_counts and the date-sorted sets
+            redis_key = metadata_key(username, video_id)
             if redis_client.exists(redis_key):
-                redis_client.hset(redis_key, "deleted", "true")
-
-                # Remove from active sets
-                redis_client.srem("all_videos", video_id)
-                redis_client.srem(f"user_videos:{username}", video_id)
-                redis_client.sadd("deleted_videos", video_id)
-
-                # Remove from tag sets
-                tags = redis_client.hget(redis_key, "tags")
-                if tags:
-                    tags = json.loads(tags)
-                    for tag in tags:
-                        redis_client.srem(f"tag:{tag}", video_id)
+                redis_client.hset(redis_key, "deleted", "True")
+                set_video_deleted(
+                    redis_client,
+                    video_id,
+                    parse_tags(redis_client.hget(redis_key, "tags")),
+                )
+                record_metadata_change(redis_client, video_id)
+                remove_from_date_index(redis_client, username, video_id)
 
                 # Delete physical files
                 success, error = delete_video_files(video_path, thumbnail_path)
@@ -140,7 +839,8 @@ def add_tags_to_videos(redis_client, video_ids: List[str], new_tag: str) -> bool
 
         for video_id in video_ids:
             # Find the video in Redis
-            for key in redis_client.scan_iter(f"metadata:*:{video_id}"):
+            key = resolve_metadata_key(redis_client, video_id)
+            if key:
                 # Get existing tags
                 tags = redis_client.hget(key, "tags")
                 if tags:
@@ -153,9 +853,9 @@ def add_tags_to_videos(redis_client, video_ids: List[str], new_tag: str) -> bool
                     tags.append(new_tag)
                     # Update tags in Redis
                     redis_client.hset(key, "tags", json.dumps(tags))
-                    # Add to tag set
-                    redis_client.sadd(f"tag:{new_tag}", video_id)
-                    redis_client.sadd("all_tags", new_tag)
+                    record_metadata_change(redis_client, video_id)
+                    # Add to tag set, tag_counts and all_tags
+                    update_tag_index(redis_client, video_id, [], [new_tag])
 
         return True
 
@@ -0,0 +1,314 @@
+import logging
+import re
+import uuid
+from typing import Dict, List, Optional, Set, Tuple
+
+from services.redis_helpers import (
+    VIDEOS_BY_DATE,
+    fetch_video_hashes,
+    parse_metadata_key,
+    parse_tags,
+    queue_page,
+    read_page,
+    user_videos_key,
+)
+
+logger = logging.getLogger(__name__)
+
+# Metadata fields whose words are searchable, alongside the tags
+TEXT_FIELDS = (
+    "description",
+    "author",
+    "music",
+    "username",
+    "v2t_title",
+    "v2t_desc",
+)
+
+# Sorted set of every indexed token (all scored 0) for prefix lookups
+SEARCH_TOKENS = "search:tokens"
+
+# Upper bound on the tokens a single prefix may expand to
+MAX_PREFIX_EXPANSION = 1000
+
+# Shorter words are matched as whole tokens only; as prefixes they would
+# expand to more than MAX_PREFIX_EXPANSION tokens on any real index
+MIN_PREFIX_LENGTH = 3
+
+TOKEN_PATTERN = re.compile(r"\w+")
+MAX_TOKEN_LENGTH = 64
+
+
+def search_token_key(token: str) -> str:
+    """Return the key of the set of video IDs containing a token."""
+    return f"search:token:{token}"
+
+
+def search_doc_key(video_id: str) -> str:
+    """Return the key of the set of tokens indexed for a video."""
+    return f"search:doc:{video_id}"
+
+
+def tokenize(text: str) -> List[str]:
+    """Split text into lowercase word tokens."""
+    if not text:
+        return []
+    return [
+        token
+        for token in TOKEN_PATTERN.findall(str(text).lower())
+        if len(token) <= MAX_TOKEN_LENGTH
+    ]
+
+
+def video_tokens(video_data: Dict) -> Set[str]:
+    """Collect the searchable tokens of a video's metadata hash."""
+    tokens = set()
+    for field in TEXT_FIELDS:
+        tokens.update(tokenize(video_data.get(field)))
+    for tag in parse_tags(video_data.get("tags")):
+        tokens.update(tokenize(tag))
+    return tokens
+
+
+def index_video(redis_client, video_id: str, video_data: Dict):
+    """Bring a video's entries in the token index in line with its metadata.
+
+    ``video_data`` should be the full metadata hash, not just the fields
+    that changed, since tokens missing from it are removed.
+    """
+    new_tokens = video_tokens(video_data)
+    old_tokens = set(redis_client.smembers(search_doc_key(video_id)))
+
+    pipe = redis_client.pipeline(transaction=False)
+    for token in new_tokens - old_tokens:
+        pipe.sadd(search_token_key(token), video_id)
+    for token in old_tokens - new_tokens:
+        pipe.srem(search_token_key(token), video_id)
+    if new_tokens:
+        pipe.zadd(SEARCH_TOKENS, {token: 0 for token in new_tokens})
+    pipe.delete(search_doc_key(video_id))
+    if new_tokens:
+        pipe.sadd(search_doc_key(video_id), *new_tokens)
+    pipe.execute()
+
+
+def rebuild_search_index(redis_client, batch_size: int = 1000) -> int:
+    """Rebuild the token index from the metadata hashes using SCAN.
+
+    Returns:
+        int: Number of distinct tokens indexed
+    """
+    token_members: Dict[str, set] = {}
+    doc_tokens: Dict[str, set] = {}
+
+    keys = list(redis_client.scan_iter("metadata:*", count=batch_size))
+    for key, video_data in zip(keys, fetch_video_hashes(redis_client, keys)):
+        parsed = parse_metadata_key(key)
+        if not parsed or not video_data:
+            continue
+
+        video_id = parsed[1]
+        tokens = video_tokens(video_data)
+        doc_tokens[video_id] = tokens
+        for token in tokens:
+            token_members.setdefault(token, set()).add(video_id)
+
+    stale_keys = list(redis_client.scan_iter("search:*", count=batch_size))
+    for start in range(0, len(stale_keys), batch_size):
+        redis_client.delete(*stale_keys[start : start + batch_size])
+
+    pipe = redis_client.pipeline(transaction=False)
+    queued = 0
+    for members_by_name, build_key in (
+        (token_members, search_token_key),
+        (doc_tokens, search_doc_key),
+    ):
+        for name, members in members_by_name.items():
+            if members:
+                pipe.sadd(build_key(name), *members)
+            queued += 1
+            if queued % batch_size == 0:
+                pipe.execute()
+
+    tokens = list(token_members)
+    for start in range(0, len(tokens), batch_size):
+        pipe.zadd(
+            SEARCH_TOKENS, {token: 0 for token in tokens[start : start + batch_size]}
+        )
+    pipe.execute()
+
+    return len(token_members)
+
+
+def parse_query(query: str):
+    """Split a search query into its terms and operators.
+
+    ``@user`` restricts results to matching usernames, ``!@user`` excludes
+    them and ``!term`` excludes videos matching the term.
+
+    Returns:
+        tuple: (include_terms, exclude_terms, include_usernames, exclude_usernames)
+    """
+    include_terms = []
+    exclude_terms = []
+    include_usernames = []
+    exclude_usernames = []
+
+    for term in query.lower().split():
+        if term.startswith("!@"):
+            exclude_usernames.append(term[2:])
+        elif term.startswith("!"):
+            exclude_terms.append(term[1:])
+        elif term.startswith("@"):
+            include_usernames.append(term[1:])
+        else:
+            include_terms.append(term)
+
+    return include_terms, exclude_terms, include_usernames, exclude_usernames
+
+
+def search_video_ids(
+    redis_client,
+    query: str,
+    start: int = 0,
+    count: int = 20,
+    cursor: Optional[Tuple[float, str]] = None,
+):
+    """Search the token index and return a page of video IDs, newest first.
+
+    Every word of a term is matched as a prefix of the indexed tokens
+    (whole tokens only under MIN_PREFIX_LENGTH characters), and a video
+    must match all include terms and none of the exclude terms.
+    Usernames are matched as substrings of the all_usernames set. The
+    matching IDs are intersected with videos_by_date inside one MULTI/EXEC
+    so only the requested page comes back, already in date order. Pages
+    are read by offset, or after ``cursor`` (see queue_page).
+
+    Returns:
+        tuple[int, list, str]: (total matching videos, video IDs for the
+        page, cursor for the next page or None)
+    """
+    include_terms, exclude_terms, include_usernames, exclude_usernames = parse_query(
+        query
+    )
+    include_words = [tokenize(term) for term in include_terms]
+    exclude_words = [tokenize(term) for term in exclude_terms]
+    words = sorted({word for term in include_words + exclude_words for word in term})
+
+    # Without any terms the date-sorted set can be paged directly
+    if not (words or include_usernames or exclude_usernames):
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.zcard(VIDEOS_BY_DATE)
+        queue_page(pipe, VIDEOS_BY_DATE, start, count, cursor=cursor)
+        results = pipe.execute()
+        return (results[0], *read_page(results[1:], count, cursor=cursor))
+
+    # Expand every word to the indexed tokens it prefixes
+    pipe = redis_client.pipeline(transaction=False)
+    for word in words:
+        end = b"\xff" if len(word) >= MIN_PREFIX_LENGTH else b""
+        pipe.zrangebylex(
+            SEARCH_TOKENS,
+            b"[" + word.encode(),
+            b"[" + word.encode() + end,
+            start=0,
+            num=MAX_PREFIX_EXPANSION,
+        )
+    if include_usernames or exclude_usernames:
+        pipe.smembers("all_usernames")
+    results = pipe.execute()
+
+    expansions = dict(zip(words, results))
+    for word, expanded in expansions.items():
+        if len(expanded) >= MAX_PREFIX_EXPANSION:
+            logger.warning(
+                f"Search prefix {word!r} matches over {MAX_PREFIX_EXPANSION} "
+                "tokens; only the first are searched"
+            )
+    usernames = results[-1] if include_usernames or exclude_usernames else set()
+
+    def matching_user_keys(patterns):
+        return [
+            user_videos_key(username)
+            for username in usernames
+            if any(pattern in username.lower() for pattern in patterns)
+        ]
+
+    include_user_keys = matching_user_keys(include_usernames)
+    exclude_user_keys = matching_user_keys(exclude_usernames)
+
+    # An include term or username with no matches rules out every video
+    if any(not expansions[word] for term in include_words for word in term) or (
+        include_usernames and not include_user_keys
+    ):
+        return 0, [], None
+
+    # The set operations and the page read run in one MULTI/EXEC; the helpers
+    # below queue their commands on it
+    pipe = redis_client.pipeline()
+    token = uuid.uuid4().hex
+    temp_keys = []
+
+    def temp_key(name):
+        temp_keys.append(f"tmp:search:{token}:{name}")
+        return temp_keys[-1]
+
+    def combine(keys, name, store):
+        # Single keys are used as they are rather than copied
+        if len(keys) == 1:
+            return keys[0]
+        dest = temp_key(name)
+        store(dest, keys)
+        return dest
+
+    def term_key(term, name):
+        word_keys = [
+            combine(
+                [search_token_key(expanded) for expanded in expansions[word]],
+                f"{name}:{position}",
+                pipe.sunionstore,
+            )
+            for position, word in enumerate(term)
+        ]
+        return combine(word_keys, name, pipe.sinterstore)
+
+    include_keys = [
+        term_key(term, f"include:{position}")
+        for position, term in enumerate(include_words)
+        if term
+    ]
+    if include_user_keys:
+        include_keys.append(
+            combine(include_user_keys, "include:users", pipe.sunionstore)
+        )
+
+    exclude_keys = [
+        term_key(term, f"exclude:{position}")
+        for position, term in enumerate(exclude_words)
+        if term and all(expansions[word] for word in term)
+    ] + exclude_user_keys
+
+    if include_keys:
+        matches_key = combine(include_keys, "matches", pipe.sinterstore)
+        result_key = temp_key("result")
+        pipe.zinterstore(result_key, {VIDEOS_BY_DATE: 1, matches_key: 0})
+    else:
+        # Exclude-only queries subtract from the date index itself
+        result_key = VIDEOS_BY_DATE
+
+    if exclude_keys:
+        excluded_key = combine(exclude_keys, "excluded", pipe.sunionstore)
+        ranked_key = temp_key("ranked")
+        pipe.zdiffstore(ranked_key, [result_key, excluded_key])
+        result_key = ranked_key
+
+    pipe.zcard(result_key)
+    queued = queue_page(pipe, result_key, start, count, cursor=cursor)
+    if temp_keys:
+        pipe.delete(*temp_keys)
+
+    results = pipe.execute()
+    if temp_keys:
+        results = results[:-1]
+    page_results = results[-queued:]
+    return (results[-(queued + 1)], *read_page(page_results, count, cursor=cursor))
@@ -0,0 +1,280 @@
+"""Compressed snapshots of scraped video pages, for re-extraction.
+
+With SNAPSHOT_PAGES=1 the metadata service keeps the HTML each video's
+metadata was read from. Pages are compressed (zstd when the zstandard
+package is installed, gzip otherwise) and stored by content hash under
+``downloads/snapshots/``; the ``page_snapshots`` hash maps each video to
+its file. When the page layout changes, fix the extractor and run
+``reextract`` instead of scraping every video again: it re-runs the
+extraction over the snapshots in a process pool and writes back only the
+fields that changed.
+
+Usage:
+    python services/snapshots.py reextract            # update changed fields
+    python services/snapshots.py reextract --dry-run  # only count the changes
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+import argparse
+import gzip
+import hashlib
+import json
+import logging
+import os
+import sys
+import time
+
+import redis
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Make the repo root importable when run as `python services/snapshots.py`
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from services.dates import published_timestamp
+from services.page_metadata import extract_metadata
+from services.redis_helpers import (
+    VIDEOS_BY_DATE,
+    fetch_video_hashes,
+    metadata_key,
+    parse_tags,
+    record_metadata_change,
+    update_tag_index,
+    user_date_key,
+)
+from services.search_index import index_video
+from services.video_cards import store_card
+
+logger = logging.getLogger("snapshots")
+
+SNAPSHOT_PAGES = os.getenv("SNAPSHOT_PAGES", "0") == "1"
+SNAPSHOT_DIR = Path("downloads") / "snapshots"
+PAGE_SNAPSHOTS = "page_snapshots"
+ZSTD_LEVEL = 10
+
+# Fields reextract compares and rewrites
+REEXTRACT_FIELDS = (
+    "author",
+    "date",
+    "create_time",
+    "description",
+    "tags",
+    "music",
+    "v2t_title",
+    "v2t_desc",
+)
+
+
+def compress(data: bytes):
+    """Compress a page; returns (compressed bytes, file extension)."""
+    if zstandard:
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data), "zst"
+    return gzip.compress(data), "gz"
+
+
+def decompress(data: bytes, extension: str) -> bytes:
+    """Undo compress() for a file with the given extension."""
+    if extension == "zst":
+        if not zstandard:
+            raise RuntimeError("zstandard is needed to read .zst snapshots")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+
+def store_snapshot(redis_client, username: str, video_id: str, html_content: str):
+    """Save a video's page HTML and point the snapshot index at it.
+
+    Returns:
+        str: Snapshot path relative to SNAPSHOT_DIR
+    """
+    data = html_content.encode("utf-8")
+    digest = hashlib.sha256(data).hexdigest()
+
+    # Identical pages share a file, so existing ones are never rewritten
+    existing = list(SNAPSHOT_DIR.glob(f"{digest[:2]}/{digest}.html.*"))
+    if existing:
+        path = existing[0]
+    else:
+        compressed, extension = compress(data)
+        path = SNAPSHOT_DIR / digest[:2] / f"{digest}.html.{extension}"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        partial_path = path.with_name(path.name + ".part")
+        partial_path.write_bytes(compressed)
+        os.replace(partial_path, path)
+
+    relative_path = str(path.relative_to(SNAPSHOT_DIR))
+    redis_client.hset(
+        PAGE_SNAPSHOTS,
+        video_id,
+        json.dumps(
+            {
+                "username": username,
+                "path": relative_path,
+                "snapshot_time": time.strftime("%Y-%m-%d %H:%M:%S"),
+            }
+        ),
+    )
+    return relative_path
+
+
+def load_snapshot(relative_path: str) -> str:
+    """Read a snapshot back as HTML."""
+    path = SNAPSHOT_DIR / relative_path
+    return decompress(path.read_bytes(), path.suffix.lstrip(".")).decode("utf-8")
+
+
+def extract_snapshot(relative_path: str) -> Optional[Dict]:
+    """Extract metadata from one snapshot; runs in the pool."""
+    try:
+        return extract_metadata(load_snapshot(relative_path))
+    except (OSError, ValueError, RuntimeError) as e:
+        logger.warning(f"Could not read snapshot {relative_path}: {e}")
+        return None
+
+
+def encode_field(value) -> str:
+    """Encode a value the way update_metadata stores it in the hash."""
+    if isinstance(value, (list, dict)):
+        return json.dumps(value)
+    return str(value)
+
+
+def changed_fields(stored: Dict, extracted: Dict) -> Dict[str, str]:
+    """Return the extracted fields that differ from the stored hash.
+
+    Fields the extractor came back empty on are left alone, so a page that
+    no longer parses can't wipe out good metadata.
+    """
+    changes = {}
+    for field in REEXTRACT_FIELDS:
+        value = extracted.get(field)
+        if value in (None, "", []):
+            continue
+        encoded = encode_field(value)
+        if field == "tags":
+            if sorted(parse_tags(stored.get("tags"))) != sorted(value):
+                changes[field] = encoded
+        elif stored.get(field) != encoded:
+            changes[field] = encoded
+    return changes
+
+
+def apply_changes(redis_client, updates: List[tuple]):
+    """Write a batch of changes: hashes and date index in one pipeline.
+
+    ``updates`` holds (username, video_id, stored hash, changes) tuples.
+    Tags, search tokens and cards need the old values or the final hash, so
+    they are brought up to date per video afterwards.
+    """
+    pipe = redis_client.pipeline()
+    for username, video_id, stored, changes in updates:
+        updated = {**stored, **changes}
+        if {"date", "create_time"} & changes.keys():
+            changes["published_ts"] = updated["published_ts"] = published_timestamp(
+                updated
+            )
+            # xx: move videos already listed, without relisting deleted ones
+            score = {video_id: changes["published_ts"]}
+            pipe.zadd(VIDEOS_BY_DATE, score, xx=True)
+            pipe.zadd(user_date_key(username), score, xx=True)
+        pipe.hset(metadata_key(username, video_id), mapping=changes)
+        record_metadata_change(pipe, video_id)
+    pipe.execute()
+
+    for username, video_id, stored, changes in updates:
+        if "tags" in changes:
+            update_tag_index(
+                redis_client,
+                video_id,
+                parse_tags(stored.get("tags")),
+                parse_tags(changes["tags"]),
+            )
+        updated = {**stored, **changes}
+        index_video(redis_client, video_id, updated)
+        store_card(redis_client, updated)
+
+
+def reextract(
+    redis_client, processes: int = None, batch_size: int = 500, dry_run=False
+) -> Dict[str, int]:
+    """Re-run extraction over every snapshot and write back what changed.
+
+    Returns:
+        dict: Counts of snapshots read, videos changed and changes per field
+    """
+    counts = {"snapshots": 0, "unreadable": 0, "missing": 0, "changed": 0}
+    cursor = 0
+
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        while True:
+            cursor, entries = redis_client.hscan(
+                PAGE_SNAPSHOTS, cursor, count=batch_size
+            )
+            entries = [
+                (video_id, json.loads(entry)) for video_id, entry in entries.items()
+            ]
+            keys = [
+                metadata_key(entry["username"], video_id) for video_id, entry in entries
+            ]
+            extracted = pool.map(
+                extract_snapshot, [entry["path"] for _, entry in entries], chunksize=16
+            )
+
+            updates = []
+            for (video_id, entry), stored, metadata in zip(
+                entries, fetch_video_hashes(redis_client, keys), extracted
+            ):
+                counts["snapshots"] += 1
+                if metadata is None:
+                    counts["unreadable"] += 1
+                    continue
+                if not stored:
+                    counts["missing"] += 1
+                    continue
+                changes = changed_fields(stored, metadata)
+                if changes:
+                    updates.append((entry["username"], video_id, stored, changes))
+                    for field in changes:
+                        counts[field] = counts.get(field, 0) + 1
+
+            counts["changed"] += len(updates)
+            if updates and not dry_run:
+                apply_changes(redis_client, updates)
+
+            if cursor == 0:
+                break
+
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("command", choices=["reextract"])
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+
+    redis_client = redis.Redis(
+        host=os.getenv("REDIS_HOST", "localhost"),
+        port=6379,
+        db=0,
+        decode_responses=True,
+    )
+    counts = reextract(redis_client, args.processes, args.batch_size, args.dry_run)
+    verb = "Would change" if args.dry_run else "Changed"
+    logger.info(f"{verb} {counts.pop('changed')} videos: {counts}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,498 @@
+"""SQLite read replica of the metadata:* hashes.
+
+The replica mirrors every metadata hash into a local SQLite database (WAL
+mode) with B-tree indexes for browsing and an FTS5 table for search. It is
+kept up to date by following the metadata_changes stream that the writers
+append to, and can serve /api/videos, /api/videos/search and /tags when the
+app runs with QUERY_BACKEND=sqlite.
+
+Usage:
+    python services/sqlite_replica.py sync     # follow the change feed
+    python services/sqlite_replica.py rebuild  # full rebuild from Redis
+    python services/sqlite_replica.py check    # compare the replica with Redis
+"""
+
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import redis
+
+# Make the repo root importable when run as `python services/sqlite_replica.py`
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from services.dates import stored_published_timestamp
+from services.redis_helpers import (
+    METADATA_CHANGES,
+    VIDEO_KEY_INDEX,
+    encode_cursor,
+    fetch_video_hashes,
+    metadata_key,
+    parse_metadata_key,
+    parse_tags,
+)
+from services.search_index import MIN_PREFIX_LENGTH, parse_query, tokenize
+
+logger = logging.getLogger("sqlite_replica")
+
+REPLICA_PATH = os.getenv("SQLITE_REPLICA_PATH", "replica/metadata.db")
+
+# Text fields copied into the FTS5 table, besides the tags
+FTS_FIELDS = ("description", "author", "music", "username", "v2t_title", "v2t_desc")
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS videos (
+    id INTEGER PRIMARY KEY,
+    video_id TEXT NOT NULL UNIQUE,
+    username TEXT NOT NULL,
+    published_ts REAL NOT NULL,
+    deleted INTEGER NOT NULL DEFAULT 0,
+    file_missing INTEGER NOT NULL DEFAULT 0,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS videos_visible_by_date
+    ON videos (deleted, file_missing, published_ts);
+CREATE INDEX IF NOT EXISTS videos_user_by_date
+    ON videos (username, published_ts);
+CREATE TABLE IF NOT EXISTS video_tags (
+    video_id TEXT NOT NULL,
+    tag TEXT NOT NULL,
+    PRIMARY KEY (tag, video_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS video_tags_by_video ON video_tags (video_id);
+CREATE VIRTUAL TABLE IF NOT EXISTS videos_fts USING fts5(
+    {", ".join(FTS_FIELDS)}, tags, prefix='2 3'
+);
+CREATE TABLE IF NOT EXISTS replica_state (
+    name TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+VISIBLE = "v.deleted = 0 AND v.file_missing = 0"
+
+
+def connect(path: str = REPLICA_PATH) -> sqlite3.Connection:
+    """Open the replica in WAL mode, creating the schema if needed."""
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def is_flag_set(value) -> bool:
+    """Read a "True"/"False" flag field from a metadata hash."""
+    return str(value).lower() == "true"
+
+
+def get_state(conn, name: str, default: str = None):
+    """Read a value from the replica_state table."""
+    row = conn.execute(
+        "SELECT value FROM replica_state WHERE name = ?", (name,)
+    ).fetchone()
+    return row[0] if row else default
+
+
+def set_state(conn, name: str, value: str):
+    """Store a value in the replica_state table."""
+    conn.execute(
+        "INSERT INTO replica_state (name, value) VALUES (?, ?) "
+        "ON CONFLICT(name) DO UPDATE SET value = excluded.value",
+        (name, value),
+    )
+
+
+def upsert_video(conn, video_id: str, username: str, video_data: Dict):
+    """Write one metadata hash to the replica. Call inside a transaction."""
+    conn.execute(
+        "INSERT INTO videos "
+        "(video_id, username, published_ts, deleted, file_missing, data) "
+        "VALUES (?, ?, ?, ?, ?, ?) "
+        "ON CONFLICT(video_id) DO UPDATE SET username = excluded.username, "
+        "published_ts = excluded.published_ts, deleted = excluded.deleted, "
+        "file_missing = excluded.file_missing, data = excluded.data",
+        (
+            video_id,
+            username,
+            stored_published_timestamp(video_data),
+            is_flag_set(video_data.get("deleted")),
+            is_flag_set(video_data.get("file_missing")),
+            json.dumps(video_data, sort_keys=True),
+        ),
+    )
+    row = conn.execute(
+        "SELECT id FROM videos WHERE video_id = ?", (video_id,)
+    ).fetchone()
+
+    tags = parse_tags(video_data.get("tags"))
+    conn.execute("DELETE FROM video_tags WHERE video_id = ?", (video_id,))
+    conn.executemany(
+        "INSERT OR IGNORE INTO video_tags (video_id, tag) VALUES (?, ?)",
+        [(video_id, str(tag)) for tag in tags],
+    )
+
+    conn.execute("DELETE FROM videos_fts WHERE rowid = ?", (row[0],))
+    conn.execute(
+        f"INSERT INTO videos_fts (rowid, {', '.join(FTS_FIELDS)}, tags) "
+        f"VALUES (?, {', '.join('?' * len(FTS_FIELDS))}, ?)",
+        (
+            row[0],
+            *(video_data.get(field, "") for field in FTS_FIELDS),
+            " ".join(str(tag) for tag in tags),
+        ),
+    )
+
+
+def remove_video(conn, video_id: str):
+    """Drop a video whose metadata hash no longer exists."""
+    row = conn.execute(
+        "SELECT id FROM videos WHERE video_id = ?", (video_id,)
+    ).fetchone()
+    if not row:
+        return
+    conn.execute("DELETE FROM videos_fts WHERE rowid = ?", (row[0],))
+    conn.execute("DELETE FROM video_tags WHERE video_id = ?", (video_id,))
+    conn.execute("DELETE FROM videos WHERE id = ?", (row[0],))
+
+
+def stream_id(value: str):
+    """Turn a stream entry ID into a comparable tuple."""
+    milliseconds, _, sequence = value.partition("-")
+    return int(milliseconds), int(sequence or 0)
+
+
+def apply_video_ids(conn, redis_client, video_ids: List[str]):
+    """Copy the current metadata of the given videos into the replica."""
+    usernames = redis_client.hmget(VIDEO_KEY_INDEX, video_ids)
+    indexed = [
+        (video_id, username)
+        for video_id, username in zip(video_ids, usernames)
+        if username
+    ]
+    hashes = fetch_video_hashes(
+        redis_client,
+        [metadata_key(username, video_id) for video_id, username in indexed],
+    )
+    found = {}
+    for (video_id, username), video_data in zip(indexed, hashes):
+        if video_data:
+            found[video_id] = (username, video_data)
+
+    for video_id in video_ids:
+        if video_id in found:
+            upsert_video(conn, video_id, *found[video_id])
+        else:
+            remove_video(conn, video_id)
+
+
+def rebuild(conn, redis_client, batch_size: int = 1000) -> int:
+    """Replace the replica contents with a full copy of the metadata hashes.
+
+    The position of the change feed is recorded before scanning, so any
+    change made during the rebuild is replayed by the next sync.
+
+    Returns:
+        int: Number of videos copied
+    """
+    latest = redis_client.xrevrange(METADATA_CHANGES, count=1)
+    last_id = latest[0][0] if latest else "0-0"
+
+    copied = 0
+    with conn:
+        conn.execute("DELETE FROM videos_fts")
+        conn.execute("DELETE FROM video_tags")
+        conn.execute("DELETE FROM videos")
+
+        keys = []
+
+        def flush():
+            nonlocal copied
+            for key, video_data in zip(keys, fetch_video_hashes(redis_client, keys)):
+                if video_data:
+                    username, video_id = parse_metadata_key(key)
+                    upsert_video(conn, video_id, username, video_data)
+                    copied += 1
+            keys.clear()
+
+        for key in redis_client.scan_iter("metadata:*", count=batch_size):
+            if parse_metadata_key(key):
+                keys.append(key)
+            if len(keys) >= batch_size:
+                flush()
+        flush()
+
+        set_state(conn, "last_change_id", last_id)
+
+    return copied
+
+
+def sync(conn, redis_client, block_ms: int = None, count: int = 1000) -> int:
+    """Apply the next batch of changes from the change feed.
+
+    Rebuilds from scratch when the replica has never been built, or when
+    the stream has been trimmed past the last change it applied.
+
+    Returns:
+        int: Number of change entries applied
+    """
+    last_id = get_state(conn, "last_change_id")
+    if last_id is None:
+        logger.info("Replica has not been built yet, rebuilding")
+        rebuild(conn, redis_client)
+        return 0
+
+    oldest = redis_client.xrange(METADATA_CHANGES, count=1)
+    if oldest and last_id != "0-0" and stream_id(oldest[0][0]) > stream_id(last_id):
+        logger.warning("Change feed was trimmed past the replica, rebuilding")
+        rebuild(conn, redis_client)
+        return 0
+
+    response = redis_client.xread(
+        {METADATA_CHANGES: last_id}, count=count, block=block_ms
+    )
+    if not response:
+        return 0
+
+    entries = response[0][1]
+    video_ids = list(dict.fromkeys(fields["video_id"] for _, fields in entries))
+    with conn:
+        apply_video_ids(conn, redis_client, video_ids)
+        set_state(conn, "last_change_id", entries[-1][0])
+
+    return len(entries)
+
+
+def check_consistency(conn, redis_client, batch_size: int = 1000) -> Dict:
+    """Compare every metadata hash with its replica row.
+
+    Returns:
+        dict: Lists of video IDs that are missing from the replica, only in
+        the replica, or whose stored data differs from Redis
+    """
+    replica = dict(conn.execute("SELECT video_id, data FROM videos"))
+    report = {"missing": [], "extra": [], "different": []}
+    seen = set()
+
+    keys = [
+        key
+        for key in redis_client.scan_iter("metadata:*", count=batch_size)
+        if parse_metadata_key(key)
+    ]
+    for key, video_data in zip(keys, fetch_video_hashes(redis_client, keys)):
+        video_id = parse_metadata_key(key)[1]
+        seen.add(video_id)
+        if video_id not in replica:
+            report["missing"].append(video_id)
+        elif json.loads(replica[video_id]) != video_data:
+            report["different"].append(video_id)
+
+    report["extra"] = sorted(set(replica) - seen)
+    return report
+
+
+def page(
+    conn,
+    where: str,
+    params: list,
+    start: int,
+    limit: int,
+    descending: bool = True,
+    cursor: Optional[Tuple[float, str]] = None,
+):
+    """Count and page the visible videos matching a WHERE clause.
+
+    With a cursor the page starts after it using the (published_ts,
+    video_id) row value, so it is served straight from the index.
+
+    Returns:
+        tuple[int, list, str]: (total, metadata for the page, next cursor)
+    """
+    total = conn.execute(
+        f"SELECT COUNT(*) FROM videos v WHERE {VISIBLE} AND {where}", params
+    ).fetchone()[0]
+
+    order = "DESC" if descending else "ASC"
+    if cursor is not None:
+        where += (
+            f" AND (v.published_ts, v.video_id) {'<' if descending else '>'} (?, ?)"
+        )
+        params = [*params, *cursor]
+        start = 0
+
+    rows = conn.execute(
+        f"SELECT data, published_ts, video_id FROM videos v "
+        f"WHERE {VISIBLE} AND {where} "
+        f"ORDER BY v.published_ts {order}, v.video_id {order} LIMIT ? OFFSET ?",
+        [*params, limit + 1, start],
+    ).fetchall()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1][1], rows[-1][2])
+    return total, [json.loads(row[0]) for row in rows], next_cursor
+
+
+def query_videos(
+    conn,
+    tags: List[str],
+    filter_type: str = "and",
+    username: str = None,
+    start: int = 0,
+    limit: int = 20,
+    descending: bool = True,
+    cursor: Optional[Tuple[float, str]] = None,
+):
+    """The replica equivalent of filter_video_ids + fetch_videos.
+
+    Returns:
+        tuple[int, list, str]: (total matching videos, metadata for the
+        page, cursor for the next page or None)
+    """
+    where = ["1"]
+    params = []
+
+    if username:
+        where.append("v.username = ?")
+        params.append(username)
+
+    if tags:
+        placeholders = ", ".join("?" * len(tags))
+        if filter_type == "and":
+            where.append(
+                f"v.video_id IN (SELECT video_id FROM video_tags "
+                f"WHERE tag IN ({placeholders}) GROUP BY video_id "
+                f"HAVING COUNT(*) = ?)"
+            )
+            params.extend([*tags, len(set(tags))])
+        else:
+            match = "NOT EXISTS" if filter_type == "not" else "EXISTS"
+            where.append(
+                f"{match} (SELECT 1 FROM video_tags t WHERE t.video_id = v.video_id "
+                f"AND t.tag IN ({placeholders}))"
+            )
+            params.extend(tags)
+
+    return page(conn, " AND ".join(where), params, start, limit, descending, cursor)
+
+
+def fts_match(words: List[str]) -> str:
+    """Build an FTS5 expression matching every word.
+
+    Words of MIN_PREFIX_LENGTH characters or more match as prefixes and
+    shorter ones as whole tokens, like search_video_ids.
+    """
+    return " AND ".join(
+        f'"{word}"*' if len(word) >= MIN_PREFIX_LENGTH else f'"{word}"'
+        for word in words
+    )
+
+
+def search_videos(
+    conn,
+    query: str,
+    start: int = 0,
+    limit: int = 20,
+    cursor: Optional[Tuple[float, str]] = None,
+):
+    """The replica equivalent of search_video_ids + fetch_videos.
+
+    Supports the same @user, !@user and !term operators.
+
+    Returns:
+        tuple[int, list, str]: (total matching videos, metadata for the
+        page, cursor for the next page or None)
+    """
+    include_terms, exclude_terms, include_usernames, exclude_usernames = parse_query(
+        query
+    )
+    where = ["1"]
+    params = []
+
+    include_words = [word for term in include_terms for word in tokenize(term)]
+    if include_words:
+        where.append("v.id IN (SELECT rowid FROM videos_fts WHERE videos_fts MATCH ?)")
+        params.append(fts_match(include_words))
+
+    for term in exclude_terms:
+        words = tokenize(term)
+        if words:
+            where.append(
+                "v.id NOT IN (SELECT rowid FROM videos_fts WHERE videos_fts MATCH ?)"
+            )
+            params.append(fts_match(words))
+
+    if include_usernames:
+        where.append(
+            "("
+            + " OR ".join("instr(lower(v.username), ?) > 0" for _ in include_usernames)
+            + ")"
+        )
+        params.extend(include_usernames)
+    for pattern in exclude_usernames:
+        where.append("instr(lower(v.username), ?) = 0")
+        params.append(pattern)
+
+    return page(conn, " AND ".join(where), params, start, limit, cursor=cursor)
+
+
+def tag_counts(conn):
+    """Count the non-deleted videos per tag, most used first."""
+    return conn.execute(
+        "SELECT t.tag, COUNT(*) FROM video_tags t "
+        "JOIN videos v ON v.video_id = t.video_id "
+        "WHERE v.deleted = 0 GROUP BY t.tag ORDER BY COUNT(*) DESC"
+    ).fetchall()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("command", choices=["sync", "rebuild", "check"])
+    parser.add_argument("--path", default=REPLICA_PATH)
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+
+    redis_client = redis.Redis(
+        host=os.getenv("REDIS_HOST", "localhost"),
+        port=6379,
+        db=0,
+        decode_responses=True,
+    )
+    conn = connect(args.path)
+
+    if args.command == "rebuild":
+        copied = rebuild(conn, redis_client)
+        logger.info(f"Copied {copied} videos into {args.path}")
+
+    elif args.command == "check":
+        report = check_consistency(conn, redis_client)
+        for problem, video_ids in report.items():
+            logger.info(f"{problem}: {len(video_ids)} {video_ids[:10]}")
+        sys.exit(1 if any(report.values()) else 0)
+
+    else:
+        logger.info(f"Following {METADATA_CHANGES} into {args.path}")
+        while True:
+            try:
+                applied = sync(conn, redis_client, block_ms=5000)
+                if applied:
+                    logger.info(f"Applied {applied} changes")
+            except redis.RedisError as e:
+                logger.error(f"Error reading change feed: {e}")
+                time.sleep(5)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,315 @@
+"""Generate video thumbnails out of band.
+
+The web app and the downloader enqueue jobs on ``thumbnail_queue`` with
+enqueue_thumbnail(); this service pops them and renders the thumbnails in a
+process pool so decoding never blocks an HTTP worker.
+
+Each video is claimed in Redis (``thumbnail_claim:{video_id}``) before it is
+queued, so a thumbnail requested by several gunicorn workers or hosts at
+once is generated only once. While queued, the claim lives long enough for
+the backlog ahead of it; on pickup it is reset to THUMBNAIL_CLAIM_TTL. It is
+released when the job finishes and expires on its own if a worker dies with
+the job in flight.
+
+Each process slot takes jobs as a leased claim (see worker_loop), so a job
+whose worker dies or hangs goes back on the queue unchanged.
+
+Usage:
+    python services/thumbnail_worker.py            # run the worker
+    python services/thumbnail_worker.py --backfill # queue videos without variants or previews
+"""
+
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+
+import redis
+
+# Make the repo root importable when run as `python services/thumbnail_worker.py`
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from services.redis_helpers import (
+    fetch_video_hashes,
+    metadata_key,
+    parse_metadata_key,
+    record_metadata_change,
+)
+from services.previews import render_previews
+from services.thumbnails import render_thumbnails, thumbnail_path_for
+from services.worker_loop import Heartbeat, LeaseQueue, enqueue, record_pickup
+
+# Setup logging
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    handlers=[logging.StreamHandler()],
+)
+logger = logging.getLogger("thumbnail_worker")
+
+THUMBNAIL_QUEUE = "thumbnail_queue"
+THUMBNAIL_FAILED_QUEUE = "thumbnail_failed_queue"
+
+# How long a claim outlives its job if the worker holding it dies
+THUMBNAIL_CLAIM_TTL = 600
+MAX_RETRIES = 3
+
+# Allowance per job already queued, so a queued claim outlasts the backlog
+# ahead of it; generous for one render process
+QUEUED_JOB_SECONDS = 5
+
+DOWNLOADS_DIR = Path("downloads")
+
+
+def thumbnail_claim_key(video_id: str) -> str:
+    """Build the key marking a video's thumbnail as queued or in progress."""
+    return f"thumbnail_claim:{video_id}"
+
+
+def queued_claim_ttl(redis_client) -> int:
+    """Lifetime for the claim of a job joining the back of the queue.
+
+    The claim is set to THUMBNAIL_CLAIM_TTL again when the job is picked up.
+    """
+    return THUMBNAIL_CLAIM_TTL + redis_client.llen(THUMBNAIL_QUEUE) * QUEUED_JOB_SECONDS
+
+
+def enqueue_thumbnail(redis_client, username: str, video_id: str, video_path: str):
+    """Queue a thumbnail unless another process already has.
+
+    ``video_path`` is relative to the downloads directory.
+
+    Returns:
+        bool: True if this call queued the job
+    """
+    if not redis_client.set(
+        thumbnail_claim_key(video_id),
+        "queued",
+        nx=True,
+        ex=queued_claim_ttl(redis_client),
+    ):
+        return False
+
+    job = {"username": username, "video_id": video_id, "video_path": video_path}
+    enqueue(redis_client, THUMBNAIL_QUEUE, job)
+    return True
+
+
+def render_video_images(video_path: Path, position_ms: float = None):
+    """Render a video's thumbnails and hover previews; runs in the pool.
+
+    Returns render_thumbnails()'s result with a "preview" entry added, or
+    None if not even a thumbnail could be made. A preview that fails to
+    render is logged and left empty, so the thumbnails are still recorded.
+    """
+    result = render_thumbnails(video_path, position_ms)
+    if result:
+        try:
+            result["preview"] = render_previews(video_path)
+        except Exception as e:
+            logger.warning(f"Could not render previews for {video_path}: {e}")
+            result["preview"] = {}
+    return result
+
+
+def enqueue_missing(redis_client, batch_size: int = 1000) -> int:
+    """Queue every downloaded video whose variants or previews were never made.
+
+    Returns:
+        int: Number of videos queued
+    """
+    queued = 0
+    keys = list(redis_client.scan_iter("metadata:*", count=batch_size))
+    for key, video_data in zip(keys, fetch_video_hashes(redis_client, keys)):
+        parsed = parse_metadata_key(key)
+        if not parsed or not video_data:
+            continue
+        if video_data.get("thumbnail_variants") and video_data.get("preview"):
+            continue
+
+        username, video_id = parsed
+        video_path = Path(f"{username}_videos") / f"{video_id}.mp4"
+        if (DOWNLOADS_DIR / video_path).exists() and enqueue_thumbnail(
+            redis_client, username, video_id, str(video_path)
+        ):
+            queued += 1
+    return queued
+
+
+class ThumbnailWorker:
+    def __init__(self, processes: int = None):
+        self.redis_client = redis.Redis(
+            host=os.getenv("REDIS_HOST", "localhost"),
+            port=6379,
+            db=0,
+            decode_responses=True,
+        )
+        self.processes = processes or int(
+            os.getenv("THUMBNAIL_WORKERS", os.cpu_count() or 1)
+        )
+        self.pool = ProcessPoolExecutor(max_workers=self.processes)
+        self.in_flight = {}
+
+        # One claim holder per process slot, so a slot holds one job at a time
+        self.leases = LeaseQueue(self.redis_client, THUMBNAIL_QUEUE)
+        self.holders = [
+            self.leases.holder(f"thumbnails-{slot}") for slot in range(self.processes)
+        ]
+        self.heartbeat = Heartbeat(self.leases, THUMBNAIL_CLAIM_TTL)
+
+    def stored_frame(self, job) -> dict:
+        """Return the stored thumbnail_frame of a video, or {} if there is none."""
+        redis_key = metadata_key(job["username"], job["video_id"])
+        try:
+            frame = json.loads(
+                self.redis_client.hget(redis_key, "thumbnail_frame") or "{}"
+            )
+        except json.JSONDecodeError:
+            return {}
+        return frame if isinstance(frame, dict) else {}
+
+    def stored_position(self, job):
+        """Return the frame position chosen for a video before, if any.
+
+        Regenerating from the same position keeps the thumbnail identical
+        instead of scoring the samples again.
+        """
+        return self.stored_frame(job).get("position_ms")
+
+    def finish(self, future):
+        """Record the result of a finished job and release its claims."""
+        job, holder, raw_job = self.in_flight.pop(future)
+        try:
+            self.record_result(future, job)
+        finally:
+            self.heartbeat.finished(holder)
+            self.leases.ack(holder, raw_job)
+
+    def record_result(self, future, job):
+        """Store a job's thumbnails, or queue it again or fail it."""
+        video_id = job["video_id"]
+
+        try:
+            result = future.result()
+            error = None if result else "could not decode a frame"
+        except Exception as e:
+            result, error = None, str(e)
+
+        if result:
+            # The card shows the WebP variants and the LQIP once they exist
+            thumbnail_path = thumbnail_path_for(Path(job["video_path"]))
+            redis_key = metadata_key(job["username"], video_id)
+            if self.redis_client.exists(redis_key):
+                images = {
+                    "thumbnail_path": str(thumbnail_path),
+                    "thumbnail_variants": json.dumps(result["variants"]),
+                    "thumbnail_lqip": result["lqip"],
+                    # A regenerated frame only carries its position, so
+                    # keep the scores stored with it
+                    "thumbnail_frame": json.dumps(
+                        {**self.stored_frame(job), **result["frame"]}
+                    ),
+                    "preview": json.dumps(result["preview"] or {}),
+                }
+                self.redis_client.hset(redis_key, mapping=images)
+                # Only the card changes, so cached listings stay valid
+                record_metadata_change(self.redis_client, video_id, images)
+            self.redis_client.delete(thumbnail_claim_key(video_id))
+            logger.info(f"Generated thumbnails and previews for {video_id}")
+            return
+
+        job["retry_count"] = job.get("retry_count", 0) + 1
+        job["last_error"] = error
+        if job["retry_count"] < MAX_RETRIES:
+            # Keep the claim so nobody else queues it in the meantime
+            logger.warning(f"Retrying thumbnail for {video_id}: {error}")
+            self.redis_client.expire(
+                thumbnail_claim_key(video_id), queued_claim_ttl(self.redis_client)
+            )
+            enqueue(self.redis_client, THUMBNAIL_QUEUE, job)
+        else:
+            logger.error(f"Thumbnail for {video_id} failed: {error}")
+            self.redis_client.rpush(THUMBNAIL_FAILED_QUEUE, json.dumps(job))
+            self.redis_client.delete(thumbnail_claim_key(video_id))
+
+    def start(self, holder: str, raw_job: str):
+        """Hand a job claimed by ``holder`` to the process pool."""
+        try:
+            job = json.loads(raw_job)
+        except json.JSONDecodeError:
+            logger.error(f"Dropping malformed thumbnail job {raw_job!r}")
+            self.leases.ack(holder, raw_job)
+            return
+
+        self.heartbeat.started(holder)
+        record_pickup(self.redis_client, THUMBNAIL_QUEUE, job)
+        self.redis_client.set(
+            thumbnail_claim_key(job["video_id"]), "processing", ex=THUMBNAIL_CLAIM_TTL
+        )
+        video_path = DOWNLOADS_DIR / job["video_path"]
+        future = self.pool.submit(
+            render_video_images, video_path, self.stored_position(job)
+        )
+        self.in_flight[future] = (job, holder, raw_job)
+
+    def run(self):
+        """Main service loop."""
+        logger.info(f"Thumbnail worker started with {self.processes} processes")
+        requeued = sum(self.leases.recover(holder) for holder in self.holders)
+        if requeued:
+            logger.info(f"Requeued {requeued} unfinished thumbnail jobs")
+        self.heartbeat.start()
+
+        while True:
+            try:
+                # Wait for a free process before taking another job
+                if len(self.in_flight) >= self.processes:
+                    done, _ = wait(self.in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        self.finish(future)
+                    continue
+
+                for future in [f for f in self.in_flight if f.done()]:
+                    self.finish(future)
+
+                busy = {holder for _, holder, _ in self.in_flight.values()}
+                holder = next(h for h in self.holders if h not in busy)
+                raw_job = self.leases.claim(holder, timeout=1)
+                if raw_job is None:
+                    continue
+
+                try:
+                    self.start(holder, raw_job)
+                except Exception:
+                    # Put the job back rather than leave it under an idle slot
+                    self.heartbeat.finished(holder)
+                    self.leases.recover(holder)
+                    raise
+
+            except Exception as e:
+                logger.error(f"Error in main loop: {e}")
+                time.sleep(5)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate thumbnails out of band.")
+    parser.add_argument(
+        "--backfill",
+        action="store_true",
+        help="Queue downloaded videos missing WebP variants or previews, then exit",
+    )
+    args = parser.parse_args()
+
+    worker = ThumbnailWorker()
+    if args.backfill:
+        logger.info(f"Queued {enqueue_missing(worker.redis_client)} videos")
+    else:
+        worker.run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+import base64
+import io
+import os
+import re
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+from PIL import Image
+
+# Every thumbnail is letterboxed to the TikTok aspect ratio
+ASPECT_WIDTH = 9
+ASPECT_HEIGHT = 16
+
+# The original JPEG, still used as the <img src> fallback. Its height comes
+# from height_for like every other size, so it matches the "sm" WebP variant
+JPEG_WIDTH = 320
+JPEG_QUALITY = 85
+
+# WebP variants offered through srcset, by name and width
+WEBP_VARIANTS = {"sm": 320, "md": 640}
+WEBP_QUALITY = 75
+
+# Tiny blurred preview embedded in the card JSON as a data URI
+LQIP_WIDTH = 16
+LQIP_QUALITY = 40
+
+# Points in the video, as fractions of its duration, whose frames are scored
+# when picking the thumbnail. The first frame is often black or a fade-in.
+SAMPLE_POSITIONS = (0.1, 0.25, 0.4, 0.55, 0.7)
+
+# Frames are scored on a grayscale copy this wide
+SCORE_WIDTH = 96
+
+# Mean brightness outside this range counts as under/over exposed
+EXPOSURE_RANGE = (40.0, 215.0)
+
+THUMBNAIL_NAME_PATTERN = re.compile(r"^(.+)_thumb(?:_([a-z]+))?\.(jpg|webp)$")
+
+
+def thumbnail_path_for(video_path: Path) -> Path:
+    """Return where a video's JPEG thumbnail is stored."""
+    return video_path.parent / f"{video_path.stem}_thumb.jpg"
+
+
+def variant_path_for(video_path: Path, variant: str) -> Path:
+    """Return where one of a video's WebP thumbnail variants is stored."""
+    return video_path.parent / f"{video_path.stem}_thumb_{variant}.webp"
+
+
+def video_path_for_thumbnail(thumbnail_path: Path) -> Optional[Path]:
+    """Map any thumbnail file name back to its video, or None if it isn't one."""
+    match = THUMBNAIL_NAME_PATTERN.match(thumbnail_path.name)
+    if not match or (match.group(2) and match.group(2) not in WEBP_VARIANTS):
+        return None
+    return thumbnail_path.parent / f"{match.group(1)}.mp4"
+
+
+def height_for(width: int) -> int:
+    """Return the height of a thumbnail of the given width."""
+    return round(width * ASPECT_HEIGHT / ASPECT_WIDTH)
+
+
+def to_image(frame: np.ndarray) -> Image.Image:
+    """Convert an OpenCV BGR frame to an RGB PIL image."""
+    return Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+
+
+def video_duration_ms(video) -> float:
+    """Return an open capture's duration in ms, or 0 if it can't be told."""
+    fps = video.get(cv2.CAP_PROP_FPS)
+    frame_count = video.get(cv2.CAP_PROP_FRAME_COUNT)
+    if fps <= 0 or frame_count <= 0:
+        return 0.0
+    return frame_count / fps * 1000
+
+
+def read_frame_at(video, position_ms: float) -> Optional[np.ndarray]:
+    """Seek an open capture to a timestamp and decode the frame there."""
+    video.set(cv2.CAP_PROP_POS_MSEC, position_ms)
+    success, frame = video.read()
+    return frame if success else None
+
+
+def score_frames(frames: List[np.ndarray]) -> np.ndarray:
+    """Score frames by how well they represent a video; higher is better.
+
+    The frames are shrunk to SCORE_WIDTH grayscale and scored together:
+    contrast (standard deviation) times sharpness (mean squared gradient),
+    scaled down the further mean brightness falls outside EXPOSURE_RANGE.
+    """
+    height = max(round(SCORE_WIDTH * frames[0].shape[0] / frames[0].shape[1]), 1)
+    grays = np.stack(
+        [
+            cv2.resize(
+                cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY),
+                (SCORE_WIDTH, height),
+                interpolation=cv2.INTER_AREA,
+            )
+            for frame in frames
+        ]
+    ).astype(np.float32)
+
+    brightness = grays.mean(axis=(1, 2))
+    contrast = grays.std(axis=(1, 2))
+    sharpness = (np.diff(grays, axis=1) ** 2).mean(axis=(1, 2)) + (
+        np.diff(grays, axis=2) ** 2
+    ).mean(axis=(1, 2))
+
+    low, high = EXPOSURE_RANGE
+    exposure_error = np.maximum(low - brightness, 0) + np.maximum(brightness - high, 0)
+    exposure = 1 / (1 + exposure_error / 10)
+
+    return contrast * np.log1p(sharpness) * exposure
+
+
+def select_frame(
+    video_path: Path, position_ms: float = None
+) -> Tuple[Optional[Image.Image], Dict]:
+    """Pick a video's thumbnail frame.
+
+    Seeks to each of SAMPLE_POSITIONS, decodes a single frame at each and
+    keeps the best scoring one. Passing ``position_ms`` (as returned in the
+    metadata) skips the scoring and reuses that frame, so thumbnails can be
+    regenerated identically.
+
+    Returns:
+        tuple: (frame as an RGB image or None, {"position_ms", "score",
+        "scores"} describing the choice)
+    """
+    video = cv2.VideoCapture(str(video_path))
+    try:
+        if position_ms is not None:
+            frame = read_frame_at(video, position_ms)
+            return (to_image(frame) if frame is not None else None), {
+                "position_ms": position_ms
+            }
+
+        duration = video_duration_ms(video)
+        positions = sorted({round(duration * share) for share in SAMPLE_POSITIONS})
+        candidates = []
+        for candidate_ms in positions or [0]:
+            frame = read_frame_at(video, candidate_ms)
+            if frame is not None:
+                candidates.append((candidate_ms, frame))
+
+        # Streams that can't seek still have a first frame
+        if not candidates:
+            frame = read_frame_at(video, 0)
+            if frame is None:
+                return None, {}
+            candidates = [(0, frame)]
+
+        scores = score_frames([frame for _, frame in candidates])
+        best = int(np.argmax(scores))
+        return to_image(candidates[best][1]), {
+            "position_ms": candidates[best][0],
+            "score": round(float(scores[best]), 3),
+            "scores": {
+                str(candidate_ms): round(float(score), 3)
+                for (candidate_ms, _), score in zip(candidates, scores)
+            },
+        }
+    finally:
+        video.release()
+
+
+def letterbox(image: Image.Image, width: int, height: int) -> Image.Image:
+    """Resize an image to fit width x height, padding with black bars."""
+    original_ratio = image.size[0] / image.size[1]
+    target_ratio = width / height
+
+    if original_ratio > target_ratio:
+        new_width = width
+        new_height = max(int(width / original_ratio), 1)
+        position = (0, (height - new_height) // 2)
+    else:
+        new_height = height
+        new_width = max(int(height * original_ratio), 1)
+        position = ((width - new_width) // 2, 0)
+
+    background = Image.new("RGB", (width, height), (0, 0, 0))
+    background.paste(
+        image.resize((new_width, new_height), Image.Resampling.LANCZOS), position
+    )
+    return background
+
+
+def save_atomic(image: Image.Image, path: Path, image_format: str, **options):
+    """Save an image via a temporary file so a partial file is never served."""
+    partial_path = path.with_name(path.name + ".part")
+    image.save(partial_path, image_format, **options)
+    os.replace(partial_path, path)
+
+
+def lqip_data_uri(image: Image.Image) -> str:
+    """Encode a tiny WebP preview of an image as a data URI."""
+    buffer = io.BytesIO()
+    letterbox(image, LQIP_WIDTH, height_for(LQIP_WIDTH)).save(
+        buffer, "WEBP", quality=LQIP_QUALITY
+    )
+    return "data:image/webp;base64," + base64.b64encode(buffer.getvalue()).decode()
+
+
+def render_thumbnails(video_path: Path, position_ms: float = None) -> Optional[Dict]:
+    """Write a video's JPEG thumbnail and WebP variants from one chosen frame.
+
+    The frame is picked by select_frame(), or taken at ``position_ms`` when
+    regenerating. Existing files are overwritten. Returns None if no frame
+    could be decoded.
+
+    Returns:
+        dict: {"variants": {name: width}, "lqip": data URI, "frame": how
+        the frame was chosen}
+    """
+    video_path = Path(video_path)
+    frame, selection = select_frame(video_path, position_ms)
+    if frame is None:
+        return None
+
+    save_atomic(
+        letterbox(frame, JPEG_WIDTH, height_for(JPEG_WIDTH)),
+        thumbnail_path_for(video_path),
+        "JPEG",
+        quality=JPEG_QUALITY,
+    )
+    for variant, width in WEBP_VARIANTS.items():
+        save_atomic(
+            letterbox(frame, width, height_for(width)),
+            variant_path_for(video_path, variant),
+            "WEBP",
+            quality=WEBP_QUALITY,
+        )
+
+    return {
+        "variants": dict(WEBP_VARIANTS),
+        "lqip": lqip_data_uri(frame),
+        "frame": selection,
+    }
+
+
+def thumbnails_complete(video_path: Path) -> bool:
+    """Check whether the JPEG and every WebP variant exist for a video."""
+    return thumbnail_path_for(video_path).exists() and all(
+        variant_path_for(video_path, variant).exists() for variant in WEBP_VARIANTS
+    )
@@ -14,6 +14,12 @@ from selenium.webdriver.chrome.options import Options
 from bs4 import BeautifulSoup
 from tqdm import tqdm
 import os
+import sys
+
+# Make the repo root importable when run as `python services/url_discovery.py`
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from services.worker_loop import enqueue
 
 # Setup logging
 logging.basicConfig(
@@ -283,7 +289,7 @@ class URLDiscoveryService:
             video_id = video.get("video_id")
             if video_id and video_id not in existing_ids:
                 try:
-                    self.redis_client.rpush(QUEUE_KEY, json.dumps(video))
+                    enqueue(self.redis_client, QUEUE_KEY, video)
                     queued_count += 1
                     logger.info(f"Queued new video: {video_id}")
                 except Exception as e:
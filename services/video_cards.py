@@ -0,0 +1,175 @@
+import json
+import logging
+from typing import Dict, Iterable, List
+
+from services.redis_helpers import CARD_VERSION, card_key, fetch_videos
+
+logger = logging.getLogger(__name__)
+
+# Cards filled on read expire as a backstop; cards rendered by the writer
+# itself are kept until the next change
+CARD_FILL_TTL = 3600
+
+# Caches cards filled on read unless card_version has moved since the hashes
+# were read: a writer that changed one of them in the meantime has dropped
+# its card, and the filled copy would be stale.
+# KEYS: card_version, then card keys. ARGV: version read, TTL, then cards.
+CARD_FILL_SCRIPT = """
+if (redis.call("GET", KEYS[1]) or "0") ~= ARGV[1] then
+    return 0
+end
+for i = 2, #KEYS do
+    redis.call("SET", KEYS[i], ARGV[i + 1], "EX", ARGV[2])
+end
+return 1
+"""
+
+# Stored in place of a card for deleted or missing videos so they are not
+# re-read on every page
+HIDDEN_CARD = ""
+
+
+def is_visible(video_data: Dict) -> bool:
+    """Check whether a video should be shown in the browser."""
+    return (
+        bool(video_data)
+        and video_data.get("deleted") != "True"
+        and video_data.get("file_missing") != "True"
+    )
+
+
+def format_video(video_data: Dict) -> Dict:
+    """Build the video card returned by the JSON APIs from a metadata hash."""
+    try:
+        tags = json.loads(video_data.get("tags", "[]"))
+    except json.JSONDecodeError:
+        tags = []
+
+    try:
+        variants = json.loads(video_data.get("thumbnail_variants") or "{}")
+    except json.JSONDecodeError:
+        variants = {}
+
+    try:
+        preview = json.loads(video_data.get("preview") or "{}")
+    except json.JSONDecodeError:
+        preview = {}
+
+    username = video_data.get("username", "")
+    date = video_data.get("date", "")
+    thumbnail_prefix = f"/thumbnail/{username}_videos/{video_data['video_id']}_thumb"
+    preview_prefix = f"/preview/{username}_videos/{video_data['video_id']}"
+    return {
+        "video_id": video_data["video_id"],
+        "video_path": f"{username}_videos/{video_data['video_id']}.mp4",
+        "thumbnail_path": f"{username}_videos/{video_data['video_id']}_thumb.jpg",
+        # WebP variants and a blurred placeholder, once the worker made them
+        "thumbnail_srcset": ", ".join(
+            f"{thumbnail_prefix}_{variant}.webp {width}w"
+            for variant, width in variants.items()
+        ),
+        "thumbnail_lqip": video_data.get("thumbnail_lqip", ""),
+        # Hover-scrub sprite sheet (one row of preview_frames) and preview loop
+        "preview_sprite": (
+            f"{preview_prefix}_sprite.webp" if preview.get("frames") else ""
+        ),
+        "preview_frames": preview.get("frames", 0),
+        "preview_loop": f"{preview_prefix}_preview.webp" if preview.get("loop") else "",
+        "description": video_data.get("description", ""),
+        "username": username,
+        "tags": tags,
+        "has_thumbnail": True,
+        "author": video_data.get("author", ""),
+        "music": video_data.get("music", ""),
+        "date": date.split("·")[1] if "·" in date else date,
+        "url": video_data.get("url", ""),
+    }
+
+
+def render_card(video_data: Dict) -> str:
+    """Serialize a video's card to compact JSON, or HIDDEN_CARD if hidden."""
+    if not is_visible(video_data):
+        return HIDDEN_CARD
+    return json.dumps(format_video(video_data), separators=(",", ":"))
+
+
+def store_card(redis_client, video_data: Dict):
+    """Render and cache a video's card from its full metadata hash.
+
+    Call after record_metadata_change, which drops the previous card.
+    """
+    redis_client.set(card_key(video_data["video_id"]), render_card(video_data))
+
+
+def fetch_cards(redis_client, video_ids: List[str]) -> List[str]:
+    """Return the JSON cards for a page of video IDs, preserving order.
+
+    Cards are read with one MGET; missing ones are rendered from their
+    hashes and cached, unless any metadata changed while they were rendered.
+    Hidden videos and videos without metadata are skipped.
+    """
+    if not video_ids:
+        return []
+
+    version, *cards = redis_client.mget(
+        [CARD_VERSION] + [card_key(video_id) for video_id in video_ids]
+    )
+    missing = [video_id for video_id, card in zip(video_ids, cards) if card is None]
+    if missing:
+        rendered = {}
+        for video_data in fetch_videos(redis_client, missing):
+            try:
+                rendered[video_data["video_id"]] = render_card(video_data)
+            except Exception as e:
+                logger.error(
+                    f"Error rendering card for {video_data.get('video_id')}: {e}"
+                )
+
+        if rendered:
+            redis_client.register_script(CARD_FILL_SCRIPT)(
+                keys=[CARD_VERSION] + [card_key(video_id) for video_id in rendered],
+                args=[version or "0", CARD_FILL_TTL] + list(rendered.values()),
+            )
+
+        cards = [
+            rendered.get(video_id) if card is None else card
+            for video_id, card in zip(video_ids, cards)
+        ]
+
+    return [card for card in cards if card]
+
+
+def render_cards(videos: Iterable[Dict]) -> List[str]:
+    """Serialize cards for metadata dicts that are not cached (e.g. replica rows)."""
+    cards = []
+    for video_data in videos:
+        try:
+            card = render_card(video_data)
+        except Exception as e:
+            logger.error(f"Error rendering card for {video_data.get('video_id')}: {e}")
+            continue
+        if card:
+            cards.append(card)
+    return cards
+
+
+def cards_response_body(cards: List[str], **fields) -> str:
+    """Assemble a JSON object with a ``videos`` list from serialized cards.
+
+    The cards are joined as they are rather than decoded and re-encoded.
+    """
+    body = json.dumps(fields, separators=(",", ":"))
+    videos = '{"videos":[' + ",".join(cards) + "]"
+    return videos + ("," + body[1:] if fields else "}")
+
+
+def drop_cards(redis_client, batch_size: int = 1000) -> int:
+    """Delete every cached card; they are re-rendered on the next read.
+
+    Returns:
+        int: Number of cards deleted
+    """
+    keys = list(redis_client.scan_iter(card_key("*"), count=batch_size))
+    for start in range(0, len(keys), batch_size):
+        redis_client.delete(*keys[start : start + batch_size])
+    return len(keys)
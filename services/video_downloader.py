@@ -1,14 +1,33 @@
 from pathlib import Path
 import json
-from datetime import datetime
 import time
 import redis
 import logging
 from typing import Dict
-import cv2
-from PIL import Image
 from yt_dlp import YoutubeDL
 import os
+import sys
+
+# Make the repo root importable when run as `python services/video_downloader.py`
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from services.dates import stored_published_timestamp
+from services.thumbnail_worker import enqueue_thumbnail
+from services.thumbnails import thumbnail_path_for, thumbnails_complete
+from services.video_cards import is_visible
+from services.worker_loop import QueueWorker, enqueue, held_jobs
+from services.redis_helpers import (
+    add_to_date_index,
+    add_usernames,
+    index_video_key,
+    metadata_key,
+    parse_metadata_key,
+    parse_tags,
+    record_metadata_change,
+    remove_from_date_index,
+    resolve_metadata_key,
+    set_video_deleted,
+)
 
 # Setup logging
 logging.basicConfig(
@@ -18,10 +37,42 @@ logging.basicConfig(
 )
 logger = logging.getLogger("video_downloader")
 
-# Redis connection
-redis_client = redis.Redis(host=os.getenv("REDIS_HOST", "localhost"), port=6379, db=0)
 DOWNLOAD_QUEUE_KEY = "video_download_queue"
 
+# A download still running after this long is taken as hung and requeued
+DOWNLOAD_JOB_TIMEOUT = int(os.getenv("DOWNLOAD_JOB_TIMEOUT", "1800"))
+
+
+def update_video_paths(
+    redis_client, username: str, video_id: str, video_path: str, thumbnail_path: str
+):
+    """Record a downloaded video's paths in Redis and put it back in the listings."""
+    redis_key = metadata_key(username, video_id)
+    index_video_key(redis_client, username, video_id)
+    redis_client.hset(redis_key, "video_path", video_path)
+    redis_client.hset(redis_key, "thumbnail_path", thumbnail_path)
+    download_time = time.strftime("%Y-%m-%d %H:%M:%S")
+    redis_client.hset(redis_key, "download_time", download_time)
+
+    # Remove file_missing flag when video is successfully downloaded
+    redis_client.hdel(redis_key, "file_missing")
+
+    # Add username to all_usernames set
+    add_usernames(redis_client, [username])
+
+    # Reuse the publish time stored at ingestion, computing it for older
+    # records that predate published_ts
+    video_data = redis_client.hgetall(redis_key)
+    timestamp = stored_published_timestamp(video_data)
+    if "published_ts" not in video_data:
+        redis_client.hset(redis_key, "published_ts", timestamp)
+
+    # A video deleted in the browser stays out of the listings even if it is
+    # downloaded again
+    if is_visible(video_data):
+        add_to_date_index(redis_client, username, video_id, timestamp)
+    record_metadata_change(redis_client, video_id)
+
 
 class VideoDownloader:
     def __init__(self):
@@ -39,24 +90,38 @@ class VideoDownloader:
         # Create downloads directory if it doesn't exist
         self.downloads_dir.mkdir(parents=True, exist_ok=True)
 
-        # Clean up and reprocess orphaned items at startup
+        # Requeue downloads left in the old processing set by earlier versions
         self.handle_orphaned_processing()
 
     def handle_orphaned_processing(self):
-        """Handle videos that were left in processing state from previous runs"""
+        """Handle downloads left in the processing set by earlier versions.
+
+        Claims are now leased in worker_loop and requeued by its reaper, so
+        nothing adds to the set any more; this only drains what is left.
+        """
         try:
             # Get all videos currently marked as processing
             orphaned_videos = self.redis_client.smembers(self.PROCESSING_SET)
 
+            # Jobs still in a worker's processing list are requeued by that worker
+            held = {
+                job.get("video_id")
+                for job in held_jobs(self.redis_client, DOWNLOAD_QUEUE_KEY)
+            }
+
             if orphaned_videos:
                 logger.info(
                     f"Found {len(orphaned_videos)} orphaned downloads in processing state"
                 )
 
                 for video_id in orphaned_videos:
+                    if video_id in held:
+                        self.redis_client.srem(self.PROCESSING_SET, video_id)
+                        continue
+
                     # Find the metadata key for this video_id
-                    matching_keys = self.redis_client.keys(f"metadata:*:{video_id}")
-                    if not matching_keys:
+                    video_key = resolve_metadata_key(self.redis_client, video_id)
+                    if not video_key:
                         logger.warning(
                             f"No metadata found for orphaned download {video_id}"
                         )
@@ -65,8 +130,7 @@ class VideoDownloader:
 
                     try:
                         # Get the video data
-                        metadata_key = matching_keys[0]
-                        video_data = self.redis_client.hgetall(metadata_key)
+                        video_data = self.redis_client.hgetall(video_key)
 
                         # Remove from processing set
                         self.redis_client.srem(self.PROCESSING_SET, video_id)
@@ -86,9 +150,7 @@ class VideoDownloader:
                             logger.info(
                                 f"Requeueing orphaned download {video_id} for processing"
                             )
-                            self.redis_client.rpush(
-                                DOWNLOAD_QUEUE_KEY, json.dumps(video_data)
-                            )
+                            enqueue(self.redis_client, DOWNLOAD_QUEUE_KEY, video_data)
 
                     except Exception as e:
                         logger.error(
@@ -99,125 +161,44 @@ class VideoDownloader:
         except Exception as e:
             logger.error(f"Error handling orphaned processing downloads: {e}")
 
-    def parse_date_string(self, date_str: str) -> float:
-        """Extract timestamp from date string like 'The Cheese Knees·2022-12-13'"""
-        try:
-            if "·" in date_str:
-                date_str = date_str.split("·")[1].strip()
-            return datetime.strptime(date_str, "%Y-%m-%d").timestamp()
-        except Exception as e:
-            logger.error(f"Error parsing date '{date_str}', using current time: {e}")
-            # Return current timestamp instead of 0
-            return time.time()
-
-    def generate_thumbnail(self, video_path: Path) -> str:
-        """Generate a thumbnail from a video file."""
-        thumbnail_path = video_path.parent / f"{video_path.stem}_thumb.jpg"
-
-        try:
-            video = cv2.VideoCapture(str(video_path))
-            success, frame = video.read()
-
-            if success:
-                frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                pil_image = Image.fromarray(frame_rgb)
-
-                # Set fixed dimensions for TikTok aspect ratio
-                width = 320
-                height = 568
-
-                # Resize image maintaining aspect ratio and adding black bars
-                original_ratio = pil_image.size[0] / pil_image.size[1]
-                target_ratio = width / height
-
-                if original_ratio > target_ratio:
-                    new_width = width
-                    new_height = int(width / original_ratio)
-                    resize_size = (new_width, new_height)
-                    position = (0, (height - new_height) // 2)
-                else:
-                    new_height = height
-                    new_width = int(height * original_ratio)
-                    resize_size = (new_width, new_height)
-                    position = ((width - new_width) // 2, 0)
-
-                # Create black background
-                background = Image.new("RGB", (width, height), (0, 0, 0))
-
-                # Resize image
-                pil_image = pil_image.resize(resize_size, Image.Resampling.LANCZOS)
-
-                # Paste resized image onto black background
-                background.paste(pil_image, position)
-
-                # Save thumbnail
-                background.save(thumbnail_path, "JPEG", quality=85)
-                return str(thumbnail_path.relative_to(self.downloads_dir))
-
-        except Exception as e:
-            logger.error(f"Error generating thumbnail for {video_path}: {e}")
-            return None
-        finally:
-            if "video" in locals():
-                video.release()
-
     def update_video_paths(
         self, username: str, video_id: str, video_path: str, thumbnail_path: str
     ):
         """Update video and thumbnail paths in Redis."""
-        redis_key = f"metadata:{username}:{video_id}"
-        self.redis_client.hset(redis_key, "video_path", video_path)
-        self.redis_client.hset(redis_key, "thumbnail_path", thumbnail_path)
-        download_time = time.strftime("%Y-%m-%d %H:%M:%S")
-        self.redis_client.hset(redis_key, "download_time", download_time)
-
-        # Add username to all_usernames set
-        self.redis_client.sadd("all_usernames", username)
-
-        # Update the sorted set with download time if no valid date exists
-        video_data = self.redis_client.hgetall(redis_key)
-
-        # Use date field as primary source
-        timestamp = None
-        if "date" in video_data:
-            timestamp = self.parse_date_string(video_data["date"])
-
-        if not timestamp and "author" in video_data:
-            timestamp = self.parse_date_string(video_data["author"])
-
-        # Fallback to scrape_time only if date is missing
-        if not timestamp and "scrape_time" in video_data:
-            try:
-                timestamp = datetime.strptime(
-                    video_data["scrape_time"], "%Y-%m-%d %H:%M:%S"
-                ).timestamp()
-            except:
-                pass
-
-        # Last resort: current time
-        if not timestamp:
-            timestamp = time.time()
-
-        self.redis_client.zadd("videos_by_date", {video_id: timestamp})
-        # if not video_data.get("date"):
-        #     self.redis_client.zadd("videos_by_date", {video_id: time.time()})
-        # else:
-        #     # Ensure the video is in the sorted set with its proper date
-        #     timestamp = self.parse_date_string(video_data["date"])
-        #     self.redis_client.zadd("videos_by_date", {video_id: timestamp})
-
-        # Remove file_missing flag when video is successfully downloaded
-        self.redis_client.hdel(redis_key, "file_missing")
+        update_video_paths(
+            self.redis_client, username, video_id, video_path, thumbnail_path
+        )
+
+    def record_download(self, username: str, video_id: str, video_path: Path):
+        """Store a downloaded video's paths and queue its thumbnail."""
+        relative_path = str(video_path.relative_to(self.downloads_dir))
+        self.update_video_paths(
+            username,
+            video_id,
+            relative_path,
+            str(thumbnail_path_for(video_path).relative_to(self.downloads_dir)),
+        )
+        enqueue_thumbnail(self.redis_client, username, video_id, relative_path)
 
     def delete_video(self, video_id: str):
         """Mark video as deleted and remove from sorted sets."""
         try:
             # Mark as deleted in metadata
-            redis_key = f"metadata:{video_id}"
+            redis_key = resolve_metadata_key(self.redis_client, video_id)
+            if not redis_key:
+                logger.warning(f"No metadata found for video {video_id}")
+                return
             self.redis_client.hset(redis_key, "deleted", "True")
+            set_video_deleted(
+                self.redis_client,
+                video_id,
+                parse_tags(self.redis_client.hget(redis_key, "tags")),
+            )
+            record_metadata_change(self.redis_client, video_id)
 
-            # Remove from sorted set
-            self.redis_client.zrem("videos_by_date", video_id)
+            # Remove from the global and per-user sorted sets
+            username, _ = parse_metadata_key(redis_key)
+            remove_from_date_index(self.redis_client, username, video_id)
 
             logger.info(
                 f"Marked video {video_id} as deleted and removed from sorted sets"
@@ -237,35 +218,15 @@ class VideoDownloader:
         video_filename = f"{video_id}.mp4"
         video_path = folder_path / video_filename
 
-        # If video exists, check/generate thumbnail
+        # If video exists, queue its thumbnail if it is still missing
         if video_path.exists():
             logger.info(f"Video already exists: {video_path}")
-            thumbnail_path = video_path.parent / f"{video_path.stem}_thumb.jpg"
-
-            if not thumbnail_path.exists():
-                logger.info(f"Generating missing thumbnail for video: {video_id}")
-                thumbnail_path = self.generate_thumbnail(video_path)
-                if thumbnail_path:
-                    # Update video paths in Redis
-                    self.update_video_paths(
-                        username,
-                        video_id,
-                        str(video_path.relative_to(self.downloads_dir)),
-                        thumbnail_path,
-                    )
-                    logger.info(
-                        f"Successfully generated thumbnail for existing video: {video_id}"
-                    )
-                else:
-                    logger.error(
-                        f"Failed to generate thumbnail for existing video: {video_id}"
-                    )
+            if not thumbnails_complete(video_path):
+                logger.info(f"Queueing missing thumbnail for video: {video_id}")
+                self.record_download(username, video_id, video_path)
             return
 
         try:
-            # Mark as processing
-            self.redis_client.sadd(self.PROCESSING_SET, video_id)
-
             ydl_opts = {
                 "outtmpl": str(video_path),
                 "format": "best",
@@ -276,23 +237,10 @@ class VideoDownloader:
             with YoutubeDL(ydl_opts) as ydl:
                 ydl.download([url])
 
-            # Generate thumbnail
+            # Record the download; the thumbnail worker renders the thumbnail
             if video_path.exists():
-                thumbnail_path = self.generate_thumbnail(video_path)
-                if thumbnail_path:
-                    # Update video paths in Redis
-                    self.update_video_paths(
-                        username,
-                        video_id,
-                        str(video_path.relative_to(self.downloads_dir)),
-                        thumbnail_path,
-                    )
-                    logger.info(f"Successfully processed video: {video_id}")
-                else:
-                    logger.error(f"Failed to generate thumbnail for video: {video_id}")
-
-            # Remove from processing on success
-            self.redis_client.srem(self.PROCESSING_SET, video_id)
+                self.record_download(username, video_id, video_path)
+                logger.info(f"Successfully processed video: {video_id}")
 
         except Exception as e:
             logger.error(f"Error downloading video {video_id}: {e}")
@@ -305,7 +253,7 @@ class VideoDownloader:
                 logger.info(
                     f"Requeueing video {video_id} for retry {retry_count}/{self.max_retries}"
                 )
-                self.redis_client.rpush(DOWNLOAD_QUEUE_KEY, json.dumps(video_data))
+                enqueue(self.redis_client, DOWNLOAD_QUEUE_KEY, video_data)
             else:
                 # Move to failed queue
                 logger.error(
@@ -313,28 +261,21 @@ class VideoDownloader:
                 )
                 self.redis_client.rpush(self.FAILED_QUEUE, json.dumps(video_data))
 
-            # Remove from processing set
-            self.redis_client.srem(self.PROCESSING_SET, video_id)
-
     def run(self):
         """Main service loop."""
         logger.info("Video Downloader Service started")
-
-        while True:
-            try:
-                # Get next video from queue
-                video_data = redis_client.lpop(DOWNLOAD_QUEUE_KEY)
-                if video_data:
-                    video_data = json.loads(video_data)
-                    logger.info(f"Downloading video: {video_data.get('video_id')}")
-                    self.download_video(video_data)
-                else:
-                    # No videos in queue, wait before checking again
-                    time.sleep(5)
-
-            except Exception as e:
-                logger.error(f"Error in main loop: {e}")
-                time.sleep(5)
+        QueueWorker(
+            self.redis_client,
+            DOWNLOAD_QUEUE_KEY,
+            "downloader",
+            self.handle_job,
+            max_job_seconds=DOWNLOAD_JOB_TIMEOUT,
+        ).run()
+
+    def handle_job(self, video_data: Dict):
+        """Download one queued video."""
+        logger.info(f"Downloading video: {video_data.get('video_id')}")
+        self.download_video(video_data)
 
 
 if __name__ == "__main__":
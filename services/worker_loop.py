@@ -0,0 +1,354 @@
+"""Reliable, blocking queue consumption shared by the pipeline workers.
+
+Workers take jobs with BLMOVE, which waits on the server until a job
+arrives and atomically moves it to a processing list owned by the claim
+holder (``{queue}:processing:{worker_id}:{name}``), holding at most one job.
+``worker_id`` is WORKER_ID from the environment, or the hostname if unset.
+Each holder has a lease: its deadline in the ``{queue}:leases`` sorted set.
+The lease is set before the BLMOVE, so a moved job is never without one,
+and a heartbeat thread extends it while the job runs, up to the job's time
+limit. The heartbeat also reaps: any holder whose deadline has passed, on
+any node, has its job moved back to the front of the queue. A job that outlives its lease may therefore run twice, so
+handlers must be safe to repeat.
+
+Jobs queued with enqueue() carry a ``queued_at`` stamp, and the time from
+then until pickup is summed per queue in ``queue_pickup:{queue}``.
+Requeued jobs are stamped again, so time spent held by a dead worker is
+not counted as waiting.
+"""
+
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger("worker_loop")
+
+# Identifies this process's claims across restarts. Set it per service in
+# containers, whose hostname changes when they are recreated.
+WORKER_ID = os.getenv("WORKER_ID") or socket.gethostname()
+
+# How long one BLMOVE blocks before the loop checks for a stop request
+BLOCK_TIMEOUT = 5
+
+# A claim is requeued this many seconds after its last heartbeat
+LEASE_TIMEOUT = int(os.getenv("LEASE_TIMEOUT", "60"))
+HEARTBEAT_INTERVAL = LEASE_TIMEOUT / 3
+
+# Expired holders handled per reap
+REAP_BATCH = 100
+
+# Moves a holder's job back to the front of the queue with a fresh queued_at,
+# so pickup latency counts only the wait since the requeue. With ARGV[2] set,
+# only if the holder's lease has expired and was not renewed since it was
+# found expired. A job that isn't a JSON object is requeued as it is.
+# KEYS: leases, holder, queue. ARGV: now, expired only (1 or 0).
+REQUEUE_SCRIPT = """
+if ARGV[2] == '1' then
+    local deadline = redis.call('ZSCORE', KEYS[1], KEYS[2])
+    if not deadline or tonumber(deadline) > tonumber(ARGV[1]) then
+        return 0
+    end
+end
+local requeued = 0
+local raw_job = redis.call('RPOP', KEYS[2])
+while raw_job do
+    local ok, job = pcall(cjson.decode, raw_job)
+    if ok and type(job) == 'table' then
+        job['queued_at'] = tonumber(ARGV[1])
+        raw_job = cjson.encode(job)
+    end
+    redis.call('LPUSH', KEYS[3], raw_job)
+    requeued = requeued + 1
+    raw_job = redis.call('RPOP', KEYS[2])
+end
+redis.call('ZREM', KEYS[1], KEYS[2])
+return requeued
+"""
+
+
+def processing_list_key(queue: str, worker_name: str) -> str:
+    """Build the key of the list holding a worker's current job."""
+    return f"{queue}:processing:{WORKER_ID}:{worker_name}"
+
+
+def leases_key(queue: str) -> str:
+    """Build the key of the sorted set of claim deadlines for a queue."""
+    return f"{queue}:leases"
+
+
+def pickup_stats_key(queue: str) -> str:
+    """Build the key of the hash summing a queue's pickup latency."""
+    return f"queue_pickup:{queue}"
+
+
+def held_raw_jobs(redis_client, queue: str) -> List[str]:
+    """Return the jobs, as queued, in any worker's processing list for a queue."""
+    raw_jobs = []
+    for key in redis_client.scan_iter(f"{queue}:processing:*"):
+        raw_jobs.extend(redis_client.lrange(key, 0, -1))
+    return raw_jobs
+
+
+def held_jobs(redis_client, queue: str) -> List[Dict]:
+    """Return the jobs sitting in any worker's processing list for a queue.
+
+    Those are requeued by their worker on restart or by the lease reaper, so
+    other cleanup should leave them alone.
+    """
+    jobs = []
+    for raw_job in held_raw_jobs(redis_client, queue):
+        try:
+            jobs.append(json.loads(raw_job))
+        except json.JSONDecodeError:
+            continue
+    return jobs
+
+
+def enqueue(redis_client, queue: str, job: Dict):
+    """Append a job to a queue, stamped with when it was queued."""
+    job["queued_at"] = time.time()
+    redis_client.rpush(queue, json.dumps(job))
+
+
+def record_pickup(redis_client, queue: str, job: Dict) -> float:
+    """Add a picked-up job's wait to the queue's stats and drop its stamp.
+
+    Returns:
+        float: Seconds the job waited, or 0 if it wasn't stamped
+    """
+    queued_at = job.pop("queued_at", None)
+    if queued_at is None:
+        return 0.0
+
+    latency = max(time.time() - float(queued_at), 0.0)
+    pipe = redis_client.pipeline()
+    pipe.hincrby(pickup_stats_key(queue), "pickups", 1)
+    pipe.hincrby(pickup_stats_key(queue), "latency_ms", round(latency * 1000))
+    pipe.hset(pickup_stats_key(queue), "last_latency_ms", round(latency * 1000))
+    pipe.execute()
+    return latency
+
+
+def pickup_stats(redis_client, queue: str) -> Dict:
+    """Average and last queue-to-pickup latency for a queue."""
+    stats = redis_client.hgetall(pickup_stats_key(queue))
+    pickups = int(stats.get("pickups", 0))
+    return {
+        "pickups": pickups,
+        "avg_latency_ms": (
+            round(int(stats.get("latency_ms", 0)) / pickups) if pickups else 0
+        ),
+        "last_latency_ms": int(stats.get("last_latency_ms", 0)),
+    }
+
+
+class LeaseQueue:
+    def __init__(self, redis_client, queue: str, lease_timeout: int = None):
+        """Claims on ``queue`` that expire unless renewed.
+
+        ``redis_client`` must decode responses.
+        """
+        self.redis_client = redis_client
+        self.queue = queue
+        self.leases = leases_key(queue)
+        self.lease_timeout = lease_timeout or LEASE_TIMEOUT
+        self.requeue_script = redis_client.register_script(REQUEUE_SCRIPT)
+
+    def holder(self, name: str) -> str:
+        """Return the processing list for a named claim holder of this worker."""
+        return processing_list_key(self.queue, name)
+
+    def renew(self, holder: str, create: bool = False) -> bool:
+        """Push a holder's deadline out by lease_timeout.
+
+        Returns:
+            bool: False if the lease had already been reaped
+        """
+        deadline = time.time() + self.lease_timeout
+        if create:
+            self.redis_client.zadd(self.leases, {holder: deadline})
+            return True
+        return bool(
+            self.redis_client.zadd(self.leases, {holder: deadline}, xx=True, ch=True)
+        )
+
+    def claim(self, holder: str, timeout: float = BLOCK_TIMEOUT) -> Optional[str]:
+        """Wait up to ``timeout`` seconds for a job and lease it to ``holder``.
+
+        Returns:
+            str: The job as queued, or None if none arrived
+        """
+        self.renew(holder, create=True)
+        raw_job = self.redis_client.blmove(self.queue, holder, timeout, "LEFT", "RIGHT")
+        if raw_job is None:
+            self.redis_client.zrem(self.leases, holder)
+        return raw_job
+
+    def ack(self, holder: str, raw_job: str) -> bool:
+        """Finish a claimed job and drop its lease.
+
+        Returns:
+            bool: False if the lease had expired and the job was requeued
+        """
+        pipe = self.redis_client.pipeline()
+        pipe.lrem(holder, 1, raw_job)
+        pipe.zrem(self.leases, holder)
+        removed, _ = pipe.execute()
+        return bool(removed)
+
+    def recover(self, holder: str) -> int:
+        """Requeue a holder's job at once, e.g. when its worker restarts.
+
+        Returns:
+            int: Number of jobs requeued
+        """
+        return self.requeue_script(
+            keys=[self.leases, holder, self.queue], args=[time.time(), 0]
+        )
+
+    def reap(self) -> int:
+        """Requeue the jobs of every holder whose lease has expired.
+
+        Each holder is reaped in its own script call with all its keys
+        declared. On Redis Cluster, give the queue name a hash tag (e.g.
+        ``{thumbnail_queue}``) so the queue, its leases and processing lists
+        share a slot, as BLMOVE needs too.
+
+        Returns:
+            int: Number of jobs requeued
+        """
+        now = time.time()
+        expired = self.redis_client.zrangebyscore(
+            self.leases, "-inf", now, start=0, num=REAP_BATCH
+        )
+        return sum(
+            self.requeue_script(keys=[self.leases, holder, self.queue], args=[now, 1])
+            for holder in expired
+        )
+
+
+class Heartbeat(threading.Thread):
+    def __init__(self, lease_queue: LeaseQueue, max_job_seconds: float):
+        """Renew the leases of running jobs and reap expired ones.
+
+        A job running longer than ``max_job_seconds`` is treated as hung:
+        its lease is no longer renewed, so it expires and the job is
+        requeued.
+        """
+        super().__init__(name=f"heartbeat-{lease_queue.queue}", daemon=True)
+        self.lease_queue = lease_queue
+        self.max_job_seconds = max_job_seconds
+        self.running = {}
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+
+    def started(self, holder: str):
+        with self.lock:
+            self.running[holder] = time.time()
+
+    def finished(self, holder: str):
+        with self.lock:
+            self.running.pop(holder, None)
+
+    def beat(self):
+        """Renew or give up each running job's lease, then reap."""
+        now = time.time()
+        with self.lock:
+            running = list(self.running.items())
+
+        for holder, started in running:
+            if now - started > self.max_job_seconds:
+                logger.warning(
+                    f"{holder}: job running for {now - started:.0f}s, "
+                    "letting its lease expire"
+                )
+                self.finished(holder)
+            elif not self.lease_queue.renew(holder):
+                logger.warning(f"{holder}: lease was lost, job was requeued")
+
+        requeued = self.lease_queue.reap()
+        if requeued:
+            logger.info(
+                f"Requeued {requeued} jobs with expired leases on "
+                f"{self.lease_queue.queue}"
+            )
+
+    def run(self):
+        while not self.stopped.wait(HEARTBEAT_INTERVAL):
+            try:
+                self.beat()
+            except Exception as e:
+                logger.error(f"Error renewing leases on {self.lease_queue.queue}: {e}")
+
+    def stop(self):
+        self.stopped.set()
+
+
+class QueueWorker:
+    def __init__(
+        self,
+        redis_client,
+        queue: str,
+        name: str,
+        handle: Callable[[Dict], None],
+        stopping: threading.Event = None,
+        max_job_seconds: float = 600,
+    ):
+        """Feed jobs from ``queue`` to ``handle`` one at a time.
+
+        ``redis_client`` must decode responses. ``name`` tells apart the
+        workers sharing a WORKER_ID. A worker started again with the same
+        WORKER_ID and name requeues the job it held at once; otherwise the
+        job waits for its lease to expire.
+        """
+        self.redis_client = redis_client
+        self.queue = queue
+        self.name = name
+        self.handle = handle
+        self.stopping = stopping or threading.Event()
+        self.lease_queue = LeaseQueue(redis_client, queue)
+        self.holder = self.lease_queue.holder(name)
+        self.heartbeat = Heartbeat(self.lease_queue, max_job_seconds)
+
+    def run(self):
+        """Handle jobs until ``stopping`` is set."""
+        requeued = self.lease_queue.recover(self.holder)
+        if requeued:
+            logger.info(f"{self.name}: requeued {requeued} unfinished jobs")
+        self.heartbeat.start()
+
+        try:
+            while not self.stopping.is_set():
+                try:
+                    self.handle_next()
+                except Exception as e:
+                    logger.error(f"{self.name}: error in worker loop: {e}")
+                    self.stopping.wait(BLOCK_TIMEOUT)
+        finally:
+            self.heartbeat.stop()
+
+    def handle_next(self):
+        """Claim one job, if one arrives in time, and handle it."""
+        raw_job = self.lease_queue.claim(self.holder)
+        if raw_job is None:
+            return
+
+        self.heartbeat.started(self.holder)
+        try:
+            job = json.loads(raw_job)
+            latency = record_pickup(self.redis_client, self.queue, job)
+            logger.debug(f"{self.name}: picked up job after {latency * 1000:.0f} ms")
+            self.handle(job)
+        except json.JSONDecodeError:
+            logger.error(f"{self.name}: dropping malformed job {raw_job!r}")
+        finally:
+            self.heartbeat.finished(self.holder)
+            if not self.lease_queue.ack(self.holder, raw_job):
+                logger.warning(
+                    f"{self.name}: finished a job after its lease expired; "
+                    "it was requeued and may run again"
+                )
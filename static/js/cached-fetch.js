@@ -0,0 +1,33 @@
+// Conditional GETs for the JSON list endpoints. Responses carry an ETag
+// derived from the catalog version, so a repeated request sends
+// If-None-Match and reuses the body we already have when the server answers
+// 304 Not Modified.
+window._jsonCache = window._jsonCache || new Map();
+const JSON_CACHE_LIMIT = 200;
+
+function fetchJSON(url) {
+    const cached = window._jsonCache.get(url);
+    const headers = cached ? { 'If-None-Match': cached.etag } : {};
+
+    // Bypass the browser's HTTP cache so the 304 reaches us
+    return fetch(url, { headers, cache: 'no-store' }).then(response => {
+        if (response.status === 304 && cached) {
+            // Move to the end so the least recently used entry is evicted first
+            window._jsonCache.delete(url);
+            window._jsonCache.set(url, cached);
+            return cached.data;
+        }
+
+        return response.json().then(data => {
+            const etag = response.headers.get('ETag');
+            if (response.ok && etag) {
+                window._jsonCache.delete(url);
+                window._jsonCache.set(url, { etag, data });
+                if (window._jsonCache.size > JSON_CACHE_LIMIT) {
+                    window._jsonCache.delete(window._jsonCache.keys().next().value);
+                }
+            }
+            return data;
+        });
+    });
+}
@@ -0,0 +1,102 @@
+// Give up on a thumbnail that is still being generated after this many checks
+const THUMBNAIL_RETRY_LIMIT = 30;
+
+// Intrinsic size of the SVG placeholder /thumbnail serves while the image is
+// being generated (THUMBNAIL_PLACEHOLDER in app.py)
+const THUMBNAIL_PLACEHOLDER_WIDTH = 9;
+const THUMBNAIL_PLACEHOLDER_HEIGHT = 16;
+
+function isThumbnailPlaceholder(img) {
+    return img.naturalWidth === THUMBNAIL_PLACEHOLDER_WIDTH
+        && img.naturalHeight === THUMBNAIL_PLACEHOLDER_HEIGHT;
+}
+
+// Extra <img> attributes for a video card's thumbnail: the WebP variants as a
+// srcset, and the embedded low-quality preview as the background until the
+// real image has loaded. Without variants the thumbnail may not exist yet, in
+// which case /thumbnail answers 202 with a placeholder and the card checks back.
+function thumbnailAttributes(video) {
+    const attributes = [];
+    if (video.thumbnail_srcset) {
+        attributes.push(`srcset="${video.thumbnail_srcset}"`);
+        attributes.push('sizes="320px"');
+    } else {
+        attributes.push('onload="retryPendingThumbnail(this)"');
+    }
+    if (video.thumbnail_lqip) {
+        attributes.push(`style="background: url('${video.thumbnail_lqip}') center / cover no-repeat"`);
+    }
+    return attributes.join(' ');
+}
+
+// Reload a thumbnail once the worker has rendered it. An <img> can't see the
+// status it was served with, so ask again with HEAD and wait as long as the
+// 202's Retry-After says before each further check. Finished images are left
+// alone, so only placeholders cost a request.
+function retryPendingThumbnail(img, attempt = 0) {
+    if (attempt === 0 && !isThumbnailPlaceholder(img)) {
+        return;
+    }
+    const url = img.getAttribute('src').split('?')[0];
+    fetch(url, { method: 'HEAD', cache: 'no-store' })
+        .then(response => {
+            if (response.status === 202) {
+                if (attempt < THUMBNAIL_RETRY_LIMIT) {
+                    const seconds = parseInt(response.headers.get('Retry-After'), 10) || 2;
+                    setTimeout(() => retryPendingThumbnail(img, attempt + 1), seconds * 1000);
+                }
+            } else if (response.ok && attempt > 0) {
+                // The placeholder wasn't cached, but the same src won't reload
+                img.onload = null;
+                img.src = `${url}?ready=${Date.now()}`;
+            }
+        })
+        .catch(() => {});
+}
+
+// Hover previews for a card's thumbnail container. Moving the pointer across
+// it scrubs through the sprite sheet; resting on it plays the preview loop.
+// Both are small images, so nothing is streamed from /video.
+function setupPreviewScrub(container, video) {
+    if (!container || !video.preview_sprite || !video.preview_frames) {
+        return;
+    }
+
+    const frames = video.preview_frames;
+    const overlay = document.createElement('div');
+    overlay.className = 'preview-scrub';
+    container.appendChild(overlay);
+    let loopTimer = null;
+
+    const showLoop = () => {
+        overlay.style.backgroundImage = `url('${video.preview_loop}')`;
+        overlay.style.backgroundSize = 'cover';
+        overlay.style.backgroundPosition = 'center';
+    };
+
+    container.addEventListener('mousemove', event => {
+        // Leave the player alone once the video itself is playing
+        if (container.querySelector('video')) {
+            return;
+        }
+
+        const rect = container.getBoundingClientRect();
+        const share = (event.clientX - rect.left) / rect.width;
+        const index = Math.min(frames - 1, Math.max(0, Math.floor(share * frames)));
+        overlay.style.display = 'block';
+        overlay.style.backgroundImage = `url('${video.preview_sprite}')`;
+        overlay.style.backgroundSize = `${frames * 100}% 100%`;
+        overlay.style.backgroundPosition =
+            frames > 1 ? `${(index / (frames - 1)) * 100}% 0` : '0 0';
+
+        clearTimeout(loopTimer);
+        if (video.preview_loop) {
+            loopTimer = setTimeout(showLoop, 800);
+        }
+    });
+
+    container.addEventListener('mouseleave', () => {
+        clearTimeout(loopTimer);
+        overlay.style.display = 'none';
+    });
+}
@@ -14,8 +14,7 @@ class UsernameManager {
 
     async loadUsernames() {
         try {
-            const response = await fetch('/api/usernames');
-            const data = await response.json();
+            const data = await fetchJSON('/api/usernames');
             if (data.success) {
                 this.renderUsernames(data.usernames);
             } else {
@@ -14,6 +14,7 @@ function initializeApp() {
 
     // Initialize global variables
     window.currentPage = -1;
+    window.nextCursor = null;
     window.filteredVideos = [];
     window.selectedFilters = new Set();
     window.hasMoreVideos = true;
@@ -77,6 +78,7 @@ function setupFilterHandlers() {
 
 function resetAndFilterVideos() {
     window.currentPage = -1;
+    window.nextCursor = null;
     window.filteredVideos = [];
     window.hasMoreVideos = true;
 
@@ -132,11 +134,16 @@ function loadMoreVideos() {
     window.isLoading = true;
     console.log('Loading page:', nextPage);
 
-    // Build query parameters including filters
+    // Build query parameters including filters. After the first page the
+    // server's cursor is used, so deletes don't shift later pages.
     const params = new URLSearchParams({
-        page: nextPage,
         per_page: window.videosPerPage || 20
     });
+    if (window.nextCursor) {
+        params.append('cursor', window.nextCursor);
+    } else {
+        params.append('page', nextPage);
+    }
 
     // Add filters and filter type if any are selected
     if (window.selectedFilters && window.selectedFilters.size > 0) {
@@ -158,8 +165,7 @@ function loadMoreVideos() {
     console.log('Fetching videos with URL:', url); // Debug log
 
     // Fetch the next page of videos with filters
-    fetch(url)
-        .then(response => response.json())
+    fetchJSON(url)
         .then(data => {
             console.log('Received data:', data);
             if (data.videos && data.videos.length > 0) {
@@ -167,6 +173,7 @@ function loadMoreVideos() {
                 window.filteredVideos = window.filteredVideos.concat(data.videos);
                 displayVideos(data.videos);
                 window.hasMoreVideos = data.has_more;
+                window.nextCursor = data.next_cursor || null;
                 console.log('Loaded page', nextPage, 'with', data.videos.length, 'videos');
             } else {
                 window.hasMoreVideos = false;
@@ -208,8 +215,7 @@ function handleFilterInput(event) {
     }
 
     window.tagSearchTimeout = setTimeout(() => {
-        fetch(`/api/tags/search?q=${encodeURIComponent(input)}`)
-            .then(response => response.json())
+        fetchJSON(`/api/tags/search?q=${encodeURIComponent(input)}`)
             .then(data => {
                 if (data.tags && data.tags.length > 0) {
                     suggestions.innerHTML = data.tags
@@ -348,7 +354,9 @@ function createVideoCard(video) {
         <div class="video-thumbnail-container">
             ${video.has_thumbnail ?
                 `<img src="/thumbnail/${video.thumbnail_path}"
+                      ${thumbnailAttributes(video)}
                       class="video-thumbnail"
+                      loading="lazy"
                       onclick="playVideo(this, '${video.video_path}')"
                       alt="Video thumbnail">` :
                 `<div class="thumbnail-loading">
@@ -379,6 +387,9 @@ function createVideoCard(video) {
         </div>
     `;
 
+    // Scrub through the sprite sheet on hover
+    setupPreviewScrub(videoContent.querySelector('.video-thumbnail-container'), video);
+
     // Add click handler for selection
     card.addEventListener('click', handleVideoCardClick);
 
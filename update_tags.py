@@ -2,8 +2,7 @@ import os
 import json
 from pathlib import Path
 from tqdm import tqdm
-import cv2
-from PIL import Image
+from services.thumbnails import render_thumbnails, thumbnail_path_for
 
 
 def extract_tags_from_description(description):
@@ -31,57 +30,12 @@ def extract_tags_from_description(description):
 
 
 def generate_thumbnail(video_path):
-    """Generate a thumbnail from a video file."""
-    thumbnail_path = video_path.parent / f"{video_path.stem}_thumb.jpg"
-
+    """Generate the thumbnail and its WebP variants from a video file."""
     try:
-        # Open the video file
-        video = cv2.VideoCapture(str(video_path))
-        success, frame = video.read()
-
-        if success:
-            # Convert from BGR to RGB
-            frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            pil_image = Image.fromarray(frame_rgb)
-
-            # Set fixed dimensions for TikTok aspect ratio
-            width = 320
-            height = 568
-
-            # Resize image maintaining aspect ratio and adding black bars
-            original_ratio = pil_image.size[0] / pil_image.size[1]
-            target_ratio = width / height
-
-            if original_ratio > target_ratio:
-                new_width = width
-                new_height = int(width / original_ratio)
-                resize_size = (new_width, new_height)
-                position = (0, (height - new_height) // 2)
-            else:
-                new_height = height
-                new_width = int(height * original_ratio)
-                resize_size = (new_width, new_height)
-                position = ((width - new_width) // 2, 0)
-
-            # Create black background
-            background = Image.new("RGB", (width, height), (0, 0, 0))
-
-            # Resize image
-            pil_image = pil_image.resize(resize_size, Image.Resampling.LANCZOS)
-
-            # Paste resized image onto black background
-            background.paste(pil_image, position)
-
-            # Save thumbnail
-            background.save(thumbnail_path, "JPEG", quality=85)
-            return str(thumbnail_path.relative_to(video_path.parent))
-
+        if render_thumbnails(video_path):
+            return str(thumbnail_path_for(video_path).relative_to(video_path.parent))
     except Exception as e:
         print(f"Error generating thumbnail for {video_path}: {str(e)}")
-        return None
-    finally:
-        if "video" in locals():
-            video.release()
 
 
 def process_metadata_files():